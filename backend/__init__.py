@@ -0,0 +1 @@
+"""Supporting modules for the Flask API in postgress_connector.py."""
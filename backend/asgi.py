@@ -0,0 +1,184 @@
+import re
+import gzip
+import json
+import time
+import asyncio
+import logging
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+
+from backend.db import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 500
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """One request of ThreadedWsgiToAsgi, run on its executor."""
+
+    def __init__(self, wsgi_app, executor):
+        super().__init__(wsgi_app)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        # The undecorated method, so it runs on the executor instead of the shared thread
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class ThreadedWsgiToAsgi:
+    """
+    Serves a WSGI app under ASGI with each request on a thread of its own executor.
+
+    asgiref's WsgiToAsgi runs the app with sync_to_async's default thread_sensitive=True,
+    which puts every request on one shared thread, so the Flask routes would be served one
+    at a time per worker. Here up to `threads` requests run at once, like under a threaded
+    WSGI server.
+    """
+
+    def __init__(self, wsgi_app, threads=32):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_app, self.executor)(scope, receive, send)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsgiApp:
+    """
+    ASGI application for the async serving mode.
+
+    Routes in `routes` are served natively on the event loop and use the async database
+    pool, so a slow query only holds a coroutine, not a thread. Each of these requests is
+    cancelled, together with its queries, when the client disconnects, and is recorded in
+    the request metrics under its route name like the Flask routes are. Every other
+    request is passed on to the Flask app, on a pool of wsgi_threads threads.
+
+    :param wsgi_app: The Flask app.
+    :param db: backend.async_db.AsyncDatabase, closed on shutdown.
+    :param metrics: backend.metrics.Metrics for the native routes, or None.
+    """
+
+    def __init__(self, wsgi_app, db, metrics=None, wsgi_threads=32):
+        self.db = db
+        self.metrics = metrics
+        self.fallback = ThreadedWsgiToAsgi(wsgi_app, wsgi_threads)
+        self.routes = []
+
+    def route(self, pattern, name=None):
+        """
+        Registers a native GET handler. Named groups in the pattern are passed as arguments.
+
+        :param name: Route label in the metrics, e.g. "/get_plandata/<address>". Defaults to the pattern.
+        """
+        def decorator(handler):
+            self.routes.append((re.compile(f"^{pattern}$"), handler, name or pattern))
+            return handler
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            for pattern, handler, name in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    await self._serve(handler, name, match.groupdict(), scope, receive, send)
+                    return
+        await self.fallback(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.fallback.close()
+                await self.db.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _serve(self, handler, name, arguments, scope, receive, send):
+        started = time.perf_counter()
+        task = asyncio.ensure_future(handler(**arguments))
+        watcher = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Also covers the server cancelling this request
+            for pending in (task, watcher):
+                if not pending.done():
+                    pending.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await pending
+        if not task.done() or task.cancelled():
+            logger.info(f"Client disconnected, cancelled {scope['path']}")
+            return
+
+        try:
+            status, body, content_type = task.result()
+        except ValueError as e:
+            status, body, content_type = 400, error_body(str(e)), 'application/json'
+        except DatabaseUnavailable as e:
+            logger.error(f"Database unavailable: {e}")
+            status, body, content_type = 503, error_body('Database not available'), 'application/json'
+        except Exception as e:
+            logger.error(f"Error serving {scope['path']}: {e}")
+            status, body, content_type = 500, error_body('An error occurred while querying the database.'), 'application/json'
+        size = await send_response(scope, send, status, body, content_type)
+        if self.metrics is not None:
+            self.metrics.observe_request(name, scope['method'], status, time.perf_counter() - started, size)
+
+
+def error_body(message):
+    return json.dumps({'status': 'error', 'message': message})
+
+
+async def send_response(scope, send, status, body, content_type):
+    """:return: Size of the body sent, after compression."""
+    body = body.encode('utf-8') if isinstance(body, str) else body
+    headers = [(b'content-type', content_type.encode()), (b'vary', b'Accept-Encoding')]
+    accept_encoding = dict(scope.get('headers', [])).get(b'accept-encoding', b'')
+    if len(body) >= MIN_COMPRESS_SIZE and b'gzip' in accept_encoding:
+        body = gzip.compress(body, 6)
+        headers.append((b'content-encoding', b'gzip'))
+    headers.append((b'content-length', str(len(body)).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+    return len(body)
+
+
+def create_app(wsgi_app, db, plandata, metrics=None, wsgi_threads=32):
+    """
+    Builds the ASGI app with the async routes.
+
+    :param wsgi_app: The Flask app, serving every other route.
+    :param db: backend.async_db.AsyncDatabase.
+    :param plandata: backend.plandata.AsyncPlandataLookup.
+    :param metrics: The Flask app's backend.metrics.Metrics, so both kinds of route are in one registry.
+    :param wsgi_threads: Flask requests served at once.
+    """
+    app = AsgiApp(wsgi_app, db, metrics, wsgi_threads)
+
+    @app.route(r"/health", name="/health")
+    async def health():
+        return 200, json.dumps({'status': 'ok', 'message': 'ASGI app is running'}), 'application/json'
+
+    @app.route(r"/get_plandata/(?P<address>[^/]+)", name="/get_plandata/<address>")
+    async def get_plandata(address):
+        return 200, await plandata.get(address), 'application/json'
+
+    return app
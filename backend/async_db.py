@@ -0,0 +1,88 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from backend.db import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """
+    asyncpg pool for the ASGI app, configured from the same environment as Database.
+
+    The pool is created on first use, so the app starts even when the database is down.
+    Cancelling a task that waits for a query also cancels the query on the server.
+    """
+
+    def __init__(self, params, min_connections=1, max_connections=10, statement_timeout_ms=30000,
+                 checkout_timeout=10):
+        self.params = params
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.statement_timeout_ms = statement_timeout_ms
+        self.checkout_timeout = checkout_timeout
+        self._pool = None
+        self._lock = None
+
+    @classmethod
+    def from_env(cls):
+        params = {'database': os.getenv("VITE_DB"),
+                  'user': os.getenv("VITE_DB_USER"),
+                  'host': os.getenv("VITE_DB_HOST"),
+                  'password': os.getenv("VITE_DB_PASSWORD"),
+                  'port': int(os.getenv("VITE_DB_PORT") or 5432)}
+        return cls(params,
+                   min_connections=int(os.getenv("DB_POOL_MIN", 1)),
+                   max_connections=int(os.getenv("DB_POOL_MAX", 10)),
+                   statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000)),
+                   checkout_timeout=float(os.getenv("DB_CHECKOUT_TIMEOUT", 10)))
+
+    async def _get_pool(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None:
+                import asyncpg
+
+                try:
+                    self._pool = await asyncpg.create_pool(
+                        min_size=self.min_connections, max_size=self.max_connections,
+                        server_settings={'statement_timeout': str(self.statement_timeout_ms)},
+                        **self.params
+                    )
+                except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                    safe_params = {key: value for key, value in self.params.items() if key != 'password'}
+                    logger.error(f"Database connection error: {e}")
+                    logger.error(f"Connection params: {safe_params}")
+                    raise DatabaseUnavailable("Database not available. Please start PostgreSQL server.") from e
+            return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        """Checks out a connection for the duration of the block."""
+        pool = await self._get_pool()
+        try:
+            conn = await pool.acquire(timeout=self.checkout_timeout)
+        except asyncio.TimeoutError as e:
+            raise DatabaseUnavailable("Timed out waiting for a database connection") from e
+        except OSError as e:
+            raise DatabaseUnavailable("Database not available. Please start PostgreSQL server.") from e
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    async def fetchval(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def execute(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.execute(query, *args)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
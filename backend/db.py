@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2  # type: ignore
+from psycopg2 import pool  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when no database connection can be checked out."""
+
+
+def timed_cursor(db):
+    """
+    Cursor class that reports the duration of every statement to db.observer.
+
+    The DECLARE of a named (server-side) cursor returns at once and the rows are read by
+    later fetches, so for those the time spent in execute and in every fetch, also while
+    iterating, is added up and reported as one statement when the cursor is closed. Time
+    the caller spends between fetches isn't counted.
+    """
+    class TimedCursor(psycopg2.extensions.cursor):
+        _stream = None
+
+        def _observe(self, query, params, started):
+            if db.observer is not None:
+                try:
+                    db.observer(self, query, params, time.perf_counter() - started)
+                except Exception as e:
+                    logger.warning(f"Query observer failed: {e}")
+
+        def _timed_fetch(self, fetch, *args):
+            if self._stream is None:
+                return fetch(*args)
+            started = time.perf_counter()
+            try:
+                return fetch(*args)
+            finally:
+                self._stream[2] += time.perf_counter() - started
+
+        def execute(self, query, params=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, params)
+            finally:
+                if self.name:
+                    self._stream = [query, params, time.perf_counter() - started]
+                else:
+                    self._observe(query, params, started)
+
+        def fetchone(self):
+            return self._timed_fetch(super().fetchone)
+
+        def fetchmany(self, size=None):
+            return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+        def fetchall(self):
+            return self._timed_fetch(super().fetchall)
+
+        def __iter__(self):
+            if self._stream is None:
+                return super().__iter__()
+            return self._iter_stream()
+
+        def _iter_stream(self):
+            while rows := self.fetchmany(self.itersize):
+                yield from rows
+
+        def close(self):
+            stream, self._stream = self._stream, None
+            if stream is not None:
+                query, params, seconds = stream
+                # Reported as if it had started seconds ago
+                self._observe(query, params, time.perf_counter() - seconds)
+            super().close()
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                self._observe(sql, None, started)
+
+    return TimedCursor
+
+
+class Database:
+    """
+    Thread-safe pool of PostgreSQL connections.
+
+    Every request checks out its own connection, so concurrent requests under mod_wsgi
+    threads no longer share one cursor. Connections are committed when the block
+    succeeds and rolled back when it fails, so one failed transaction can't poison later
+    requests. Connections that have been idle for a while are checked with a ping before
+    use, and broken ones are replaced. The pool is created on first use, so the app
+    starts even when the database is down and reconnects once it comes back.
+
+    :param observer: Optional callable (cursor, query, params, seconds), called after every
+        statement run through cursor(), e.g. backend.metrics.Metrics.observe_query. Named
+        cursors are reported once, with the time of all their fetches, when they close.
+    """
+
+    def __init__(self, params, min_connections=1, max_connections=10, statement_timeout_ms=30000,
+                 checkout_timeout=10, health_check_interval=30, observer=None):
+        self.params = params
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.statement_timeout_ms = statement_timeout_ms
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.observer = observer
+        self._cursor_factory = timed_cursor(self)
+        self._pool = None
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool raises instead of waiting when it is exhausted
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._last_used = {}
+
+    @classmethod
+    def from_env(cls, **options):
+        """:param options: Override the pool settings from the environment, e.g. statement_timeout_ms=0."""
+        params = {'database': os.getenv("VITE_DB"),
+                  'user': os.getenv("VITE_DB_USER"),
+                  'host': os.getenv("VITE_DB_HOST"),
+                  'password': os.getenv("VITE_DB_PASSWORD"),
+                  'port': os.getenv("VITE_DB_PORT")}
+        settings = {'min_connections': int(os.getenv("DB_POOL_MIN", 1)),
+                    'max_connections': int(os.getenv("DB_POOL_MAX", 10)),
+                    'statement_timeout_ms': int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000)),
+                    'checkout_timeout': float(os.getenv("DB_CHECKOUT_TIMEOUT", 10))}
+        return cls(params, **{**settings, **options})
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                try:
+                    self._pool = pool.ThreadedConnectionPool(
+                        self.min_connections, self.max_connections,
+                        options=f"-c statement_timeout={self.statement_timeout_ms}",
+                        **self.params
+                    )
+                except psycopg2.Error as e:
+                    safe_params = {key: value for key, value in self.params.items() if key != 'password'}
+                    logger.error(f"Database connection error: {e}")
+                    logger.error(f"Connection params: {safe_params}")
+                    raise DatabaseUnavailable("Database not available. Please start PostgreSQL server.") from e
+            return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self, connection_pool):
+        # A few attempts, so a pool full of connections dropped by a database restart is refilled
+        for _ in range(self.max_connections + 1):
+            try:
+                conn = connection_pool.getconn()
+            except psycopg2.Error as e:
+                raise DatabaseUnavailable("Database not available. Please start PostgreSQL server.") from e
+            if self._is_healthy(conn):
+                return conn
+            logger.warning("Discarding broken database connection")
+            self._last_used.pop(id(conn), None)
+            connection_pool.putconn(conn, close=True)
+        raise DatabaseUnavailable("Could not get a working database connection")
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection for the duration of the block. Commits on success and
+        rolls back on error.
+        """
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise DatabaseUnavailable("Timed out waiting for a database connection")
+        try:
+            connection_pool = self._get_pool()
+            conn = self._checkout(connection_pool)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                # Also covers GeneratorExit, when a client disconnects from a streamed response
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                self._last_used[id(conn)] = time.monotonic()
+                connection_pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self, name=None):
+        """Checks out a connection and opens a cursor on it. Pass a name for a server-side cursor."""
+        with self.connection() as conn:
+            with conn.cursor(name=name, cursor_factory=self._cursor_factory) as cur:
+                yield cur
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
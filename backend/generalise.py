@@ -0,0 +1,203 @@
+import math
+import time
+import hashlib
+import logging
+
+from backend.layers import table_version, feature_query, layer_chunks
+
+logger = logging.getLogger(__name__)
+
+# Precomputed simplifications live in their own schema, so they don't show up as layers
+SCHEMA = "plandata_zoom"
+
+# Simplification tolerances in metres, one materialised view per layer and band. A request
+# uses the coarsest band whose tolerance is at most its resolution (metres per pixel)
+ZOOM_BANDS = (2.0, 8.0, 32.0, 128.0)
+
+SETUP = [
+    f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}",
+    f"""CREATE TABLE IF NOT EXISTS {SCHEMA}.refreshed (
+        feature text PRIMARY KEY,
+        version text,
+        refreshed_at timestamptz NOT NULL DEFAULT now()
+    )""",
+]
+
+BAND_VIEW = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS
+    SELECT ogc_fid, doklink, gml_id,
+           ST_SimplifyPreserveTopology(ST_CurveToLine(geometri), {tolerance}) AS geometri
+    FROM plandata.{feature}
+    WITH NO DATA
+"""
+
+# The unique index lets the view be refreshed concurrently
+BAND_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS {name}_fid ON {view} (ogc_fid)",
+    "CREATE INDEX IF NOT EXISTS {name}_gist ON {view} USING GIST (geometri)",
+]
+
+IS_POPULATED = "SELECT ispopulated FROM pg_matviews WHERE schemaname = %s AND matviewname = %s"
+
+# Version and age in seconds of a layer's bands
+REFRESHED_VERSION = f"""
+    SELECT version, extract(epoch FROM now() - refreshed_at) FROM {SCHEMA}.refreshed WHERE feature = %s
+"""
+
+MARK_REFRESHED = f"""
+    INSERT INTO {SCHEMA}.refreshed (feature, version, refreshed_at) VALUES (%s, %s, now())
+    ON CONFLICT (feature) DO UPDATE SET version = EXCLUDED.version, refreshed_at = EXCLUDED.refreshed_at
+"""
+
+
+def band_view(feature, band):
+    """Name of the materialised view of a band, shortened to fit PostgreSQL's 63 character limit."""
+    name = f"{feature}_b{band}"
+    if len(name) > 55:
+        name = f"{feature[:40]}_{hashlib.sha1(feature.encode()).hexdigest()[:8]}_b{band}"
+    return f"{SCHEMA}.{name}"
+
+
+def band_for_resolution(resolution):
+    """
+    :param resolution: Metres per pixel, or None for full detail.
+    :return: Index into ZOOM_BANDS, or None when the resolution needs full detail.
+    """
+    if resolution is None:
+        return None
+    bands = [band for band, tolerance in enumerate(ZOOM_BANDS) if tolerance <= resolution]
+    return bands[-1] if bands else None
+
+
+def precision_for_resolution(resolution):
+    """Decimal digits needed for coordinates in metres at a resolution, between 0 and 3."""
+    if resolution is None:
+        return 3
+    return min(max(math.ceil(-math.log10(resolution)) + 1, 0), 3)
+
+
+def parse_bbox(value):
+    """
+    Parses "minx,miny,maxx,maxy" in EPSG:25832.
+
+    :raises ValueError: If the value isn't four finite numbers with min below max.
+    """
+    try:
+        bbox = [float(part) for part in value.split(",")]
+    except ValueError:
+        raise ValueError("bbox must be minx,miny,maxx,maxy") from None
+    if len(bbox) != 4 or not all(math.isfinite(v) for v in bbox) or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise ValueError("bbox must be minx,miny,maxx,maxy with min below max")
+    return tuple(bbox)
+
+
+def parse_resolution(value):
+    try:
+        resolution = float(value)
+    except ValueError:
+        raise ValueError("resolution must be a number of metres per pixel") from None
+    if not math.isfinite(resolution) or resolution <= 0:
+        raise ValueError("resolution must be a positive number of metres per pixel")
+    return resolution
+
+
+class ZoomBands:
+    """
+    Simplified copies of the plandata layers for a set of zoom bands.
+
+    Each band is a materialised view with its own spatial index, so a zoomed out request
+    reads few vertices instead of simplifying every geometry again. The views are built
+    and refreshed by refresh_zoom_bands.py, never by a request. The write counters of a
+    layer's table are recorded when its bands are refreshed, and a request only uses the
+    bands while they still match. Views have no write counters, so bands of a view layer
+    are used for max_age seconds after their refresh. Otherwise the request simplifies
+    on the fly.
+    """
+
+    def __init__(self, db, check_interval=60, max_age=86400):
+        self.db = db
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._current = {}
+
+    def refresh(self, feature):
+        """
+        Creates the band views of a layer if needed and refreshes them, one transaction per
+        band. Views that are already populated are refreshed concurrently, so requests
+        keep reading them meanwhile. Meant for refresh_zoom_bands.py, on a connection
+        without a statement timeout.
+        """
+        start = time.time()
+        version = table_version(self.db, feature)
+        with self.db.cursor() as cur:
+            for statement in SETUP:
+                cur.execute(statement)
+        for band, tolerance in enumerate(ZOOM_BANDS):
+            view = band_view(feature, band)
+            name = view.split('.')[1]
+            with self.db.cursor() as cur:
+                cur.execute(BAND_VIEW.format(view=view, tolerance=tolerance, feature=feature))
+                for statement in BAND_INDEXES:
+                    cur.execute(statement.format(name=name, view=view))
+                cur.execute(IS_POPULATED, (SCHEMA, name))
+                populated = cur.fetchone()[0]
+            with self.db.cursor() as cur:
+                # CONCURRENTLY needs the unique index and a view that has been populated once
+                cur.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if populated else ''}{view}")
+        with self.db.cursor() as cur:
+            cur.execute(MARK_REFRESHED, (feature, None if version is None else repr(version)))
+        self._current.pop(feature, None)
+        logger.info(f"Refreshed zoom bands of {feature} in {time.time() - start:.1f}s")
+
+    def is_current(self, feature):
+        """
+        True if the band views can be used for the layer. Checked at most every check_interval.
+        """
+        checked = self._current.get(feature)
+        if checked is not None and time.monotonic() - checked[1] < self.check_interval:
+            return checked[0]
+
+        try:
+            with self.db.cursor() as cur:
+                cur.execute(REFRESHED_VERSION, (feature,))
+                row = cur.fetchone()
+            if row is None:
+                current = False
+            elif row[0] is None:
+                current = row[1] < self.max_age
+            else:
+                current = row[0] == repr(table_version(self.db, feature))
+        except Exception as e:
+            logger.warning(f"Could not check zoom bands of {feature}, run refresh_zoom_bands.py: {e}")
+            current = False
+        self._current[feature] = (current, time.monotonic())
+        return current
+
+    def query(self, feature, bbox=None, resolution=None):
+        """
+        Builds the query for a viewport: features touching bbox, simplified for the
+        resolution, with coordinates rounded to what a pixel can show.
+
+        :param bbox: (minx, miny, maxx, maxy) in EPSG:25832, or None for the whole layer.
+        :param resolution: Metres per pixel, or None for full detail.
+        """
+        band = band_for_resolution(resolution)
+        digits = precision_for_resolution(resolution)
+        source = None
+        geometry = "ST_CurveToLine(geometri)"
+        if band is not None:
+            if self.is_current(feature):
+                source = band_view(feature, band)
+                geometry = "geometri"
+            else:
+                geometry = f"ST_SimplifyPreserveTopology(ST_CurveToLine(geometri), {ZOOM_BANDS[band]})"
+
+        where = ""
+        if bbox is not None:
+            minx, miny, maxx, maxy = (float(v) for v in bbox)
+            where = f"WHERE geometri && ST_MakeEnvelope({minx!r}, {miny!r}, {maxx!r}, {maxy!r}, 25832)"
+        return feature_query(feature, geometry=f"{geometry}, {digits}", source=source, where=where)
+
+    def chunks(self, feature, bbox=None, resolution=None):
+        """Streams the viewport as GeoJSON, see layer_chunks."""
+        return layer_chunks(self.db, feature, query=self.query(feature, bbox, resolution))
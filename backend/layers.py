@@ -0,0 +1,369 @@
+import gzip
+import time
+import zlib
+import hashlib
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Each row is a complete GeoJSON Feature built by PostGIS, so Python never parses geometries
+FEATURE_QUERY = """
+    SELECT json_build_object(
+        'type', 'Feature',
+        'properties', json_build_object(
+            'id', ogc_fid,
+            'doklink', doklink,
+            'gml_id', gml_id,
+            'color', CASE
+                         WHEN ogc_fid % 3 = 0 THEN 'red'
+                         WHEN ogc_fid % 3 = 1 THEN 'blue'
+                         WHEN ogc_fid % 3 = 2 THEN 'green'
+                         WHEN ogc_fid % 3 = 3 THEN 'yellow'
+                         WHEN ogc_fid % 3 = 4 THEN 'purple'
+                         ELSE 'orange'
+                     END
+        ),
+        'geometry', ST_AsGeoJSON({geometry})::json  -- Geometry remains in EPSG:25832
+    )::text
+    FROM {source}
+    {where}
+"""
+
+# Write counters of the table. They change whenever rows are inserted, updated or deleted,
+# and not when autovacuum or ANALYZE update the row estimates. Views have no statistics, so
+# their layers are only rebuilt when the TTL runs out
+TABLE_VERSION = """
+    SELECT n_tup_ins, n_tup_upd, n_tup_del
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'plandata' AND relname = %s
+"""
+
+LAYER_NAMES = """
+    SELECT table_name FROM information_schema.tables WHERE table_schema = 'plandata'
+"""
+
+
+def table_version(db, feature):
+    """
+    Returns the write counters of a plandata table, or None for views.
+    """
+    with db.cursor() as cur:
+        cur.execute(TABLE_VERSION, (feature,))
+        row = cur.fetchone()
+    return tuple(row) if row else None
+
+
+def feature_query(feature, geometry="ST_CurveToLine(geometri)", source=None, where=""):
+    """
+    Formats FEATURE_QUERY. The defaults select every feature of the layer at full precision.
+
+    :param geometry: Arguments for ST_AsGeoJSON.
+    :param source: Table or view to read, defaults to the layer itself.
+    :param where: Optional WHERE clause.
+    """
+    return FEATURE_QUERY.format(geometry=geometry, source=source or f"plandata.{feature}", where=where)
+
+
+def layer_chunks(db, feature, chunk_size=500, query=None):
+    """
+    Streams a plandata layer as GeoJSON FeatureCollection text through a server-side
+    cursor, chunk_size features at a time, so memory doesn't grow with the layer.
+
+    :param query: Query returning one GeoJSON Feature per row, defaults to the whole layer.
+    :return: Generator of bytes. Nothing is yielded if the layer has no rows.
+    """
+    with db.cursor(name=f"layer_{feature}") as cur:
+        cur.itersize = chunk_size
+        cur.execute(query or feature_query(feature))
+        prefix = b'{"type": "FeatureCollection", "features": ['
+        while rows := cur.fetchmany(chunk_size):
+            yield prefix + ",".join(row[0] for row in rows).encode('utf-8')
+            prefix = b","
+        if prefix == b",":
+            yield b"]}"
+
+
+class Stream:
+    """
+    Iterator over a response body whose close() also runs its cleanup when the body was
+    never iterated. WSGI servers close responses without reading them, e.g. for HEAD
+    requests, and the finally of a generator that never started doesn't run.
+
+    :param iterator: The body.
+    :param closers: Callables run by close(), after closing the iterator.
+    """
+
+    def __init__(self, iterator, *closers):
+        self._iterator = iterator
+        self._closers = closers
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterator, 'close'):
+                self._iterator.close()
+        finally:
+            for closer in self._closers:
+                closer()
+
+
+def open_stream(chunks):
+    """
+    Starts a generator and returns it as a Stream, or None if it is empty. Used to answer
+    404 for empty layers before any response headers are sent.
+    """
+    first = next(chunks, None)
+    if first is None:
+        return None
+    return Stream(itertools.chain([first], chunks), chunks.close)
+
+
+def accepted_encodings(accept_encoding):
+    return {part.split(';')[0].strip() for part in (accept_encoding or '').lower().split(',')}
+
+
+class StreamingLayerBuilder:
+    """
+    Compresses a layer chunk by chunk into every cached encoding, while handing the
+    client the bytes for its own encoding. Each chunk is flushed, so the client gets the
+    first features as soon as the database sends them.
+    """
+
+    def __init__(self):
+        self.sha = hashlib.sha1()
+        self.size = 0
+        self.compressors = {'gzip': zlib.compressobj(9, zlib.DEFLATED, 31)}
+        if brotli is not None:
+            self.compressors['br'] = brotli.Compressor(quality=9)
+        self.parts = {encoding: [] for encoding in self.compressors}
+
+    def _compress(self, encoding, data, final=False):
+        compressor = self.compressors[encoding]
+        if encoding == 'gzip':
+            out = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        else:
+            out = compressor.process(data) + (compressor.finish() if final else compressor.flush())
+        self.parts[encoding].append(out)
+        return out
+
+    def feed(self, chunk, encoding):
+        self.sha.update(chunk)
+        self.size += len(chunk)
+        outputs = {name: self._compress(name, chunk) for name in self.compressors}
+        return outputs.get(encoding, chunk)
+
+    def finish(self, encoding):
+        outputs = {name: self._compress(name, b"", final=True) for name in self.compressors}
+        return outputs.get(encoding, b"")
+
+    def entry(self, version):
+        bodies = {encoding: b"".join(parts) for encoding, parts in self.parts.items()}
+        return LayerEntry(self.sha.hexdigest(), self.size, bodies, version)
+
+
+class LayerEntry:
+    def __init__(self, etag, size, bodies, version):
+        self.etag = etag
+        self.size = size
+        self.bodies = bodies
+        self.version = version
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+
+    def body(self, accept_encoding):
+        """
+        Picks the smallest stored encoding the client accepts.
+
+        :return: Tuple (body, content_encoding). content_encoding is None for identity.
+        """
+        accepted = accepted_encodings(accept_encoding)
+        if 'br' in accepted and 'br' in self.bodies:
+            return self.bodies['br'], 'br'
+        if 'gzip' in accepted or '*' in accepted:
+            return self.bodies['gzip'], 'gzip'
+        return gzip.decompress(self.bodies['gzip']), None
+
+
+class LayerCache:
+    """
+    Serialized and precompressed GeoJSON per plandata layer.
+
+    A cached layer is served without touching the database. At most once every
+    check_interval seconds, a request checks the table's write counters, and the layer is
+    rebuilt if they changed or the entry is older than ttl. A rebuild is streamed to the
+    request that triggered it and only the compressed bodies are kept. Concurrent requests
+    for a layer that is being built wait for that build instead of starting their own.
+    """
+
+    def __init__(self, db, check_interval=60, ttl=3600, build_wait=120, chunks=layer_chunks):
+        self.db = db
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self.build_wait = build_wait
+        self.chunks = chunks
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._layer_names = None
+        self._names_loaded_at = 0
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def layer_names(self, refresh=False):
+        # Reloaded at most once per check_interval, so new tables show up without a restart
+        if self._layer_names is None or (refresh and time.monotonic() - self._names_loaded_at > self.check_interval):
+            with self.db.cursor() as cur:
+                cur.execute(LAYER_NAMES)
+                self._layer_names = {row[0] for row in cur.fetchall()}
+            self._names_loaded_at = time.monotonic()
+        return self._layer_names
+
+    def _version(self, feature):
+        return table_version(self.db, feature)
+
+    def _is_fresh(self, entry, feature):
+        now = time.monotonic()
+        if now - entry.built_at > self.ttl:
+            return False
+        if entry.version is None or now - entry.checked_at < self.check_interval:
+            return True
+        entry.checked_at = now
+        return self._version(feature) == entry.version
+
+    def lookup(self, feature):
+        """Returns the cached layer if it is fresh, without building anything."""
+        entry = self._entries.get(feature)
+        if entry is not None and self._is_fresh(entry, feature):
+            self.hits += 1
+            return entry
+        return None
+
+    def open(self, feature, accept_encoding=None):
+        """
+        Returns a layer from the cache, or a stream that builds it.
+
+        When the layer isn't cached, the returned stream yields the layer in the client's
+        encoding straight from the database and stores it in the cache when it completes.
+        If another request is already building the layer, this one waits for it instead.
+
+        :param feature: Table or view name in the plandata schema.
+        :param accept_encoding: The request's Accept-Encoding header.
+        :return: Tuple (entry, stream, content_encoding). Both entry and stream are None
+                 if the layer doesn't exist or is empty.
+        """
+        if feature not in self.layer_names() and feature not in self.layer_names(refresh=True):
+            return None, None, None
+
+        entry = self.lookup(feature)
+        if entry is not None:
+            return entry, None, None
+
+        with self._lock:
+            building = self._building.get(feature)
+            owner = building is None
+            if owner:
+                building = self._building[feature] = threading.Event()
+
+        if not owner:
+            building.wait(self.build_wait)
+            entry = self.lookup(feature)
+            if entry is not None:
+                return entry, None, None
+
+        accepted = accepted_encodings(accept_encoding)
+        encoding = next((name for name in ('br', 'gzip') if name in accepted and (name != 'br' or brotli)), None)
+        try:
+            version = self._version(feature)
+            chunks = open_stream(self.chunks(self.db, feature))
+        except BaseException:
+            if owner:
+                self._finish_build(feature, building)
+            raise
+        if chunks is None:
+            if owner:
+                self._entries.pop(feature, None)
+                self._finish_build(feature, building)
+            return None, None, None
+
+        self.misses += 1
+        build = self._build(feature, chunks, encoding, version, building if owner else None)
+        if not owner:
+            return None, Stream(build, chunks.close), encoding
+        # The build marker is cleared on close, also when the response is never iterated
+        return None, Stream(build, chunks.close, lambda: self._finish_build(feature, building)), encoding
+
+    def _finish_build(self, feature, building):
+        with self._lock:
+            if self._building.get(feature) is building:
+                del self._building[feature]
+        building.set()
+
+    def _build(self, feature, chunks, encoding, version, building):
+        builder = StreamingLayerBuilder()
+        try:
+            for chunk in chunks:
+                out = builder.feed(chunk, encoding)
+                if out:
+                    yield out
+            yield builder.finish(encoding)
+            if building is not None:
+                entry = builder.entry(version)
+                self._entries[feature] = entry
+                logger.info(f"Built layer {feature}: {entry.size} bytes, gzip {len(entry.bodies['gzip'])} bytes")
+        finally:
+            chunks.close()
+            if building is not None:
+                self._finish_build(feature, building)
+
+    def get(self, feature):
+        """
+        Returns the cached layer, building it completely if needed.
+
+        :return: LayerEntry, or None if the layer doesn't exist or is empty.
+        """
+        entry, stream, _ = self.open(feature)
+        if stream is not None:
+            try:
+                for _ in stream:
+                    pass
+            finally:
+                stream.close()
+            entry = self._entries.get(feature)
+        return entry
+
+    def invalidate(self, feature=None):
+        if feature is None:
+            self._entries.clear()
+            self._layer_names = None
+        else:
+            self._entries.pop(feature, None)
+
+    def warm(self, features):
+        """
+        Builds layers ahead of the first request.
+
+        :param features: Layer names, or ["all"] for every layer in the plandata schema.
+        """
+        try:
+            if "all" in features:
+                features = sorted(self.layer_names())
+            for feature in features:
+                self.get(feature)
+        except Exception as e:
+            logger.warning(f"Could not warm layer cache: {e}")
+
+    def warm_in_background(self, features):
+        if features:
+            threading.Thread(target=self.warm, args=(features,), name="layer-cache-warmer", daemon=True).start()
@@ -0,0 +1,291 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Marks a database as filled by seed_database(), which drops and recreates the plandata
+# tables. Databases without it are never seeded
+MARKER = "plandata.loadtest_scale"
+
+# Area of the synthetic plans, in EPSG:25832 around Aarhus
+EXTENT = (560000.0, 6200000.0, 590000.0, 6230000.0)
+
+PLAN_TABLES = ("theme_pdk_kommuneplan_oversigt_vedtaget_v", "theme_pdk_kommuneplan_oversigt_forslag_v",
+               "theme_pdk_lokalplan_vedtaget_v", "theme_pdk_lokalplan_forslag_v")
+ADDRESS_TABLES = ("komuneplan_for_adresse", "lokalplan_for_adresse")
+
+# Plans are laid out on a square grid over EXTENT, each a square with a jagged edge of
+# `vertices` points, so geometries have realistic sizes for serialisation and simplification
+PLAN_ROWS = """
+    INSERT INTO plandata.{table} (ogc_fid, id, doklink, gml_id, geometri)
+    SELECT i, i, 'https://dokument.plandata.dk/synthetic/' || i || '.pdf', '{table}.' || i,
+           ST_Multi(ST_MakePolygon(ST_AddPoint(line, ST_StartPoint(line))))
+    FROM (
+        SELECT i, ST_MakeLine(ARRAY(
+            SELECT ST_SetSRID(ST_MakePoint(
+                       cx + (size / 2) * (0.85 + 0.15 * random()) * cos(2 * pi() * v / %(vertices)s),
+                       cy + (size / 2) * (0.85 + 0.15 * random()) * sin(2 * pi() * v / %(vertices)s)), 25832)
+            FROM generate_series(0, %(vertices)s - 1) AS v
+        )) AS line
+        FROM (
+            SELECT i,
+                   %(minx)s + ((i - 1) %% %(columns)s + 0.5) * %(size)s AS cx,
+                   %(miny)s + ((i - 1) / %(columns)s + 0.5) * %(size)s AS cy,
+                   %(size)s AS size
+            FROM generate_series(1, %(plans)s) AS i
+        ) centres
+    ) lines
+"""
+
+# `addresses` addresses per plan, "Syntetvej <n>, <postcode> Aarhus" as in the real tables
+ADDRESS_ROWS = """
+    INSERT INTO plandata.{table} (adgangsadressebetegnelse, plan_id)
+    SELECT 'Syntetvej ' || n || ', ' || (8000 + n %% 300) || ' Aarhus', 1 + (n - 1) / %(addresses)s
+    FROM generate_series(1, %(plans)s * %(addresses)s) AS n
+"""
+
+# Size of the seeded data, which scenarios pick their addresses from
+Scale = namedtuple("Scale", ["plans", "addresses"])
+
+
+def address(n):
+    """The n-th synthetic address, as written by ADDRESS_ROWS."""
+    return f"Syntetvej {n}, {8000 + n % 300} Aarhus"
+
+
+def seed_database(db, plans=1000, addresses=10, vertices=64, seed=0.5):
+    """
+    Fills a database with synthetic plandata and address tables. Data is generated by
+    PostGIS, so large scales load in seconds.
+
+    :param db: backend.db.Database of a throwaway database.
+    :param plans: Plans per plan table. The address tables get plans * addresses rows.
+    :param seed: Seed of PostgreSQL's random(), between -1 and 1, so runs are reproducible.
+    :raises RuntimeError: If the database has plandata that wasn't written by this function.
+    """
+    with db.cursor() as cur:
+        cur.execute("SELECT to_regnamespace('plandata') IS NOT NULL, to_regclass(%s) IS NOT NULL", (MARKER,))
+        has_schema, has_marker = cur.fetchone()
+    if has_schema and not has_marker:
+        raise RuntimeError("The database already has a plandata schema that was not made by the load test")
+
+    columns = max(1, int(plans ** 0.5 + 0.999))
+    params = {'plans': plans, 'addresses': addresses, 'vertices': vertices, 'columns': columns,
+              'minx': EXTENT[0], 'miny': EXTENT[1], 'size': (EXTENT[2] - EXTENT[0]) / columns}
+
+    started = time.perf_counter()
+    with db.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        cur.execute("CREATE SCHEMA IF NOT EXISTS plandata")
+        cur.execute("CREATE SCHEMA IF NOT EXISTS skraafoto")
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {MARKER} (plans integer, addresses integer, vertices integer)")
+        cur.execute(f"TRUNCATE {MARKER}")
+        cur.execute(f"INSERT INTO {MARKER} VALUES (%s, %s, %s)", (plans, addresses, vertices))
+        cur.execute("SELECT setseed(%s)", (seed,))
+        for table in PLAN_TABLES:
+            cur.execute(f"DROP TABLE IF EXISTS plandata.{table} CASCADE")
+            cur.execute(f"""CREATE TABLE plandata.{table} (
+                ogc_fid integer PRIMARY KEY, id integer, doklink text, gml_id text,
+                geometri geometry(MultiPolygon, 25832))""")
+            cur.execute(PLAN_ROWS.format(table=table), params)
+            cur.execute(f"CREATE INDEX ON plandata.{table} (id)")
+            cur.execute(f"CREATE INDEX ON plandata.{table} USING GIST (geometri)")
+        for table in ADDRESS_TABLES:
+            cur.execute(f"DROP TABLE IF EXISTS plandata.{table} CASCADE")
+            cur.execute(f"CREATE TABLE plandata.{table} (adgangsadressebetegnelse text, plan_id integer)")
+            cur.execute(ADDRESS_ROWS.format(table=table), params)
+        # An untyped geometry column as in production, where insert_polygons stores WKB
+        # without an SRID. Tables seeded with a typed column are converted
+        cur.execute("""CREATE TABLE IF NOT EXISTS skraafoto.polygons (
+            id serial PRIMARY KEY, group_name text, multi_polygon geometry)""")
+        cur.execute("ALTER TABLE skraafoto.polygons ALTER COLUMN multi_polygon TYPE geometry")
+        cur.execute("DELETE FROM skraafoto.polygons WHERE group_name LIKE 'loadtest-%'")
+        # Statistics, so the planner sees the tables as they are
+        cur.execute("ANALYZE")
+    logger.info(f"Seeded {plans} plans per table and {plans * addresses} addresses in "
+                f"{time.perf_counter() - started:.1f} s")
+
+
+def seeded_scale(db):
+    """:return: Scale of a database filled by seed_database(), or None."""
+    with db.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (MARKER,))
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute(f"SELECT plans, addresses FROM {MARKER}")
+        row = cur.fetchone()
+    return Scale(*row) if row else None
+
+
+def cleanup(db):
+    """Removes polygon collections written by the add_polygon_collection scenario."""
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM skraafoto.polygons WHERE group_name LIKE 'loadtest-%'")
+        return cur.rowcount
+
+
+def random_square(rng, size):
+    x = rng.uniform(EXTENT[0], EXTENT[2] - size)
+    y = rng.uniform(EXTENT[1], EXTENT[3] - size)
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size]]
+
+
+# A request of a scenario: method, path and optional JSON body
+Request = namedtuple("Request", ["method", "path", "body"])
+
+
+def toggle_requests(rng, scale):
+    # Mostly zoomed in viewports, as the map is used, with whole layers now and then
+    layer = rng.choice(PLAN_TABLES)
+    if rng.random() < 0.1:
+        return Request("GET", f"/toggle/{layer}", None)
+    resolution = rng.choice((0.5, 2, 8, 32))
+    (minx, miny), _, (maxx, maxy), _ = random_square(rng, resolution * 1000)
+    return Request("GET", f"/toggle/{layer}?bbox={minx:.0f},{miny:.0f},{maxx:.0f},{maxy:.0f}&resolution={resolution}", None)
+
+
+def plandata_requests(rng, scale):
+    # One in five addresses doesn't exist, which exercises the substring fallback
+    if rng.random() < 0.2:
+        return Request("GET", f"/get_plandata/Ukendtvej {rng.randint(1, 10000)}", None)
+    return Request("GET", f"/get_plandata/{address(rng.randint(1, scale.plans * scale.addresses))}", None)
+
+
+def in_polygon_requests(rng, scale):
+    square = random_square(rng, 500)
+    x, y = square[0]
+    point = f"({x + rng.uniform(-100, 600):.1f},{y + rng.uniform(-100, 600):.1f})"
+    polygon = "[" + ",".join(f"({px:.1f},{py:.1f})" for px, py in square + square[:1]) + "]"
+    return Request("GET", f"/in_polygon/{point}/{polygon}", None)
+
+
+def add_polygon_requests(rng, scale, rings=50):
+    return Request("PUT", f"/add_polygon_collection/loadtest-{uuid.UUID(int=rng.getrandbits(128))}",
+                   [random_square(rng, 200) for _ in range(rings)])
+
+
+SCENARIOS = {
+    "toggle": toggle_requests,
+    "get_plandata": plandata_requests,
+    "in_polygon": in_polygon_requests,
+    "add_polygon_collection": add_polygon_requests,
+}
+
+# Any other status is counted as an error
+EXPECTED_STATUSES = {
+    "toggle": {200},
+    "get_plandata": {200},
+    "in_polygon": {200},
+    "add_polygon_collection": {201},
+}
+
+
+class StageResult:
+    """Outcome of one endpoint at one concurrency level."""
+
+    def __init__(self, endpoint, concurrency):
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+        self.seconds = 0.0
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    @property
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+    def percentile(self, p):
+        """Latency in seconds below which p percent of the requests finished (nearest rank)."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))]
+
+    def as_dict(self):
+        return {'endpoint': self.endpoint, 'concurrency': self.concurrency, 'requests': self.requests,
+                'seconds': round(self.seconds, 3), 'throughput': round(self.throughput, 2),
+                'error_rate': round(self.error_rate, 4), 'statuses': self.statuses,
+                **{f'p{p}_ms': round(self.percentile(p) * 1000, 1) if self.latencies else None for p in (50, 90, 99)}}
+
+
+async def run_stage(base_url, endpoint, concurrency, duration, scale, seed=0, timeout=60):
+    """
+    Keeps `concurrency` requests of one scenario in flight for `duration` seconds.
+    Unexpected statuses, timeouts and connection errors count as errors.
+
+    :param scale: Scale of the seeded database.
+    :return: StageResult.
+    """
+    import aiohttp
+
+    make_request = SCENARIOS[endpoint]
+    expected = EXPECTED_STATUSES[endpoint]
+    result = StageResult(endpoint, concurrency)
+    deadline = time.perf_counter() + duration
+
+    async def worker(session, rng):
+        while time.perf_counter() < deadline:
+            request = make_request(rng, scale)
+            started = time.perf_counter()
+            try:
+                body = None if request.body is None else json.dumps(request.body)
+                async with session.request(request.method, base_url + request.path, data=body,
+                                           headers={'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f"{request.method} {request.path} failed: {e}")
+                status = "error"
+            result.latencies.append(time.perf_counter() - started)
+            result.statuses[str(status)] = result.statuses.get(str(status), 0) + 1
+            if status not in expected:
+                result.errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session, random.Random(f"{seed}-{endpoint}-{i}")) for i in range(concurrency)))
+        result.seconds = time.perf_counter() - started
+    return result
+
+
+async def run_load(base_url, endpoints, concurrency_levels, duration, scale, seed=0):
+    """
+    Runs every endpoint at each concurrency level in turn, lowest first.
+
+    :return: List of StageResult.
+    """
+    results = []
+    for endpoint in endpoints:
+        for concurrency in concurrency_levels:
+            result = await run_stage(base_url, endpoint, concurrency, duration, scale, seed)
+            logger.info(f"{endpoint} x{concurrency}: {result.throughput:.1f} req/s, "
+                        f"{result.error_rate:.1%} errors")
+            results.append(result)
+    return results
+
+
+def format_report(results):
+    """Text table of stage results."""
+    header = f"{'endpoint':<24}{'conc':>6}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        row = result.as_dict()
+        percentiles = "".join(f"{row[f'p{p}_ms'] if row[f'p{p}_ms'] is not None else '-':>10}" for p in (50, 90, 99))
+        lines.append(f"{result.endpoint:<24}{result.concurrency:>6}{result.requests:>10}{result.throughput:>10.1f}"
+                     f"{percentiles}{result.error_rate:>9.1%}")
+    return "\n".join(lines)
@@ -0,0 +1,171 @@
+import re
+import time
+import bisect
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# Literals are stripped before fingerprinting, so a query template is one series however
+# many bbox values or names it is run with
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+def query_fingerprint(query):
+    """
+    :return: Tuple (verb, fingerprint) of a SQL statement, e.g. ("select", "3f2a9c0b1d").
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = WHITESPACE.sub(" ", NUMBER_LITERAL.sub("?", STRING_LITERAL.sub("?", str(query)))).strip()
+    verb = text.split(" ", 1)[0].lower() if text else ""
+    return verb, hashlib.sha1(text.encode('utf-8')).hexdigest()[:10]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    """Prometheus style histogram with one series per label set."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (counts, total, count) in series:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Metrics:
+    """
+    Request, query and cache metrics of the Flask API, rendered in the Prometheus text format.
+
+    Caches are registered with a name and read when /metrics is scraped, so they only keep
+    their own hits and misses counters.
+    """
+
+    def __init__(self, slow_query_ms=500, plan_interval=300):
+        self.slow_query_ms = slow_query_ms
+        self.plan_interval = plan_interval
+        self.requests = Histogram("skraafoto_request_duration_seconds", "Time to handle a request",
+                                  ("route", "method", "status"), LATENCY_BUCKETS)
+        self.sizes = Histogram("skraafoto_response_size_bytes", "Size of response bodies",
+                               ("route", "method"), SIZE_BUCKETS)
+        self.queries = Histogram("skraafoto_query_duration_seconds", "Time to execute a SQL statement",
+                                 ("verb", "fingerprint"), LATENCY_BUCKETS)
+        self.slow_queries = 0
+        self._caches = {}
+        self._plans_logged = {}
+        self._lock = threading.Lock()
+
+    def register_cache(self, name, cache):
+        """
+        :param cache: Object with hits and misses attributes, and optionally disk_hits.
+        """
+        self._caches[name] = cache
+
+    def observe_request(self, route, method, status, seconds, size=None):
+        self.requests.observe(seconds, route, method, str(status))
+        if size is not None:
+            self.sizes.observe(size, route, method)
+
+    def observe_query(self, cursor, query, params, seconds):
+        """
+        Records a statement's duration. Statements slower than slow_query_ms are logged with
+        their plan, at most once every plan_interval seconds per query template.
+        """
+        verb, fingerprint = query_fingerprint(query)
+        self.queries.observe(seconds, verb, fingerprint)
+        if seconds * 1000 < self.slow_query_ms:
+            return
+
+        with self._lock:
+            self.slow_queries += 1
+            last = self._plans_logged.get(fingerprint)
+            log_plan = last is None or time.monotonic() - last > self.plan_interval
+            if log_plan:
+                self._plans_logged[fingerprint] = time.monotonic()
+
+        statement = WHITESPACE.sub(" ", query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query))
+        message = f"Slow query {fingerprint} took {seconds * 1000:.0f} ms: {statement[:1000]}"
+        if log_plan and verb in ("select", "with", "insert", "update", "delete"):
+            plan = explain(cursor, query, params)
+            if plan:
+                message += "\n" + plan
+        logger.warning(message)
+
+    def render(self):
+        lines = self.requests.render() + self.sizes.render() + self.queries.render()
+        lines += ["# HELP skraafoto_slow_queries_total Statements slower than the slow query threshold",
+                  "# TYPE skraafoto_slow_queries_total counter",
+                  f"skraafoto_slow_queries_total {self.slow_queries}"]
+        for metric, attribute in (("hits", "hits"), ("disk_hits", "disk_hits"), ("misses", "misses")):
+            samples = [(name, getattr(cache, attribute)) for name, cache in sorted(self._caches.items())
+                       if hasattr(cache, attribute)]
+            if samples:
+                lines += [f"# HELP skraafoto_cache_{metric}_total Cache {metric.replace('_', ' ')}",
+                          f"# TYPE skraafoto_cache_{metric}_total counter"]
+                lines += [f"skraafoto_cache_{metric}_total{format_labels({'cache': name})} {value}"
+                          for name, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+def explain(cursor, query, params):
+    """Returns the plan of a statement that just ran on the cursor's connection, or None."""
+    import psycopg2  # type: ignore
+
+    conn = cursor.connection
+    if conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        return None
+    in_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    # A plain cursor, so the EXPLAIN itself isn't timed. The savepoint keeps a failing
+    # EXPLAIN from aborting the request's transaction
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as plan_cursor:
+        try:
+            if in_transaction:
+                plan_cursor.execute("SAVEPOINT explain_slow_query")
+            plan_cursor.execute(b"EXPLAIN " + (query if isinstance(query, bytes) else query.encode('utf-8')), params)
+            plan = "\n".join(row[0] for row in plan_cursor.fetchall())
+            if in_transaction:
+                plan_cursor.execute("RELEASE SAVEPOINT explain_slow_query")
+            return plan
+        except psycopg2.Error as e:
+            logger.debug(f"Could not explain slow query: {e}")
+            if in_transaction:
+                plan_cursor.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+            return None
@@ -0,0 +1,97 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Index names with their schema and status, to find indexes that are missing or were left
+# invalid by a failed CREATE INDEX CONCURRENTLY
+INDEX_STATUS = """
+    SELECT c.relname, i.indisvalid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %s AND c.relname = ANY(%s)
+"""
+
+
+class Index:
+    """
+    An index the API relies on, created by create_indexes.py instead of on the request path.
+
+    :param schema: Schema of the table, which the index is created in as well.
+    :param name: Index name.
+    :param definition: What follows ON, e.g. "plandata.t USING GIN (column gin_trgm_ops)".
+    :param extension: Extension the index needs, e.g. "pg_trgm".
+    """
+
+    def __init__(self, schema, name, definition, extension=None):
+        self.schema = schema
+        self.name = name
+        self.definition = definition
+        self.extension = extension
+
+    @property
+    def statement(self):
+        return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.definition}"
+
+
+def index_status(cur, indexes):
+    """:return: Dictionary of index name -> True if it is valid, for the indexes that exist."""
+    status = {}
+    for schema in {index.schema for index in indexes}:
+        cur.execute(INDEX_STATUS, (schema, [index.name for index in indexes if index.schema == schema]))
+        status.update(cur.fetchall())
+    return status
+
+
+def missing_indexes(db, indexes):
+    """:return: The indexes that don't exist or are invalid."""
+    with db.cursor() as cur:
+        status = index_status(cur, indexes)
+    return [index for index in indexes if not status.get(index.name)]
+
+
+def check_indexes(db, indexes, purpose):
+    """
+    Logs a warning at startup for missing indexes. Errors are logged too, as the app starts
+    even when the database is down.
+
+    :param purpose: What the indexes are for, e.g. "address lookups".
+    """
+    try:
+        missing = missing_indexes(db, indexes)
+    except Exception as e:
+        logger.warning(f"Could not check the indexes for {purpose}: {e}")
+        return
+    if missing:
+        logger.warning(f"Indexes for {purpose} are missing or invalid, run create_indexes.py: "
+                       f"{', '.join(index.name for index in missing)}")
+
+
+def create_indexes(db, indexes):
+    """
+    Creates the indexes that are missing, without blocking writes to their tables. CREATE
+    INDEX CONCURRENTLY can't run in a transaction, so the connection is put in autocommit
+    mode. An invalid index left by an earlier failed run is dropped and created again.
+
+    :return: Names of the indexes created.
+    """
+    created = []
+    with db.connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for extension in sorted({index.extension for index in indexes if index.extension}):
+                    cur.execute(f"CREATE EXTENSION IF NOT EXISTS {extension}")
+                status = index_status(cur, indexes)
+                for index in indexes:
+                    if status.get(index.name):
+                        continue
+                    if index.name in status:
+                        logger.info(f"Dropping invalid index {index.schema}.{index.name}")
+                        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index.schema}.{index.name}")
+                    logger.info(f"Creating index {index.schema}.{index.name}")
+                    cur.execute(index.statement)
+                    created.append(index.name)
+        finally:
+            conn.autocommit = False
+    return created
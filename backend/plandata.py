@@ -0,0 +1,200 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+from backend.migrations import Index
+
+logger = logging.getLogger(__name__)
+
+# Address text as stored, lower-cased with whitespace collapsed, so it can be matched on an index
+NORMALISED = r"lower(regexp_replace(adgangsadressebetegnelse, '\s+', ' ', 'g'))"
+
+# A btree index on the normalised text answers prefix matches ("vej 1, 8000" of
+# "Vej 1, 8000 Aarhus C"), a trigram index answers the substring fallback. Created by
+# create_indexes.py
+INDEXES = [
+    index
+    for table in ("komuneplan_for_adresse", "lokalplan_for_adresse")
+    for index in (
+        Index("plandata", f"{table}_normalised_idx", f"plandata.{table} ({NORMALISED} text_pattern_ops)"),
+        Index("plandata", f"{table}_trgm_idx", f"plandata.{table} USING GIN (adgangsadressebetegnelse gin_trgm_ops)",
+              extension="pg_trgm"),
+    )
+]
+
+# Address table, adopted plans and proposed plans per plan type
+PLAN_TYPES = {
+    "komuneplan": ("komuneplan_for_adresse",
+                   "theme_pdk_kommuneplan_oversigt_vedtaget_v", "theme_pdk_kommuneplan_oversigt_forslag_v"),
+    "lokalplan": ("lokalplan_for_adresse",
+                  "theme_pdk_lokalplan_vedtaget_v", "theme_pdk_lokalplan_forslag_v"),
+}
+
+# Prefix match on the normalised address, and only if that finds nothing, substring match.
+# Ordered, so an address matching several rows always gets the same plan
+PLAN_ID = """
+    COALESCE(
+        (SELECT plan_id FROM plandata.{table} WHERE {normalised} LIKE {prefix} ORDER BY plan_id LIMIT 1),
+        (SELECT plan_id FROM plandata.{table} WHERE adgangsadressebetegnelse ILIKE {pattern} ORDER BY plan_id LIMIT 1)
+    )
+"""
+
+# The plan of an address. Adopted plans are preferred over proposals, then the lowest id
+PLAN_CTE = """
+    {name} AS (
+        (SELECT 0 AS preference, id, doklink, gml_id, geometri FROM plandata.{adopted} WHERE id = {plan_id}
+         UNION ALL
+         SELECT 1, id, doklink, gml_id, geometri FROM plandata.{proposed} WHERE id = {plan_id})
+        ORDER BY preference, id
+        LIMIT 1
+    )
+"""
+
+# A FeatureCollection of the first row of a plan CTE, with geometry in EPSG:25832
+PLAN_COLLECTION = """
+    (SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'features', COALESCE(json_agg(json_build_object(
+            'type', 'Feature',
+            'properties', json_build_object('id', p.id, 'doklink', p.doklink, 'gml_id', p.gml_id),
+            'geometry', ST_AsGeoJSON(ST_CurveToLine(p.geometri))::json
+        )), '[]'::json)
+    ) FROM {plan} p)
+"""
+
+
+def plan_cte(plan_type, plan_id):
+    """
+    :param plan_id: Query returning the plan id.
+    """
+    _, adopted, proposed = PLAN_TYPES[plan_type]
+    return PLAN_CTE.format(name=plan_type, adopted=adopted, proposed=proposed, plan_id=f"({plan_id})")
+
+
+def plan_id_query(plan_type, prefix, pattern):
+    """
+    :param prefix: Placeholder of the normalised address prefix pattern, e.g. "%(prefix)s" or "$1".
+    :param pattern: Placeholder of the substring pattern.
+    """
+    return PLAN_ID.format(table=PLAN_TYPES[plan_type][0], normalised=NORMALISED, prefix=prefix, pattern=pattern)
+
+
+def plan_query(plan_type, prefix="$1", pattern="$2"):
+    """The FeatureCollection of one plan type, so plan types can be queried concurrently."""
+    return f"""
+    WITH plan_id AS (SELECT {plan_id_query(plan_type, prefix, pattern)} AS id),
+    {plan_cte(plan_type, "SELECT id FROM plan_id")}
+    SELECT {PLAN_COLLECTION.format(plan=plan_type)}::text
+    """
+
+
+# Both plan types in one round trip, each address table is searched once
+PLANDATA_QUERY = f"""
+    WITH plan_ids AS (
+        SELECT {plan_id_query("komuneplan", "%(prefix)s", "%(pattern)s")} AS komuneplan_id,
+               {plan_id_query("lokalplan", "%(prefix)s", "%(pattern)s")} AS lokalplan_id
+    ),
+    {plan_cte("komuneplan", "SELECT komuneplan_id FROM plan_ids")},
+    {plan_cte("lokalplan", "SELECT lokalplan_id FROM plan_ids")}
+    SELECT json_build_object(
+        'komuneplan', {PLAN_COLLECTION.format(plan="komuneplan")},
+        'lokalplan', {PLAN_COLLECTION.format(plan="lokalplan")}
+    )::text
+"""
+
+
+def normalise_address(address):
+    """Lower-cases an address and collapses whitespace, also around commas."""
+    address = re.sub(r"\s*,\s*", ", ", address.strip().lower())
+    return re.sub(r"\s+", " ", address)
+
+
+def like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class PlandataLookup:
+    """
+    Finds the kommuneplan and lokalplan for an address.
+
+    Results are kept in a bounded LRU cache keyed by the normalised address, as the same
+    few addresses are looked up again and again while a user works on them.
+    """
+
+    def __init__(self, db, max_entries=1024, ttl=3600):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, address):
+        """
+        :return: Tuple (key, cached body or None, LIKE parameters).
+        """
+        key = normalise_address(address)
+        if not key:
+            raise ValueError("Address is empty")
+        params = {'prefix': like_escape(key) + "%", 'pattern': f"%{like_escape(address.strip())}%"}
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return key, cached[0], params
+        return key, None, params
+
+    def _remember(self, key, body):
+        self.misses += 1
+        with self._lock:
+            self._cache[key] = (body, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def get(self, address):
+        """
+        :param address: Address text, e.g. "Vejnavn 1, 8000".
+        :return: JSON text {"komuneplan": FeatureCollection, "lokalplan": FeatureCollection}.
+        :raises ValueError: If the address is empty.
+        """
+        key, body, params = self._lookup(address)
+        if body is not None:
+            return body
+
+        with self.db.cursor() as cur:
+            cur.execute(PLANDATA_QUERY, params)
+            body = cur.fetchone()[0]
+        self._remember(key, body)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class AsyncPlandataLookup(PlandataLookup):
+    """
+    PlandataLookup for the ASGI app. The plan types are queried concurrently on two
+    pooled connections, so a lookup takes as long as the slower query.
+
+    :param db: backend.async_db.AsyncDatabase.
+    """
+
+    async def get(self, address):
+        key, body, params = self._lookup(address)
+        if body is not None:
+            return body
+
+        komuneplan, lokalplan = await asyncio.gather(
+            *(self.db.fetchval(plan_query(plan_type), params['prefix'], params['pattern']) for plan_type in PLAN_TYPES)
+        )
+        body = f'{{"komuneplan": {komuneplan}, "lokalplan": {lokalplan}}}'
+        self._remember(key, body)
+        return body
@@ -0,0 +1,256 @@
+import json
+import codecs
+import struct
+import logging
+from itertools import islice
+
+from pyproj import CRS, Transformer
+
+from backend.migrations import Index
+
+logger = logging.getLogger(__name__)
+
+wgs84 = CRS('epsg:4326')  # WGS84
+etrs89_utm32n = CRS('epsg:25832')  # ETRS89 / UTM zone 32N
+
+# The indexes the bulk lookup relies on, created by create_indexes.py
+INDEXES = [
+    Index("skraafoto", "polygons_group_name_idx", "skraafoto.polygons (group_name)"),
+    Index("skraafoto", "polygons_multi_polygon_gist", "skraafoto.polygons USING GIST (multi_polygon)"),
+]
+
+# One statement for the whole batch: the points are unnested from two arrays and each
+# one is tested against the collection through the GiST index
+CLASSIFY_POINTS = """
+    WITH collection AS (
+        SELECT COALESCE((SELECT ST_SRID(multi_polygon) FROM skraafoto.polygons
+                         WHERE group_name = %(collection)s LIMIT 1), 0) AS srid
+    ),
+    points AS (
+        SELECT t.ord, ST_SetSRID(ST_MakePoint(t.x, t.y), collection.srid) AS geom
+        FROM unnest(%(xs)s::float8[], %(ys)s::float8[]) WITH ORDINALITY AS t(x, y, ord), collection
+    )
+    SELECT EXISTS (
+        SELECT 1 FROM skraafoto.polygons p
+        WHERE p.group_name = %(collection)s AND ST_CoveredBy(points.geom, p.multi_polygon)
+    )
+    FROM points
+    ORDER BY points.ord
+"""
+
+# Rows are streamed into COPY as text: group name and hex WKB of a one-polygon MultiPolygon
+COPY_POLYGONS = "COPY skraafoto.polygons (group_name, multi_polygon) FROM STDIN"
+
+_transformer = None
+
+
+def get_transformer():
+    """
+    Cached EPSG:25832 -> EPSG:4326 transformer. It keeps the axis order of the CRS
+    definitions, like the vertices stored by insert_polygon.
+    """
+    global _transformer
+    if _transformer is None:
+        _transformer = Transformer.from_crs(etrs89_utm32n, wgs84)
+    return _transformer
+
+
+def classify_points(db, collection_name, points):
+    """
+    Tests which points are covered by a stored polygon collection.
+
+    :param db: backend.db.Database.
+    :param collection_name: group_name of the collection.
+    :param points: List of [x, y] in EPSG:25832.
+    :return: List of booleans in the order of the points.
+    """
+    import numpy as np
+
+    coordinates = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    first, second = get_transformer().transform(coordinates[:, 0], coordinates[:, 1])
+
+    with db.cursor() as cur:
+        cur.execute(CLASSIFY_POINTS, {
+            'collection': collection_name,
+            'xs': np.asarray(first).tolist(),
+            'ys': np.asarray(second).tolist(),
+        })
+        return [row[0] for row in cur.fetchall()]
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """
+    Yields the elements of a top-level JSON array one at a time while reading the stream
+    in chunks, so memory is bounded by the largest element instead of the whole body.
+
+    :param stream: Binary file-like object, e.g. a request stream.
+    :raises ValueError: If the body isn't exactly one JSON array: missing or extra commas,
+        or anything but whitespace after the closing bracket.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ""
+    position = 0
+    eof = False
+    # What may come next: "[" first, then an element or "]", then "," or "]", then an element
+    expecting = "start"
+
+    def fill():
+        nonlocal buffer, position, eof
+        data = stream.read(chunk_size)
+        if not data:
+            eof = True
+        buffer = buffer[position:] + text_decoder.decode(data, final=eof)
+        position = 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+        if position == len(buffer):
+            if eof:
+                if expecting == "end":
+                    return
+                raise ValueError("Unexpected end of JSON array")
+            fill()
+            continue
+
+        character = buffer[position]
+        if expecting == "end":
+            raise ValueError("Unexpected data after JSON array")
+        if expecting == "start":
+            if character != "[":
+                raise ValueError("Expected a JSON array")
+            position += 1
+            expecting = "first"
+            continue
+        if expecting == "separator" or (expecting == "first" and character == "]"):
+            if character == "]":
+                position += 1
+                expecting = "end"
+            elif character == "," and expecting == "separator":
+                position += 1
+                expecting = "element"
+            else:
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {character!r}")
+            continue
+        if character in ",]}:":
+            # Can't start a value, so there's no point reading on
+            raise ValueError(f"Expected a value in JSON array, found {character!r}")
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The element may continue in the next chunk
+            if eof:
+                raise ValueError("Invalid JSON array") from None
+            fill()
+            continue
+        if end == len(buffer) and not eof:
+            # A number at the end of the buffer may continue in the next chunk
+            fill()
+            continue
+        position = end
+        expecting = "separator"
+        yield element
+
+
+def rings_to_wkb(rings):
+    """
+    Reprojects rings of [x, y] in EPSG:25832 in one vectorised call and encodes each as
+    a MultiPolygon with one polygon, in the axis order insert_polygon has always stored.
+
+    :return: List of WKB bytes, one per ring.
+    :raises ValueError: If a ring has fewer than three points or non-numeric coordinates.
+    """
+    import numpy as np
+
+    arrays = []
+    for ring in rings:
+        coordinates = np.asarray(ring, dtype=np.float64)
+        if coordinates.ndim != 2 or coordinates.shape[0] < 3 or coordinates.shape[1] < 2:
+            raise ValueError("Each polygon must be a list of at least three [x, y] points")
+        coordinates = coordinates[:, :2]
+        if not np.array_equal(coordinates[0], coordinates[-1]):
+            coordinates = np.vstack([coordinates, coordinates[:1]])
+        arrays.append(coordinates)
+    if not arrays:
+        return []
+
+    vertices = np.concatenate(arrays)
+    first, second = get_transformer().transform(vertices[:, 0], vertices[:, 1])
+    transformed = np.column_stack([first, second]).astype('<f8')
+
+    wkbs = []
+    offset = 0
+    for coordinates in arrays:
+        count = len(coordinates)
+        # Little endian MultiPolygon (6) of one Polygon (3) with one ring
+        header = struct.pack('<BII', 1, 6, 1) + struct.pack('<BIII', 1, 3, 1, count)
+        wkbs.append(header + transformed[offset:offset + count].tobytes())
+        offset += count
+    return wkbs
+
+
+class _CopyBuffer:
+    """File-like object for copy_expert that renders COPY rows lazily from an iterator."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.pending = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.pending += line
+        if size < 0:
+            size = len(self.pending)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    readline = read
+
+
+def copy_escape(text):
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def insert_polygons(db, collection_name, rings, batch_size=1000):
+    """
+    Stores polygons of a collection, one row per polygon, through COPY. The rings are
+    consumed and reprojected in batches, so they can be streamed from the request body.
+
+    :param db: backend.db.Database.
+    :param collection_name: group_name of the collection.
+    :param rings: Iterable of rings, each a list of [x, y] in EPSG:25832.
+    :return: Number of polygons stored.
+    :raises ValueError: If a ring is invalid or there are none.
+    """
+    name = copy_escape(collection_name).encode('utf-8')
+    count = 0
+    errors = []
+
+    def lines():
+        nonlocal count
+        try:
+            iterator = iter(rings)
+            while batch := list(islice(iterator, batch_size)):
+                for wkb in rings_to_wkb(batch):
+                    count += 1
+                    yield name + b"\t" + wkb.hex().encode('ascii') + b"\n"
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    try:
+        with db.cursor() as cur:
+            cur.copy_expert(COPY_POLYGONS, _CopyBuffer(lines()), size=1 << 16)
+            if count == 0:
+                raise ValueError("The collection has no polygons")
+    except Exception:
+        # psycopg2 aborts the COPY when reading fails; report the input error, not the abort
+        if errors:
+            raise errors[0] from None
+        raise
+    return count
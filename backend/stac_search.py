@@ -0,0 +1,286 @@
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.dataforsyningen.dk/rest/skraafoto_api/v1.0"
+CRS_URIS = {"4326": "http://www.opengis.net/def/crs/OGC/1.3/CRS84",
+            "25832": "http://www.opengis.net/def/crs/EPSG/0/25832"}
+
+# Side of a cache tile per bbox CRS, about a kilometre either way
+TILE_SIZES = {"4326": 0.01, "25832": 1000.0}
+
+# Items the viewer never shows
+EXCLUDED_IDS = {"2023_jul_i_job"}
+
+# Item properties the viewer reads, the rest of each item is dropped
+PROPERTIES = ("datetime", "direction", "gsd", "pers:interior_orientation", "pers:perspective_center",
+              "pers:omega", "pers:phi", "pers:kappa", "pers:crs", "pers:vertical_crs")
+ASSETS = ("data", "thumbnail")
+
+# Query parameters that number pages, so every page URL can be derived from the first one
+PAGE_PARAMETERS = ("page", "offset", "startindex")
+
+
+def parse_bbox(text, crs="4326"):
+    """
+    :param text: "minx,miny,maxx,maxy".
+    :return: Tuple of four floats.
+    :raises ValueError: If the text isn't a valid bbox.
+    """
+    if crs not in CRS_URIS:
+        raise ValueError(f"crs must be one of {', '.join(CRS_URIS)}")
+    try:
+        bbox = tuple(float(value) for value in text.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be four numbers: minx,miny,maxx,maxy") from None
+    if len(bbox) != 4 or not all(math.isfinite(value) for value in bbox):
+        raise ValueError("bbox must be four numbers: minx,miny,maxx,maxy")
+    if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise ValueError("bbox must have minx < maxx and miny < maxy")
+    return bbox
+
+
+def bbox_tiles(bbox, tile_size):
+    """:return: List of (column, row) of the cache tiles covering a bbox."""
+    columns = range(math.floor(bbox[0] / tile_size), math.floor(bbox[2] / tile_size) + 1)
+    rows = range(math.floor(bbox[1] / tile_size), math.floor(bbox[3] / tile_size) + 1)
+    return [(column, row) for column in columns for row in rows]
+
+
+def tile_bbox(tile, tile_size):
+    column, row = tile
+    return (column * tile_size, row * tile_size, (column + 1) * tile_size, (row + 1) * tile_size)
+
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def geometry_bounds(geometry):
+    """:return: (minx, miny, maxx, maxy) of a GeoJSON Polygon or MultiPolygon, or None."""
+    if not geometry or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+        return None
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    xs = [position[0] for rings in polygons for position in rings[0]]
+    ys = [position[1] for rings in polygons for position in rings[0]]
+    return (min(xs), min(ys), max(xs), max(ys)) if xs else None
+
+
+def compact_item(feature):
+    """Keeps the parts of a STAC item the viewer uses."""
+    properties = feature.get("properties") or {}
+    assets = feature.get("assets") or {}
+    return {
+        "type": "Feature",
+        "id": feature["id"],
+        "collection": feature.get("collection"),
+        "bbox": feature.get("bbox"),
+        "geometry": feature.get("geometry"),
+        "properties": {name: properties[name] for name in PROPERTIES if name in properties},
+        "assets": {name: {"href": assets[name]["href"]} for name in ASSETS if assets.get(name, {}).get("href")},
+    }
+
+
+def page_urls(next_url, matched, page_size):
+    """
+    Derives the URLs of all remaining pages from the first page's next link, when it
+    numbers its pages by page or offset. Cursor tokens can't be derived and return None.
+
+    :param matched: numberMatched of the first page.
+    :param page_size: Number of items on the first page, which the API may cap below the limit.
+    """
+    parts = urllib.parse.urlsplit(next_url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    names = {name.lower(): name for name, _ in query}
+    name = next((names[key] for key in PAGE_PARAMETERS if key in names), None)
+    if name is None or matched is None:
+        return None
+    value = dict(query)[name]
+    if not value.isdigit():
+        return None
+    pages = math.ceil(matched / page_size)
+    if name.lower() == "page":
+        start = int(value)
+        values = range(start, start + pages - 1)
+    else:
+        start = int(value)
+        values = range(start, start + (pages - 1) * page_size, page_size)
+    return [urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(
+        [(key, str(number) if key == name else item) for key, item in query]))) for number in values]
+
+
+class StacSearch:
+    """
+    Bbox search of the STAC API on behalf of the viewer.
+
+    A search is split into fixed cache tiles of about a kilometre. The items of each tile
+    are fetched once, kept in an LRU cache with a TTL and shared between users, so a popular
+    area is answered from memory. Pages of a tile are fetched concurrently when the next
+    links number their pages, and one after another otherwise. Concurrent requests for the
+    same tile share one fetch. The requests run with aiohttp on a private event loop in a
+    background thread, which is started on the first search.
+    """
+
+    def __init__(self, api_url, api_token, ttl=3600, max_tiles=2048, max_tiles_per_search=64,
+                 page_size=1000, concurrency=8, timeout=30):
+        self.api_url = api_url.rstrip("/")
+        self.api_token = api_token
+        self.ttl = ttl
+        self.max_tiles = max_tiles
+        self.max_tiles_per_search = max_tiles_per_search
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._session = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="stac-search", daemon=True).start()
+            return self._loop
+
+    def _get_session(self):
+        # Only called on the private loop
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                headers={'token': self.api_token or ""},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit_per_host=self.concurrency),
+            )
+        return self._session
+
+    async def _get_page(self, url):
+        async with self._get_session().get(url) as response:
+            if response.status != 200:
+                raise Exception(f"STAC search failed with status code {response.status}")
+            return await response.json(content_type=None)
+
+    async def _fetch_tile(self, bbox, crs):
+        first_url = (f"{self.api_url}/search?limit={self.page_size}"
+                     f"&bbox={','.join(repr(value) for value in bbox)}"
+                     f"&bbox-crs={CRS_URIS[crs]}&crs={CRS_URIS[crs]}")
+        page = await self._get_page(first_url)
+        features = list(page.get("features", []))
+        next_url = next((link["href"] for link in page.get("links", []) if link.get("rel") == "next"), None)
+        if next_url is None:
+            return features
+
+        urls = page_urls(next_url, page.get("numberMatched"), len(features) or self.page_size)
+        if urls:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def get(url):
+                async with semaphore:
+                    return await self._get_page(url)
+
+            for result in await asyncio.gather(*(get(url) for url in urls)):
+                features.extend(result.get("features", []))
+            return features
+
+        while next_url:
+            page = await self._get_page(next_url)
+            features.extend(page.get("features", []))
+            next_url = next((link["href"] for link in page.get("links", []) if link.get("rel") == "next"), None)
+        return features
+
+    async def _fetch_tiles(self, tiles, crs):
+        tile_size = TILE_SIZES[crs]
+        return await asyncio.gather(*(self._fetch_tile(tile_bbox(tile, tile_size), crs) for tile in tiles),
+                                    return_exceptions=True)
+
+    def _cached(self, key):
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self._cache.move_to_end(key)
+            return cached[0]
+        return None
+
+    def _remember(self, key, items):
+        self._cache[key] = (items, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_tiles:
+            self._cache.popitem(last=False)
+
+    def _tile_items(self, tiles, crs):
+        """:return: Dictionary of tile -> list of compact items."""
+        found = {}
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for tile in tiles:
+                key = (crs, tile)
+                items = self._cached(key)
+                if items is not None:
+                    self.hits += 1
+                    found[tile] = items
+                elif key in self._inflight:
+                    waiting[tile] = self._inflight[key]
+                else:
+                    self.misses += 1
+                    owned[tile] = self._inflight[key] = Future()
+
+        if owned:
+            try:
+                results = asyncio.run_coroutine_threadsafe(self._fetch_tiles(list(owned), crs), self._get_loop()).result()
+            except BaseException as e:
+                results = [e] * len(owned)
+            for (tile, future), result in zip(owned.items(), results):
+                if isinstance(result, BaseException):
+                    logger.warning(f"STAC search of tile {tile} failed: {result}")
+                    future.set_exception(result)
+                    continue
+                items = [compact_item(feature) for feature in result if feature.get("id") not in EXCLUDED_IDS]
+                with self._lock:
+                    self._remember((crs, tile), items)
+                future.set_result(items)
+            with self._lock:
+                for tile in owned:
+                    del self._inflight[(crs, tile)]
+
+        # Raises the first failed fetch
+        for tile, future in {**owned, **waiting}.items():
+            found[tile] = future.result()
+        return found
+
+    def search(self, bbox, crs="4326"):
+        """
+        :param bbox: (minx, miny, maxx, maxy) in crs.
+        :param crs: "4326" for longitude/latitude or "25832".
+        :return: JSON text of a FeatureCollection of compact items whose footprint bounds
+            intersect the search.
+        :raises ValueError: If the bbox covers more than max_tiles_per_search cache tiles.
+        """
+        tiles = bbox_tiles(bbox, TILE_SIZES[crs])
+        if len(tiles) > self.max_tiles_per_search:
+            raise ValueError(f"bbox is too large, it covers {len(tiles)} tiles of at most {self.max_tiles_per_search}")
+
+        items = {}
+        for tile_items in self._tile_items(tiles, crs).values():
+            for item in tile_items:
+                # Tiles are searched whole, so items near the search can be outside it.
+                # The geometry is in the search CRS, unlike the item bbox
+                bounds = geometry_bounds(item["geometry"])
+                if item["id"] not in items and (bounds is None or intersects(bounds, bbox)):
+                    items[item["id"]] = item
+        return json.dumps({"type": "FeatureCollection", "numberReturned": len(items), "features": list(items.values())})
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
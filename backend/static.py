@@ -0,0 +1,146 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Vite writes content-hashed bundles like assets/index-YlcLidNE.js, which never change
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Already compressed formats gain nothing from gzip or brotli
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/wasm")
+MIN_COMPRESS_SIZE = 256
+
+
+class StaticAsset:
+    def __init__(self, path, data, content_type, immutable):
+        self.path = path
+        self.content_type = content_type
+        self.etag = hashlib.sha1(data).hexdigest()
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+        self.bodies = {None: data}
+
+    def body(self, accept_encoding):
+        """
+        Picks the smallest stored encoding the client accepts.
+
+        :return: Tuple (body, content_encoding). content_encoding is None for identity.
+        """
+        accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').lower().split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.bodies:
+                return self.bodies[encoding], encoding
+        return self.bodies[None], None
+
+
+class StaticManifest:
+    """
+    The built front end, read into memory once.
+
+    Every file under root is loaded at startup together with gzip and brotli variants,
+    so a request is a dictionary lookup. Variants written at build time by precompress()
+    are used as they are, otherwise they are compressed here at fast settings. Hashed bundles
+    are cached by browsers for a year, other files such as index.html are revalidated
+    with their ETag.
+    """
+
+    def __init__(self, root, index="index.html", brotli_quality=5, gzip_level=6):
+        self.root = root
+        self.index = index
+        self.brotli_quality = brotli_quality
+        self.gzip_level = gzip_level
+        self.assets = {}
+
+    def load(self):
+        assets = {}
+        raw_bytes = 0
+        if not os.path.isdir(self.root):
+            logger.warning(f"Static folder {self.root} not found, the front end is not served")
+            self.assets = assets
+            return self
+
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith((".gz", ".br")):
+                    continue
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                immutable = path.startswith("assets/") and HASHED_NAME.search(name) is not None
+                asset = StaticAsset(path, data, content_type, immutable)
+                if content_type.startswith(COMPRESSIBLE) and len(data) >= MIN_COMPRESS_SIZE:
+                    self._compress(asset, full_path, data)
+                assets[path] = asset
+                raw_bytes += len(data)
+
+        self.assets = assets
+        logger.info(f"Loaded {len(assets)} static files ({raw_bytes} bytes) from {self.root}")
+        return self
+
+    def _compress(self, asset, full_path, data):
+        if os.path.isfile(f"{full_path}.gz"):
+            with open(f"{full_path}.gz", 'rb') as f:
+                asset.bodies['gzip'] = f.read()
+        else:
+            asset.bodies['gzip'] = gzip.compress(data, self.gzip_level, mtime=0)
+        if os.path.isfile(f"{full_path}.br"):
+            with open(f"{full_path}.br", 'rb') as f:
+                asset.bodies['br'] = f.read()
+        elif brotli is not None:
+            asset.bodies['br'] = brotli.compress(data, quality=self.brotli_quality)
+
+    def get(self, path):
+        """
+        :return: The asset at path, index.html for paths of the single page app, or None.
+        """
+        asset = self.assets.get(path.lstrip("/"))
+        if asset is None and not path.startswith("assets/"):
+            asset = self.assets.get(self.index)
+        return asset
+
+
+def precompress(root, brotli_quality=11, gzip_level=9):
+    """
+    Writes maximally compressed .gz and .br files next to every compressible file under
+    root, for StaticManifest to pick up. Run after `npm run build`.
+
+    :return: Number of files compressed.
+    """
+    count = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith((".gz", ".br")):
+                continue
+            content_type = mimetypes.guess_type(name)[0] or ""
+            full_path = os.path.join(directory, name)
+            if not content_type.startswith(COMPRESSIBLE) or os.path.getsize(full_path) < MIN_COMPRESS_SIZE:
+                continue
+            with open(full_path, 'rb') as f:
+                data = f.read()
+            with open(f"{full_path}.gz", 'wb') as f:
+                f.write(gzip.compress(data, gzip_level, mtime=0))
+            if brotli is not None:
+                with open(f"{full_path}.br", 'wb') as f:
+                    f.write(brotli.compress(data, quality=brotli_quality))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import sys
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "dist"
+    print(f"Compressed {precompress(folder)} files in {folder}")
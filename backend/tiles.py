@@ -0,0 +1,307 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from backend.layers import table_version
+
+logger = logging.getLogger(__name__)
+
+# Plandata geometries are stored in EPSG:25832
+DATA_SRID = 25832
+
+# Tile grids: SRID, top left corner and the width of the single zoom 0 tile.
+# "3857" is the usual web mercator XYZ grid. "25832" has the origin and resolutions of
+# Dataforsyningen's Danish grid, with two coarser levels on top so zoom 0 is one tile
+TileGrid = namedtuple("TileGrid", ["srid", "origin_x", "origin_y", "size", "max_zoom"])
+TILE_GRIDS = {
+    "3857": TileGrid(3857, -20037508.342789244, 20037508.342789244, 40075016.68557849, 22),
+    "25832": TileGrid(25832, 120000.0, 6500000.0, 6553.6 * 256, 18),
+}
+
+# Denmark in EPSG:25832, used when seeding without bounds
+DENMARK_BOUNDS = (440000.0, 6049000.0, 900000.0, 6404000.0)
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Geometries are filtered through the spatial index, simplified to about one screen pixel
+# at the tile's zoom level and clipped to the tile by ST_AsMVTGeom
+TILE_QUERY = """
+    WITH bounds AS (
+        SELECT ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(srid)s) AS envelope
+    ),
+    features AS (
+        SELECT t.ogc_fid AS id, t.doklink, t.gml_id,
+               CASE
+                   WHEN t.ogc_fid %% 3 = 0 THEN 'red'
+                   WHEN t.ogc_fid %% 3 = 1 THEN 'blue'
+                   ELSE 'green'
+               END AS color,
+               ST_AsMVTGeom(
+                   ST_Simplify(ST_Transform(ST_CurveToLine(t.geometri), %(srid)s), %(tolerance)s, true),
+                   bounds.envelope, %(extent)s, %(buffer)s, true
+               ) AS geom
+        FROM plandata.{feature} t, bounds
+        WHERE t.geometri && ST_Transform(bounds.envelope, {data_srid})
+    )
+    SELECT ST_AsMVT(features.*, %(layer)s, %(extent)s, 'geom') FROM features WHERE geom IS NOT NULL
+"""
+
+Tile = namedtuple("Tile", ["data", "etag"])
+
+# Counted per tile in memory on top of its bytes, so the many empty tiles are bounded too
+TILE_OVERHEAD = 200
+
+
+def tile_bounds(grid, z, x, y):
+    """
+    Returns the bounds of a tile in the grid's CRS.
+
+    :return: Tuple (minx, miny, maxx, maxy).
+    """
+    size = grid.size / (1 << z)
+    minx = grid.origin_x + x * size
+    maxy = grid.origin_y - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(grid, z, bounds):
+    """
+    Returns the tiles at a zoom level that cover bounds given in the grid's CRS.
+
+    :return: Tuple (min_x, min_y, max_x, max_y), inclusive.
+    """
+    size = grid.size / (1 << z)
+    last = (1 << z) - 1
+    min_x = max(int((bounds[0] - grid.origin_x) // size), 0)
+    max_x = min(int((bounds[2] - grid.origin_x) // size), last)
+    min_y = max(int((grid.origin_y - bounds[3]) // size), 0)
+    max_y = min(int((grid.origin_y - bounds[1]) // size), last)
+    return min_x, min_y, max_x, max_y
+
+
+def get_grid(name):
+    grid = TILE_GRIDS.get(str(name))
+    if grid is None:
+        raise ValueError(f"Unknown tile grid {name}, use one of: {', '.join(TILE_GRIDS)}")
+    return grid
+
+
+def check_tile(grid, z, x, y):
+    if not 0 <= z <= grid.max_zoom:
+        raise ValueError(f"Zoom level must be between 0 and {grid.max_zoom}")
+    if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError(f"Tile {x}/{y} is outside zoom level {z}")
+
+
+def build_tile(db, feature, grid, z, x, y):
+    """
+    Renders one Mapbox Vector Tile with a single layer named after the feature.
+
+    :return: Tile bytes. Empty if no geometry touches the tile.
+    """
+    minx, miny, maxx, maxy = tile_bounds(grid, z, x, y)
+    params = {
+        'minx': minx, 'miny': miny, 'maxx': maxx, 'maxy': maxy, 'srid': grid.srid,
+        'tolerance': (maxx - minx) / 256,  # One pixel of a 256 pixel tile
+        'extent': TILE_EXTENT, 'buffer': TILE_BUFFER, 'layer': feature,
+    }
+    with db.cursor() as cur:
+        cur.execute(TILE_QUERY.format(feature=feature, data_srid=DATA_SRID), params)
+        row = cur.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+class TileCache:
+    """
+    Vector tiles per plandata layer, kept in memory and on disk.
+
+    Both levels are bounded by size and drop the least recently used tiles first. Tiles on
+    disk are stored as <cache_dir>/<feature>/<grid>/<z>/<x>/<y>.mvt, next to a version
+    file with the table's write counters. When a table changes, or its tiles are older than
+    ttl, all tiles of the layer are dropped.
+    """
+
+    def __init__(self, db, layers, cache_dir="tile_cache", memory_bytes=64 << 20, disk_bytes=1 << 30,
+                 ttl=86400, check_interval=60, builder=build_tile):
+        self.db = db
+        self.layers = layers
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.builder = builder
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _feature_dir(self, feature):
+        return os.path.join(self.cache_dir, feature)
+
+    def _tile_path(self, feature, grid_name, z, x, y):
+        return os.path.join(self.cache_dir, feature, grid_name, str(z), str(x), f"{y}.mvt")
+
+    def _check_version(self, feature):
+        """Drops the layer's tiles if its table changed or they expired. Checked at most every check_interval."""
+        now = time.monotonic()
+        checked = self._versions.get(feature)
+        if checked is not None and now - checked[1] < self.check_interval:
+            return
+        version = repr(table_version(self.db, feature))
+        version_path = os.path.join(self._feature_dir(feature), "version")
+        stored = None
+        try:
+            with open(version_path, 'r') as f:
+                stored = f.read()
+            expired = time.time() - os.path.getmtime(version_path) > self.ttl
+        except OSError:
+            expired = False
+
+        if stored is not None and (stored != version or expired):
+            logger.info(f"Dropping cached tiles of {feature}")
+            self.invalidate(feature)
+        if stored is None or stored != version or expired:
+            os.makedirs(self._feature_dir(feature), exist_ok=True)
+            with open(version_path, 'w') as f:
+                f.write(version)
+        self._versions[feature] = (version, now)
+
+    def _remember(self, key, tile):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= len(previous.data) + TILE_OVERHEAD
+            self._memory[key] = tile
+            self._memory_size += len(tile.data) + TILE_OVERHEAD
+            while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted.data) + TILE_OVERHEAD
+
+    def _scan_disk(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".mvt"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _store(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_size += len(data)
+            if self._disk_size <= self.disk_bytes:
+                return
+            # Evict down to 90% of the limit, so eviction doesn't run on every write
+            files = sorted(self._scan_disk())
+            self._disk_size = sum(size for _, size, _ in files)
+            for _, size, old_path in files:
+                if self._disk_size <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(old_path)
+                    self._disk_size -= size
+                except OSError:
+                    pass
+
+    def get(self, feature, z, x, y, grid_name="3857"):
+        """
+        Returns a tile, from memory, disk or the database.
+
+        :param feature: Table or view name in the plandata schema.
+        :param grid_name: Key of TILE_GRIDS.
+        :return: Tile, or None if the layer doesn't exist.
+        :raises ValueError: If the grid or tile coordinates are invalid.
+        """
+        grid = get_grid(grid_name)
+        check_tile(grid, z, x, y)
+        if feature not in self.layers.layer_names() and feature not in self.layers.layer_names(refresh=True):
+            return None
+
+        self._check_version(feature)
+        key = (feature, grid_name, z, x, y)
+        with self._lock:
+            tile = self._memory.get(key)
+            if tile is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return tile
+
+        path = self._tile_path(feature, grid_name, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Marks the tile as recently used for disk eviction
+            self.disk_hits += 1
+        except OSError:
+            data = self.builder(self.db, feature, grid, z, x, y)
+            self.misses += 1
+            try:
+                self._store(path, data)
+            except OSError as e:
+                logger.warning(f"Could not write tile {path}: {e}")
+
+        tile = Tile(data, hashlib.sha1(data).hexdigest())
+        self._remember(key, tile)
+        return tile
+
+    def invalidate(self, feature=None):
+        with self._lock:
+            for key in [key for key in self._memory if feature is None or key[0] == feature]:
+                self._memory_size -= len(self._memory.pop(key).data) + TILE_OVERHEAD
+            self._disk_size = None
+        if feature is None:
+            self._versions.clear()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        else:
+            self._versions.pop(feature, None)
+            shutil.rmtree(self._feature_dir(feature), ignore_errors=True)
+
+    def seed(self, features, min_zoom, max_zoom, bounds=DENMARK_BOUNDS, grid_name="3857"):
+        """
+        Renders every tile covering bounds for a range of zoom levels ahead of use.
+
+        :param features: Layer names.
+        :param bounds: (minx, miny, maxx, maxy) in EPSG:25832.
+        :return: Number of tiles seeded.
+        """
+        grid = get_grid(grid_name)
+        if grid.srid != DATA_SRID:
+            from pyproj import Transformer
+
+            transformer = Transformer.from_crs(DATA_SRID, grid.srid, always_xy=True)
+            bounds = transformer.transform_bounds(*bounds)
+
+        count = 0
+        for feature in features:
+            for z in range(min_zoom, max_zoom + 1):
+                min_x, min_y, max_x, max_y = tile_range(grid, z, bounds)
+                for x in range(min_x, max_x + 1):
+                    for y in range(min_y, max_y + 1):
+                        if self.get(feature, z, x, y, grid_name) is None:
+                            raise ValueError(f"Unknown layer {feature}")
+                        count += 1
+                logger.info(f"Seeded {feature} zoom {z}: {(max_x - min_x + 1) * (max_y - min_y + 1)} tiles")
+        return count
@@ -0,0 +1,58 @@
+import os
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from backend.db import Database
+from backend.migrations import create_indexes
+from backend import plandata, polygons
+
+# Same environment files as postgress_connector.py
+if os.path.exists("/var/www/skraafoto/.env"):
+    load_dotenv(dotenv_path="/var/www/skraafoto/.env")
+elif os.path.exists(".env.flask"):
+    load_dotenv(dotenv_path=".env.flask")
+else:
+    load_dotenv()
+
+# Indexes per part of the API
+INDEXES = {
+    "plandata": plandata.INDEXES,
+    "polygons": polygons.INDEXES,
+}
+
+parser = argparse.ArgumentParser(prog='create_indexes',
+                                 description="Creates the indexes the API relies on, without blocking writes. "
+                                             "Run after deploying and after loading plandata")
+parser.add_argument("parts", nargs="*",
+                    help=f"Parts of the API to create indexes for: {', '.join(sorted(INDEXES))} or all. "
+                         f"Defaults to all")
+
+
+def parse_parts(argv=None):
+    """:return: The parts to create indexes for, in a stable order."""
+    args = parser.parse_args(argv)
+    unknown = [part for part in args.parts if part != "all" and part not in INDEXES]
+    if unknown:
+        parser.error(f"unknown parts: {', '.join(unknown)}, choose from {', '.join(sorted(INDEXES))} or all")
+    if not args.parts or "all" in args.parts:
+        return sorted(INDEXES)
+    return sorted(set(args.parts))
+
+
+def main():
+    parts = parse_parts()
+    logging.basicConfig(level=logging.INFO)
+
+    # One connection without the API's statement timeout, as indexing a large table takes a while
+    db = Database.from_env(min_connections=1, max_connections=1, statement_timeout_ms=0)
+    try:
+        for part in parts:
+            created = create_indexes(db, INDEXES[part])
+            logging.info(f"{part}: created {len(created)} of {len(INDEXES[part])} indexes")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
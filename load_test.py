@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+from dotenv import load_dotenv
+
+from backend.db import Database, DatabaseUnavailable
+from backend.loadtest import SCENARIOS, Scale, seed_database, seeded_scale, cleanup, run_load, format_report
+
+# Same environment files as postgress_connector.py, for a local database to seed
+if os.path.exists(".env.flask"):
+    load_dotenv(dotenv_path=".env.flask")
+else:
+    load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+POSTGIS_IMAGE = "postgis/postgis:16-3.4"
+CONTAINER = "skraafoto-loadtest"
+
+parser = argparse.ArgumentParser(prog='load_test',
+                                 description="Seeds a local PostGIS with synthetic plandata and measures the API under increasing concurrency")
+parser.add_argument("--docker", action="store_true", help=f"Start a throwaway {POSTGIS_IMAGE} container instead of using the database in .env.flask")
+parser.add_argument("--keep", action="store_true", help="Leave the container running after the test")
+parser.add_argument("--db-port", type=int, default=55432, help="Host port of the container, default 55432")
+parser.add_argument("--plans", type=int, default=1000, help="Synthetic plans per plan table, default 1000")
+parser.add_argument("--addresses", type=int, default=10, help="Addresses per plan, default 10")
+parser.add_argument("--vertices", type=int, default=64, help="Vertices per plan polygon, default 64")
+parser.add_argument("--skip-seed", action="store_true", help="Reuse data from an earlier run")
+parser.add_argument("--url", help="Test an API that is already running, e.g. http://localhost:5000, instead of starting the Flask app")
+parser.add_argument("--endpoints", default=",".join(SCENARIOS), help=f"Comma separated, default {','.join(SCENARIOS)}")
+parser.add_argument("--concurrency", default="1,4,16,64", help="Comma separated concurrency levels, default 1,4,16,64")
+parser.add_argument("--duration", type=float, default=15, help="Seconds per endpoint and concurrency level, default 15")
+parser.add_argument("--port", type=int, default=5055, help="Port of the Flask app started for the test, default 5055")
+parser.add_argument("--output", help="Also write the results as JSON to this file")
+
+
+def start_container(port, password):
+    subprocess.run(["docker", "rm", "-f", CONTAINER], capture_output=True)
+    subprocess.run(["docker", "run", "-d", "--name", CONTAINER, "-p", f"127.0.0.1:{port}:5432",
+                    "-e", f"POSTGRES_PASSWORD={password}", POSTGIS_IMAGE], check=True, capture_output=True)
+
+
+def wait_for_database(db, timeout=120):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with db.cursor() as cur:
+                cur.execute("SELECT 1")
+            return
+        except DatabaseUnavailable:
+            if time.monotonic() > deadline:
+                raise
+            db.close()
+            time.sleep(1)
+
+
+def start_api(port, params):
+    """Runs the Flask app on the synthetic database in a child process."""
+    env = dict(os.environ,
+               VITE_DB=params['database'], VITE_DB_USER=params['user'], VITE_DB_HOST=params['host'],
+               VITE_DB_PASSWORD=params['password'], VITE_DB_PORT=str(params['port']),
+               WARM_LAYERS="", TILE_CACHE_DIR=tempfile.mkdtemp(prefix="loadtest_tiles_"))
+    process = subprocess.Popen([sys.executable, "-m", "flask", "--app", "postgress_connector", "run",
+                                "--port", str(port), "--with-threads", "--no-reload", "--no-debugger"],
+                               cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2):
+                return process, url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise SystemExit("The Flask app did not start")
+            time.sleep(0.5)
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}")
+    concurrency_levels = sorted(int(level) for level in args.concurrency.split(","))
+
+    if args.docker:
+        params = {'database': "postgres", 'user': "postgres", 'host': "127.0.0.1",
+                  'password': "loadtest", 'port': args.db_port}
+        start_container(args.db_port, params['password'])
+    else:
+        params = Database.from_env().params
+    db = Database(params, max_connections=2)
+    api = None
+    try:
+        wait_for_database(db)
+        if args.skip_seed:
+            scale = seeded_scale(db)
+            if scale is None:
+                raise SystemExit("The database has not been seeded by the load test")
+        else:
+            seed_database(db, plans=args.plans, addresses=args.addresses, vertices=args.vertices)
+            scale = Scale(args.plans, args.addresses)
+
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            api, url = start_api(args.port, params)
+        results = asyncio.run(run_load(url, endpoints, concurrency_levels, args.duration, scale))
+
+        print(f"\n{scale.plans} plans per table, {scale.plans * scale.addresses} addresses, "
+              f"{args.duration:g} s per stage against {url}\n")
+        print(format_report(results))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'plans': scale.plans, 'addresses': scale.addresses, 'duration': args.duration,
+                           'results': [result.as_dict() for result in results]}, f, indent=2)
+        cleanup(db)
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait()
+        db.close()
+        if args.docker and not args.keep:
+            subprocess.run(["docker", "rm", "-f", CONTAINER], capture_output=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
-import json
 import os
+import sys
+import time
 import logging
-from pathlib import Path
-from pyproj import CRS, Proj, transform
+import threading
 
-from flask import Flask, request, jsonify, Response, send_from_directory
+from flask import Flask, request, jsonify, Response, g
 from flask_compress import Compress
 from flask_cors import CORS
-import gzip
-import psycopg2 # type: ignore
 from dotenv import load_dotenv
 
+from backend.db import Database, DatabaseUnavailable
+from backend.polygons import classify_points, insert_polygons, iter_json_array, INDEXES as POLYGON_INDEXES
+from backend.layers import LayerCache, open_stream
+from backend.tiles import TileCache
+from backend.generalise import ZoomBands, parse_bbox, parse_resolution
+from backend.plandata import PlandataLookup, INDEXES as PLANDATA_INDEXES
+from backend.static import StaticManifest
+from backend.stac_search import StacSearch, DEFAULT_API_URL, parse_bbox as parse_stac_bbox
+from backend.metrics import Metrics
+from backend.migrations import check_indexes
+
 # Load environment variables - use different files for development vs production
 if os.path.exists("/var/www/skraafoto/.env"):
     # Production environment
@@ -22,15 +31,17 @@ else:
     # Fallback to default .env
     load_dotenv()
 
-wgs84 = CRS('epsg:4326')  # WGS84
-etrs89_utm32n = CRS('epsg:25832')  # ETRS89 / UTM zone 32N
+# The crop engine lives in python/downloader
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "python"))
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-app = Flask(__name__, static_folder="dist", static_url_path="")
+# The front end is served from an in-memory manifest instead of Flask's static route
+app = Flask(__name__, static_folder=None)
 Compress(app)
 app.config["DEBUG"] = True
 CORS(app)
@@ -40,46 +51,79 @@ CORS(app)
 def health_check():
     return jsonify({'status': 'ok', 'message': 'Flask app is running'}), 200
 
-# Database connection with retry logic
-def get_db_connection():
-    dbconn = {'database': os.getenv("VITE_DB"),
-              'user': os.getenv("VITE_DB_USER"),
-              'host': os.getenv("VITE_DB_HOST"),
-              'password': os.getenv("VITE_DB_PASSWORD"),
-              'port': os.getenv("VITE_DB_PORT")}
-    
-    try:
-        conn = psycopg2.connect(**dbconn)
-        return conn
-    except psycopg2.DatabaseError as e:
-        logger.error(f"Database connection error: {e}")
-        logger.error(f"Connection params: {dbconn}")
-        return None
-
-# Initialize database connection
-try:
-    postgress_connector = get_db_connection()
-    if postgress_connector:
-        pg_cur = postgress_connector.cursor()
-    else:
-        pg_cur = None
-        logger.warning("Database connection failed, some endpoints may not work")
-except Exception as e:
-    logger.error(f"Database initialization error: {e}")
-    pg_cur = None
-
-if __name__ == '__main__':
-    app.run("0.0.0.0", port="5000", debug=True)
+# Latency, response size, query and cache metrics for Prometheus
+metrics = Metrics(slow_query_ms=int(os.getenv("DB_SLOW_QUERY_MS", 500)))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), status=200, mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_start' in g:
+        # The route pattern, not the path, so /toggle/<feature> is one series
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        # Streamed responses have no length up front and are left out of the size histogram
+        metrics.observe_request(route, request.method, response.status_code,
+                                time.perf_counter() - g.request_start, response.content_length)
+    return response
+
+# Pooled database connections, checked out per request. Every statement is timed
+db = Database.from_env()
+db.observer = metrics.observe_query
+
+# Serialized, precompressed /toggle layers. WARM_LAYERS is a comma separated list of layers, or "all"
+LAYER_MAX_AGE = int(os.getenv("LAYER_MAX_AGE", 60))
+layer_cache = LayerCache(db,
+                         check_interval=int(os.getenv("LAYER_CHECK_INTERVAL", 60)),
+                         ttl=int(os.getenv("LAYER_TTL", 3600)))
+layer_cache.warm_in_background([name.strip() for name in os.getenv("WARM_LAYERS", "").split(",") if name.strip()])
+
+# Plans per address, cached by normalised address
+plandata_lookup = PlandataLookup(db, max_entries=int(os.getenv("PLANDATA_CACHE_SIZE", 1024)),
+                                 ttl=int(os.getenv("LAYER_TTL", 3600)))
+# The indexes are created by create_indexes.py, the app only warns when they are missing
+check_indexes(db, PLANDATA_INDEXES, "address lookups")
+check_indexes(db, POLYGON_INDEXES, "polygon collections")
+
+# Simplified copies of the layers for zoomed out /toggle requests, built by refresh_zoom_bands.py.
+# Bands of view layers are used for ZOOM_BAND_MAX_AGE seconds after a refresh
+zoom_bands = ZoomBands(db, check_interval=int(os.getenv("LAYER_CHECK_INTERVAL", 60)),
+                       max_age=int(os.getenv("ZOOM_BAND_MAX_AGE", 86400)))
+
+# Vector tiles of the same layers, cached in memory and on disk
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", 3600))
+tile_cache = TileCache(db, layer_cache,
+                       cache_dir=os.getenv("TILE_CACHE_DIR", os.path.join(BASE_DIR, "tile_cache")),
+                       memory_bytes=int(os.getenv("TILE_CACHE_MEMORY_MB", 64)) << 20,
+                       disk_bytes=int(os.getenv("TILE_CACHE_DISK_MB", 1024)) << 20,
+                       ttl=int(os.getenv("TILE_TTL", 86400)),
+                       check_interval=int(os.getenv("LAYER_CHECK_INTERVAL", 60)))
+
+metrics.register_cache("layers", layer_cache)
+metrics.register_cache("plandata", plandata_lookup)
+metrics.register_cache("tiles", tile_cache)
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    logger.error(f"Database unavailable: {e}")
+    return jsonify({'status': 'error', 'message': str(e)}), 503
 
 @app.route('/in_polygon/<point_string>/<polygon_string>', methods=['GET'])
 def in_polygon(point_string, polygon_string):
-    logger.info(f"point: {point_string}")
-    logger.info(f"polygon: {polygon_string}")
     try:
         point = point_string.strip('()').replace(",", " ")
         pointList = [float(point) for point in polygon_string.strip('[]').replace("(", "").replace(")", "").split(",")]
         tupleList = list(zip(pointList[::2], pointList[1::2]))
+        # Only the size of the polygon, the coordinates themselves can run to megabytes
+        logger.debug(f"in_polygon: point {point}, polygon of {len(tupleList)} points")
         return is_in_polygon(point, tupleList)
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error processing in_polygon request: {e}")
         return jsonify({'status': 'error', 'message': 'An error occurred while processing the request.'}), 405
@@ -91,9 +135,12 @@ def is_in_polygon(point, polygon):
                """
         polyString = ",".join(f"{x} {y}" for x, y in polygon)
         query = query.format(point, polyString)
-        pg_cur.execute(query)
-        data = pg_cur.fetchall()
+        with db.cursor() as cur:
+            cur.execute(query)
+            data = cur.fetchall()
         return jsonify(data)
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error executing is_in_polygon query: {e}")
         return jsonify({'status': 'error', 'message': 'An error occurred while querying the database.'}), 500
@@ -106,197 +153,232 @@ def add_polygon_collection(collection_name):
         logger.warning(message)
         return jsonify({'status': 'error', 'message': message}), 409
     
-    # Process the request
+    # Process the request. The body is a JSON array of rings, read one ring at a time
     try:
-        polygons = request.json
-        logger.info(f"Polygons data: {polygons}")
-        logger.info(f"Collection name: {collection_name}")
-        
-        insert_polygon(collection_name, polygons)
-        
-        return jsonify({'status': 'success', 'message': 'Polygon collection added successfully.'}), 201
+        count = insert_polygons(db, collection_name, iter_json_array(request.stream))
+        logger.info(f"Added {count} polygons to collection {collection_name}")
+
+        return jsonify({'status': 'success', 'message': 'Polygon collection added successfully.', 'count': count}), 201
+    except DatabaseUnavailable:
+        raise
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Invalid polygons: {e}'}), 400
     except Exception as e:
         logger.error(f"Error inserting polygon collection: {e}")
         return jsonify({'status': 'error', 'message': 'An error occurred while adding the polygon collection.'}), 500
 
 
+@app.route('/in_polygon_collection/<collection_name>', methods=['POST'])
+def in_polygon_collection(collection_name):
+    # Body: {"points": [[x, y], ...]} in EPSG:25832. Returns 1/0 per point, in order
+    max_points = int(os.getenv("MAX_BATCH_POINTS", 100000))
+    try:
+        points = (request.get_json(silent=True) or {}).get('points')
+        if not isinstance(points, list) or not all(isinstance(p, (list, tuple)) and len(p) == 2 for p in points):
+            return jsonify({'status': 'error', 'message': 'Expected a JSON body with "points": [[x, y], ...].'}), 400
+        if len(points) > max_points:
+            return jsonify({'status': 'error', 'message': f'At most {max_points} points per request.'}), 413
+        if not is_collection_present(collection_name):
+            return jsonify({'status': 'error', 'message': f"Collection '{collection_name}' not found."}), 404
+
+        inside = classify_points(db, collection_name, points)
+        return jsonify({'collection': collection_name, 'count': len(inside), 'inside': [int(i) for i in inside]})
+    except DatabaseUnavailable:
+        raise
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid points: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error processing in_polygon_collection request: {e}")
+        return jsonify({'status': 'error', 'message': 'An error occurred while querying the database.'}), 500
+
 def is_collection_present(collection_name):
      # Query to check for the existence of the collection_name
     query = "SELECT EXISTS (SELECT 1 FROM skraafoto.polygons WHERE group_name = %s);"
-    pg_cur.execute(query, (collection_name,))
-        
-    # Fetch the result
-    exists = pg_cur.fetchone()[0]
+    with db.cursor() as cur:
+        cur.execute(query, (collection_name,))
 
-    return exists
+        # Fetch the result
+        exists = cur.fetchone()[0]
 
-def insert_polygon(collection_name, polygons):
-    polygons_string = "ST_MPolyFromText(\'MULTIPOLYGON(("
-    for polygon in polygons:
-        polygon_string = "("
-        for point in polygon:
-            transformed_point = transform(etrs89_utm32n, wgs84, point[0], point[1])
-            polygon_string += f"{transformed_point[0]} {transformed_point[1]},"
-        polygon_string = polygon_string[:-1]
-        polygon_string += ")"
-        polygons_string += polygon_string + ","
-    polygons_string = polygons_string[:-1]
-    polygons_string += "))\')"
-    logger.info(f"polygons as part of postgis insert string:{polygons_string}")
-    insert = f"""
-                INSERT INTO skraafoto.polygons (group_name, multi_polygon)
-                VALUES ('{collection_name}', {polygons_string});
-             """
-    logger.info(insert)
-    pg_cur.execute(insert)
-    postgress_connector.commit()
+    return exists
 
 @app.route('/get_plandata/<address>')
 def get_plandata(address):
-    if pg_cur is None:
-        return jsonify({
-            'status': 'error', 
-            'message': 'Database not available. Please start PostgreSQL server.'
-        }), 503
-    
-    # TODO: input validation, currently u can proboly sql inject
     try:
-        query_komuneplan = f"""
-                           SELECT id,doklink, gml_id, ST_AsGeoJSON(ST_CurveToLine(geometri))
-                           FROM plandata.theme_pdk_kommuneplan_oversigt_vedtaget_v kv 
-                           WHERE id = (SELECT plan_id FROM plandata.komuneplan_for_adresse k WHERE k.adgangsadressebetegnelse LIKE '%{address}%' limit 1)
-                           union 
-                           SELECT id,doklink, gml_id, ST_AsGeoJSON(ST_CurveToLine(geometri))
-                           FROM plandata.theme_pdk_kommuneplan_oversigt_forslag_v kf 
-                           WHERE  id = (SELECT plan_id FROM plandata.komuneplan_for_adresse k WHERE k.adgangsadressebetegnelse LIKE '%{address}%' limit 1)
-                           """
-        query_lokalplan = f"""
-                           SELECT id,doklink, gml_id, ST_AsGeoJSON(ST_CurveToLine(geometri))
-                           FROM plandata.theme_pdk_lokalplan_vedtaget_v lv 
-                           WHERE  id = (SELECT plan_id FROM plandata.lokalplan_for_adresse l WHERE l.adgangsadressebetegnelse LIKE '%{address}%' limit 1)
-                           union 
-                           SELECT id,doklink, gml_id, ST_AsGeoJSON(ST_CurveToLine(geometri))
-                           FROM plandata.theme_pdk_lokalplan_forslag_v lf 
-                           WHERE  id = (SELECT plan_id FROM plandata.lokalplan_for_adresse l WHERE l.adgangsadressebetegnelse LIKE '%{address}%' limit 1)
-                           """
-        
-        pg_cur.execute(query_komuneplan)
-        komuneplan_data = pg_cur.fetchone()
-        pg_cur.execute(query_lokalplan)
-        lokalplan_data  = pg_cur.fetchone()
-
-        # Create GeoJSON Feature Collection with color property
-        komune_geojson_features = []
-        if(komuneplan_data):
-            komune_geojson_features.append({
-                "type": "Feature",
-                "properties": {
-                    "id": komuneplan_data[0],
-                    "doklink": komuneplan_data[1],
-                    "gml_id": komuneplan_data[2],
-                    
-                },
-                "geometry": json.loads(komuneplan_data[3])  # Geometry remains in EPSG:25832
-            })
-        komune_geojson = {
-            "type": "FeatureCollection",
-            "features": komune_geojson_features
-        }
-
-        # Create GeoJSON Feature Collection for lokalplans
-        lokal_geojson_features = []
-        if(lokalplan_data):
-            lokal_geojson_features.append({
-                "type": "Feature",
-                "properties": {
-                    "id": lokalplan_data[0],
-                    "doklink": lokalplan_data[1],
-                    "gml_id": lokalplan_data[2],
-                },
-                "geometry": json.loads(lokalplan_data[3])  # Geometry remains in EPSG:25832
-            })
-
-        lokal_geojson = {
-            "type": "FeatureCollection",
-            "features": lokal_geojson_features
-        }
+        body = plandata_lookup.get(address)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
-        logger.error(f"Error executing is_in_polygon query: {e}")
+        logger.error(f"Error executing get_plandata query: {e}")
         return jsonify({'status': 'error', 'message': 'An error occurred while querying the database.'}), 500
-    
-    return jsonify({'komuneplan': komune_geojson, 'lokalplan':lokal_geojson})
+
+    # The FeatureCollections are built by PostGIS and passed through as text
+    return Response(body, status=200, mimetype='application/json')
 
 @app.route('/toggle/<feature>', methods=['GET'])
 def toggle_feature(feature):
-    if pg_cur is None:
-        return jsonify({
-            'status': 'error', 
-            'message': 'Database not available. Please start PostgreSQL server.'
-        }), 503
-    
+    if 'bbox' in request.args or 'resolution' in request.args:
+        return toggle_viewport(feature)
     try:
-        # Query to fetch geometries and their attributes, ensuring EPSG:25832 projection
-        query = f"""
-            SELECT ogc_fid, doklink, gml_id, ST_AsGeoJSON(ST_CurveToLine(geometri)) AS geometry,
-                   CASE
-                       WHEN ogc_fid % 3 = 0 THEN 'red'
-                       WHEN ogc_fid % 3 = 1 THEN 'blue'
-                       WHEN ogc_fid % 3 = 2 THEN 'green'
-                       WHEN ogc_fid % 3 = 3 THEN 'yellow'
-                       WHEN ogc_fid % 3 = 4 THEN 'purple'
-                       ELSE 'orange'
-                   END AS color
-            FROM plandata.{feature}
-        """
-        pg_cur.execute(query)
-        data = pg_cur.fetchall()
-
-        # Check if data was retrieved
-        if not data:
+        accept_encoding = request.headers.get('Accept-Encoding')
+        layer, stream, encoding = layer_cache.open(feature, accept_encoding)
+        if layer is None and stream is None:
             return jsonify({'status': 'error', 'message': f'No data found for feature: {feature}'}), 404
 
-        # Create GeoJSON Feature Collection with color property
-        geojson_features = []
-        for row in data:
-            geojson_features.append({
-                "type": "Feature",
-                "properties": {
-                    "id": row[0],
-                    "doklink": row[1],
-                    "gml_id": row[2],
-                    "color": row[4]  # Correct column index for color
-                },
-                "geometry": json.loads(row[3])  # Geometry remains in EPSG:25832
-            })
-
-        geojson = {
-            "type": "FeatureCollection",
-            "features": geojson_features
-        }
-
-        # Serialize and compress response
-        geojson_str = json.dumps(geojson)
-        compressed = gzip.compress(geojson_str.encode('utf-8'))
-
-        return Response(
-            compressed,
-            status=200,
-            mimetype='application/json',
-            headers={'Content-Encoding': 'gzip'}
-        )
+        headers = {'Cache-Control': f'public, max-age={LAYER_MAX_AGE}', 'Vary': 'Accept-Encoding'}
+        if stream is not None:
+            # Not cached yet: stream the features while the database sends them
+            if encoding:
+                headers['Content-Encoding'] = encoding
+            return Response(stream, status=200, mimetype='application/json', headers=headers)
+
+        if request.if_none_match.contains(layer.etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(layer.etag)
+            return response
+
+        body, encoding = layer.body(accept_encoding)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        response = Response(body, status=200, mimetype='application/json', headers=headers)
+        response.set_etag(layer.etag)
+        return response
+
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        app.logger.error(f"Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def toggle_viewport(feature):
+    """
+    /toggle/<feature>?bbox=minx,miny,maxx,maxy&resolution=m_per_px returns only the features
+    in the viewport (EPSG:25832), simplified for the resolution. Not cached, as viewports rarely repeat.
+    """
+    try:
+        bbox = parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+        resolution = parse_resolution(request.args['resolution']) if 'resolution' in request.args else None
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    try:
+        if feature not in layer_cache.layer_names() and feature not in layer_cache.layer_names(refresh=True):
+            return jsonify({'status': 'error', 'message': f'No data found for feature: {feature}'}), 404
+        stream = open_stream(zoom_bands.chunks(feature, bbox, resolution))
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         app.logger.error(f"Error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    if stream is None:
+        stream = iter([b'{"type": "FeatureCollection", "features": []}'])
+    return Response(stream, status=200, mimetype='application/json', headers={'Vary': 'Accept-Encoding'})
+
+@app.route('/tiles/<feature>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def vector_tile(feature, z, x, y):
+    """Mapbox Vector Tile of a plandata layer. ?grid=25832 selects the Danish tile grid instead of web mercator."""
+    try:
+        tile = tile_cache.get(feature, z, x, y, request.args.get('grid', '3857'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        app.logger.error(f"Error rendering tile {feature}/{z}/{x}/{y}: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    if tile is None:
+        return jsonify({'status': 'error', 'message': f'No data found for feature: {feature}'}), 404
+
+    headers = {'Cache-Control': f'public, max-age={TILE_MAX_AGE}'}
+    if not tile.data:
+        return Response(status=204, headers=headers)
+    response = Response(tile.data, status=200, mimetype='application/vnd.mapbox-vector-tile', headers=headers)
+    response.set_etag(tile.etag)
+    return response.make_conditional(request)
+
+# Bbox search of the STAC API for the viewer, cached per tile of about a kilometre
+STAC_MAX_AGE = int(os.getenv("STAC_MAX_AGE", 300))
+stac_search = StacSearch(os.getenv("api_baseurl") or DEFAULT_API_URL, os.getenv("api_token"),
+                         ttl=int(os.getenv("STAC_CACHE_TTL", 3600)),
+                         max_tiles=int(os.getenv("STAC_CACHE_TILES", 2048)))
+metrics.register_cache("stac", stac_search)
+
+@app.route('/stac_search', methods=['GET'])
+def search_stac():
+    # ?bbox=minx,miny,maxx,maxy, in longitude/latitude or with &crs=25832
+    try:
+        crs = request.args.get('crs', '4326')
+        body = stac_search.search(parse_stac_bbox(request.args.get('bbox'), crs), crs)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching STAC items: {e}")
+        return jsonify({'status': 'error', 'message': 'An error occurred while searching for images.'}), 502
+    return Response(body, status=200, mimetype='application/json',
+                    headers={'Cache-Control': f'public, max-age={STAC_MAX_AGE}'})
+
+crop_service = None
+crop_service_lock = threading.Lock()
+
+def get_crop_service():
+    # Created on first use, so the app starts without reading settings or opening sessions
+    global crop_service
+    with crop_service_lock:
+        if crop_service is None:
+            from downloader import Config, CropService
+            config = Config.load(
+                os.path.join(BASE_DIR, "python", "settings.yaml"),
+                cache_dir=os.getenv("CROP_CACHE_DIR", os.path.join(BASE_DIR, "python", "image_cache"))
+            )
+            crop_service = CropService(config, max_entries=int(os.getenv("CROP_CACHE_ENTRIES", 256)))
+            metrics.register_cache("crops", crop_service)
+        return crop_service
+
+@app.route('/crop/<x>/<y>/<direction>/<int:size>', methods=['GET'])
+def crop(x, y, direction, size):
+    try:
+        point = (float(x), float(y))
+        # ?collection= picks one of the collections in settings.yaml, defaults to the first
+        result = get_crop_service().get_crop(point, direction, size, request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching crop for {x}, {y}, {direction}, {size}: {e}")
+        return jsonify({'status': 'error', 'message': 'An error occurred while fetching the image.'}), 502
+
+    if result is None:
+        return jsonify({'status': 'error', 'message': f'No {direction} image found for {x}, {y}'}), 404
+
+    response = Response(result.data, status=200, mimetype='image/jpeg')
+    response.set_etag(result.etag)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response.make_conditional(request)
+
+static_assets = StaticManifest(os.getenv("STATIC_DIR", os.path.join(BASE_DIR, "dist"))).load()
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react_app(path):
-    static_folder = Path(app.static_folder or "dist")
-    requested_path = static_folder / path
-
-    if path and requested_path.is_file():
-        return send_from_directory(app.static_folder, path)
-
-    return send_from_directory(app.static_folder, 'index.html')
+    asset = static_assets.get(path)
+    if asset is None:
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+
+    headers = {'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(asset.etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(asset.etag)
+        return response
+
+    body, encoding = asset.body(request.headers.get('Accept-Encoding'))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    response = Response(body, status=200, mimetype=asset.content_type, headers=headers)
+    response.set_etag(asset.etag)
+    return response
 
+if __name__ == '__main__':
+    app.run("0.0.0.0", port="5000", debug=True)
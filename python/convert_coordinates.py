@@ -0,0 +1,42 @@
+import time
+import argparse
+
+from downloader import Config, configure_logging
+from downloader.projection import WGS84, ETRS89_UTM32N, convert_file
+
+parser = argparse.ArgumentParser(prog='convert_coordinates',
+                                 description="Converts coordinate files between EPSG:4326 and EPSG:25832, "
+                                             "by default into the format download_from_coordinates reads")
+parser.add_argument("input", help="Coordinate file (.txt, .csv, .geojson, .parquet or .npy)")
+parser.add_argument("output", help="Output file, .txt for 'x y' lines, .csv or .npy")
+parser.add_argument("--source", type=str, default=WGS84, help=f"CRS of the input, defaults to {WGS84}")
+parser.add_argument("--target", type=str, default=ETRS89_UTM32N, help=f"CRS of the output, defaults to {ETRS89_UTM32N}")
+parser.add_argument("--inverse", action="store_true", help=f"Convert from {ETRS89_UTM32N} to {WGS84} instead")
+parser.add_argument("--lat-first", action="store_true", help="The input has latitude before longitude, or y before x")
+parser.add_argument("--format", type=str, help="Read the input as this format instead of guessing from the extension")
+parser.add_argument("--output-format", type=str, help="Write the output as this format instead of guessing from the extension")
+parser.add_argument("--x-column", type=str, help="Name of the x/longitude column in CSV/Parquet files")
+parser.add_argument("--y-column", type=str, help="Name of the y/latitude column in CSV/Parquet files")
+parser.add_argument("--id-column", type=str, help="Name of the point id column (CSV/Parquet) or property (GeoJSON)")
+parser.add_argument("--precision", type=int, help="Decimals in text output")
+parser.add_argument("--chunk-size", type=int, default=100_000, help="Number of points converted at a time")
+parser.add_argument("-s", "--settings", type=str, default="settings.yaml", help="Path to the settings file")
+
+
+def main():
+    args = parser.parse_args()
+    config = Config.load(args.settings)
+    configure_logging(config.logging_level)
+
+    source, target = (args.target, args.source) if args.inverse else (args.source, args.target)
+    started = time.perf_counter()
+    totals = convert_file(args.input, args.output, source, target, input_format=args.format,
+                          output_format=args.output_format, swap_axes=args.lat_first, precision=args.precision,
+                          chunk_size=args.chunk_size, x_column=args.x_column, y_column=args.y_column,
+                          id_column=args.id_column)
+    elapsed = time.perf_counter() - started
+    print(f"Converted {totals['converted']} points to {target} in {elapsed:.1f} s, "
+          f"skipped {totals['invalid']} invalid rows and {totals['failed']} points that couldn't be reprojected")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Library for downloading cropped oblique images (skråfotos) for EPSG:25832 coordinates.
+
+Importing the package has no side effects: settings, log files, the image cache and the
+heavy imaging libraries (rasterio, PIL) are only touched once a Pipeline needs them.
+"""
+from .config import Config
+from .pipeline import Pipeline, JobStats, FailureThresholdExceeded
+from .stac import STACImageProcessor
+from .elevation import ElevationData
+from .coordinates import CoordinateReader, open_coordinates, register_reader, read_coordinates_from_file, remove_failed_coords
+from .log import configure_logging
+from .service import CropService
@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .log import logger, detailed_logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    tiled INTEGER NOT NULL
+);
+"""
+
+EXTENSIONS = (".tif", ".tiff")
+
+
+class RemoteSource:
+    """Reads every image from the href of its STAC item."""
+
+    hits = 0
+    misses = 0
+    # GDAL options for reading
+    env = {}
+
+    def locations(self, item_id, href):
+        """:return: Places to open the image from, in order of preference."""
+        return [href]
+
+    def close(self):
+        pass
+
+
+class LocalArchive(RemoteSource):
+    """
+    Images mirrored to a local directory, found by STAC item id.
+
+    The archive is indexed by ingest(), which maps each file named after an item id, such
+    as 2021_84_40_2_0031_00070238.tif, to its path. Local files are opened with GDAL's
+    memory-mapped I/O, so a crop only pages in the tiles of its window, and are read
+    before the remote href, which remains the fallback for images that aren't mirrored.
+
+    :param root: Directory of the archive, searched recursively.
+    :param index_path: Path to the SQLite index, defaults to archive.sqlite in root.
+    """
+
+    env = {'GTIFF_VIRTUAL_MEM_IO': 'IF_ENOUGH_RAM'}
+
+    def __init__(self, root, index_path=None):
+        self.root = root
+        self.index_path = index_path or os.path.join(root, "archive.sqlite")
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, item_id):
+        """:return: Path of the archived image of an item, or None."""
+        if item_id is None:
+            return None
+        with self._lock:
+            row = self.connection.execute("SELECT path FROM images WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        return path if os.path.exists(path) else None
+
+    def locations(self, item_id, href):
+        path = self.lookup(item_id)
+        if path is None:
+            self.misses += 1
+            return [href]
+        self.hits += 1
+        return [path, href] if href else [path]
+
+    def ingest(self):
+        """
+        Indexes the image files under root. Files whose size and modification time haven't
+        changed are skipped, and files that are gone are dropped from the index.
+
+        :return: Dictionary with counts of added, updated, unchanged and removed images.
+        """
+        import rasterio
+        from rasterio.errors import RasterioIOError
+
+        with self._lock:
+            known = {row[0]: row[1:] for row in self.connection.execute("SELECT id, path, size, mtime FROM images")}
+        totals = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        rows = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.lower().endswith(EXTENSIONS):
+                    continue
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, self.root)
+                item_id = os.path.splitext(name)[0]
+                stat = os.stat(full_path)
+                seen.add(item_id)
+                if known.get(item_id) == (path, stat.st_size, stat.st_mtime):
+                    totals["unchanged"] += 1
+                    continue
+
+                try:
+                    with rasterio.open(full_path) as src:
+                        block_height, block_width = src.block_shapes[0]
+                        tiled = block_width < src.width
+                except RasterioIOError as e:
+                    logger.warning(f"Skipping {full_path}, it can't be read: {e}")
+                    continue
+                if not tiled:
+                    # Striped files decode whole rows for every window
+                    logger.warning(f"{full_path} is not tiled, crops from it read whole rows")
+                rows.append((item_id, path, stat.st_size, stat.st_mtime, int(tiled)))
+                totals["updated" if item_id in known else "added"] += 1
+
+        stale = [(item_id,) for item_id in known if item_id not in seen]
+        totals["removed"] = len(stale)
+        with self._lock, self.connection as db:
+            db.executemany("INSERT OR REPLACE INTO images (id, path, size, mtime, tiled) VALUES (?, ?, ?, ?, ?)", rows)
+            db.executemany("DELETE FROM images WHERE id = ?", stale)
+        logger.info(f"Indexed archive {self.root}: {totals}")
+        return totals
+
+    def count(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+@contextmanager
+def open_image(source, item_id, href):
+    """
+    Opens the image of a STAC item with rasterio from the first location of the source
+    that can be opened, so a missing or broken archive file falls back to the href.
+
+    :param source: RemoteSource or LocalArchive.
+    :return: Context manager yielding the open dataset.
+    """
+    import rasterio
+    from rasterio.errors import RasterioIOError
+
+    locations = source.locations(item_id, href)
+    for i, location in enumerate(locations):
+        try:
+            src = rasterio.open(location)
+        except RasterioIOError as e:
+            if i == len(locations) - 1:
+                raise
+            detailed_logger.warning(f"Could not open {location}, reading {item_id} from {locations[i + 1]}: {e}")
+            continue
+        with src:
+            yield src
+        return
@@ -0,0 +1,107 @@
+import os
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Config:
+    """
+    Settings for a download pipeline.
+
+    The defaults mirror settings.yaml, so a Config can be built in code without
+    touching the filesystem. Use Config.load() to read settings.yaml and the API tokens
+    from the environment.
+    """
+    cache_dir: str = "image_cache"
+    collection: str = "skraafotos2021"  # Or a list of collections, downloaded in one pass
+    crop_sizes: list = field(default_factory=lambda: [400, 800])
+    image_resize: int = 400
+    image_quality: int = 65
+    image_summary: bool = False
+    max_concurrent_requests: int = 30
+    limit_per_host: int = 15
+    memory_budget_mb: int = 512
+    gdal_cachemax_mb: int = 64
+    retry_limit: int = 3
+    retry_delay: float = 1
+    retry_max_delay: float = 30
+    circuit_failures: int = 5
+    circuit_reset: float = 30
+    circuit_max_wait: float = 300
+    threshold: float = 50
+    api_quotas: dict = None
+    logging_level: str = "INFO"
+    failed_coordinates_file: str = "failed_coordinates.txt"
+    footprint_index: str = None
+    terrain_cache: str = None
+    terrain_resolution: float = 1.0
+    terrain_cache_mb: int = 2048
+    image_archive: str = None
+    geocoder: str = "dawa"
+    geocoder_file: str = None
+    geocode_cache: str = "geocode_cache.sqlite"
+    geocode_concurrency: int = None
+    geocode_rate: float = None
+
+    # API tokens, normally taken from the environment / .env file
+    api_baseurl: str = None
+    api_token: str = None
+    api_dhm_tokena: str = None
+    api_dhm_tokenb: str = None
+
+    @property
+    def collections(self):
+        """The configured collections as a list."""
+        if isinstance(self.collection, str):
+            return [self.collection]
+        return list(self.collection)
+
+    def collection_dir(self, collection):
+        """
+        Folder of the crops of a collection. The one configured collection keeps the
+        cache_dir layout of earlier versions, every other collection gets a subfolder, so
+        the folder only depends on the settings and not on what a run was asked for.
+        """
+        if self.collections == [collection]:
+            return self.cache_dir
+        return os.path.join(self.cache_dir, collection)
+
+    @classmethod
+    def from_settings(cls, settings, **overrides):
+        """
+        Builds a Config from a parsed settings.yaml dictionary.
+
+        :param settings: Dictionary with the same layout as settings.yaml.
+        :param overrides: Config fields that take precedence over the settings.
+        :return: Config instance.
+        """
+        values = dict(settings)
+        concurrency = values.pop("concurrency", None) or {}
+        values.update(concurrency)
+        names = set(cls.__dataclass_fields__)
+        values = {key: value for key, value in values.items() if key in names}
+        values.update(overrides)
+        return cls(**values)
+
+    @classmethod
+    def load(cls, path="settings.yaml", env=True, **overrides):
+        """
+        Reads settings.yaml and, optionally, the API tokens from the environment.
+
+        :param path: Path to the settings file.
+        :param env: Load the .env file and read the API tokens from the environment.
+        :param overrides: Config fields that take precedence over file and environment.
+        :return: Config instance.
+        """
+        import yaml
+
+        with open(path, 'r') as f:
+            settings = yaml.safe_load(f) or {}
+
+        if env:
+            from dotenv import load_dotenv
+            load_dotenv()
+            for name in ("api_baseurl", "api_token", "api_dhm_tokena", "api_dhm_tokenb"):
+                if os.getenv(name) is not None:
+                    settings.setdefault(name, os.getenv(name))
+
+        return cls.from_settings(settings, **overrides)
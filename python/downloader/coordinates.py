@@ -0,0 +1,554 @@
+import os
+import csv
+import json
+import warnings
+from itertools import islice
+
+from .log import logger, detailed_logger
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Column names tried, in order, when a CSV or Parquet reader isn't told which columns to use
+X_COLUMNS = ("x", "easting", "east", "e")
+Y_COLUMNS = ("y", "northing", "north", "n")
+ID_COLUMNS = ("id", "point_id", "address_id", "adresseid")
+# Tried as well when reading longitude/latitude, see downloader.projection
+LON_COLUMNS = ("lon", "lng", "long", "longitude")
+LAT_COLUMNS = ("lat", "latitude")
+
+
+def _pick_column(names, candidates, explicit):
+    if explicit:
+        if explicit not in names:
+            raise ValueError(f"Column '{explicit}' not found, available columns: {', '.join(names)}")
+        return explicit
+    lowered = {name.lower(): name for name in names}
+    return next((lowered[c] for c in candidates if c in lowered), None)
+
+
+def iter_feature_collection(file, block_size=1 << 16):
+    """
+    Yields the features of a GeoJSON FeatureCollection one at a time, decoding the file
+    incrementally so only one feature and a block of text are in memory. A file without
+    a top level "features" array is decoded whole, and yields itself if it is a Feature.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def refill():
+        nonlocal buffer, position, eof
+        block = file.read(block_size)
+        eof = not block
+        buffer = buffer[position:] + block
+        position = 0
+        return not eof
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or not refill():
+                return buffer[position] if position < len(buffer) else ""
+
+    # Find the "features" key of the top level object
+    depth = 0
+    found = False
+    refill()
+    while not found:
+        if position >= len(buffer) and not refill():
+            break
+        character = buffer[position]
+        if character == '"':
+            try:
+                key, end = json.decoder.scanstring(buffer, position + 1)
+            except json.JSONDecodeError:
+                if eof or not refill():
+                    raise
+                continue
+            position = end
+            if depth == 1 and key == "features" and skip_whitespace() == ":":
+                position += 1
+                if skip_whitespace() == "[":
+                    position += 1
+                    found = True
+            continue
+        if character in "{[":
+            depth += 1
+        elif character in "}]":
+            depth -= 1
+            if depth == 0:
+                break
+        position += 1
+
+    if not found:
+        file.seek(0)
+        data = json.load(file)
+        if isinstance(data, dict) and data.get("type") == "Feature":
+            yield data
+        return
+
+    if skip_whitespace() == "]":
+        return
+    while True:
+        try:
+            feature, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The feature runs past the end of the buffer
+            if eof or not refill():
+                raise
+            continue
+        position = end
+        yield feature
+        separator = skip_whitespace()
+        position += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' between features, found {separator!r}")
+        skip_whitespace()
+
+
+class CoordinateReader:
+    """
+    Reads EPSG:25832 points from a file in chunks.
+
+    chunks() yields (xy, ids) pairs, where xy is an (n, 2) float64 array and ids is a
+    list of point ids or None when the file has none. points() flattens the chunks into
+    (x, y, id) tuples that can be streamed straight into Pipeline.run(). count() returns
+    the number of valid points, by reading the file once with the same validation.
+    """
+    extensions = ()
+
+    def __init__(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE, x_column=None, y_column=None, id_column=None,
+                 x_candidates=X_COLUMNS, y_candidates=Y_COLUMNS):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.x_column = x_column
+        self.y_column = y_column
+        self.id_column = id_column
+        self.x_candidates = x_candidates
+        self.y_candidates = y_candidates
+        self.invalid = 0
+        self._counting = False
+
+    def count(self):
+        invalid = self.invalid
+        self._counting = True
+        try:
+            return sum(len(xy) for xy, _ in self.chunks())
+        finally:
+            # The rows are skipped and logged again when the points are read
+            self.invalid = invalid
+            self._counting = False
+
+    def chunks(self):
+        raise NotImplementedError
+
+    def points(self):
+        for xy, ids in self.chunks():
+            coordinates = xy.tolist()
+            if ids is None:
+                for x, y in coordinates:
+                    yield x, y, None
+            else:
+                for (x, y), point_id in zip(coordinates, ids):
+                    yield x, y, point_id
+
+    def _skip(self, row, reason="invalid"):
+        self.invalid += 1
+        if not self._counting:
+            detailed_logger.warning(f"Skipping {reason} row in {self.file_path}: {row}")
+
+    def _rows_to_chunk(self, rows, has_ids):
+        """
+        Converts rows of [x, y(, id)] strings in one vectorised step. If the chunk has
+        non-numeric values, it is converted again row by row so only the bad rows are dropped.
+        """
+        import numpy as np
+
+        try:
+            xy = np.array([row[:2] for row in rows], dtype=np.float64)
+            ids = [row[2] for row in rows] if has_ids else None
+        except ValueError:
+            valid = []
+            for row in rows:
+                try:
+                    valid.append((float(row[0]), float(row[1])) + tuple(row[2:3]))
+                except ValueError:
+                    self._skip(row)
+            xy = np.array([row[:2] for row in valid], dtype=np.float64).reshape(-1, 2)
+            ids = [row[2] for row in valid] if has_ids else None
+
+        finite = np.isfinite(xy).all(axis=1)
+        if not finite.all():
+            for row in xy[~finite].tolist():
+                self._skip(row, "non-finite")
+            xy = xy[finite]
+            if ids is not None:
+                ids = [point_id for point_id, keep in zip(ids, finite) if keep]
+        return xy, ids
+
+
+class TextReader(CoordinateReader):
+    """The original format: one "x y" pair per line, optionally followed by a point id."""
+    extensions = (".txt", ".xyz")
+
+    def chunks(self):
+        import numpy as np
+
+        with open(self.file_path, 'r') as file:
+            while lines := list(islice(file, self.chunk_size)):
+                # Fast path for chunks of plain "x y" lines, parsed by numpy's C reader
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")  # Warns on chunks with only blank lines
+                        xy = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+                    if xy.shape[1] == 2 and np.isfinite(xy).all():
+                        yield xy, None
+                        continue
+                except ValueError:
+                    pass
+
+                rows = []
+                for line in lines:
+                    fields = line.split(maxsplit=2)
+                    if len(fields) >= 2:
+                        rows.append([fields[0], fields[1], fields[2].strip() if len(fields) > 2 else None])
+                    elif line.strip():
+                        self._skip(line.strip())
+                if rows:
+                    has_ids = any(row[2] is not None for row in rows)
+                    yield self._rows_to_chunk(rows, has_ids)
+
+
+class CsvReader(CoordinateReader):
+    """CSV with a header row. The x, y and id columns are found by name."""
+    extensions = (".csv", ".tsv")
+
+    def chunks(self):
+        with open(self.file_path, 'r', newline='') as file:
+            dialect = csv.excel_tab if self.file_path.endswith(".tsv") else csv.excel
+            reader = csv.reader(file, dialect)
+            header = next(reader, None)
+            if not header:
+                return
+            x_column = _pick_column(header, self.x_candidates, self.x_column)
+            y_column = _pick_column(header, self.y_candidates, self.y_column)
+            id_column = _pick_column(header, ID_COLUMNS, self.id_column)
+            if x_column is None or y_column is None:
+                raise ValueError(f"Could not find x and y columns in {self.file_path}, use the column options")
+
+            indexes = [header.index(x_column), header.index(y_column)]
+            if id_column is not None:
+                indexes.append(header.index(id_column))
+            width = max(indexes) + 1
+
+            while rows := list(islice(reader, self.chunk_size)):
+                picked = []
+                for row in rows:
+                    if len(row) < width:
+                        if row:
+                            self._skip(row)
+                        continue
+                    picked.append([row[i] for i in indexes])
+                if picked:
+                    yield self._rows_to_chunk(picked, id_column is not None)
+
+
+class GeoJSONReader(CoordinateReader):
+    """
+    GeoJSON Point features, either as a FeatureCollection or as newline-delimited
+    features (GeoJSONSeq). Both are streamed one feature at a time. The point id is the
+    feature id, or the property named by id_column.
+    """
+    extensions = (".geojson", ".json", ".geojsonl", ".geojsons", ".ndjson")
+
+    def _features(self):
+        with open(self.file_path, 'r') as file:
+            first = file.read(1)
+            while first and first.isspace():
+                first = file.read(1)
+            file.seek(0)
+            if first == "{" and not self.file_path.endswith((".geojsonl", ".geojsons", ".ndjson")):
+                yield from iter_feature_collection(file)
+            else:
+                for line in file:
+                    line = line.strip().lstrip("\x1e")  # GeoJSONSeq record separator
+                    if line:
+                        yield json.loads(line)
+
+    def chunks(self):
+        features = self._features()
+        while batch := list(islice(features, self.chunk_size)):
+            rows = []
+            for feature in batch:
+                geometry = feature.get("geometry") or {}
+                if geometry.get("type") != "Point":
+                    self._skip(feature.get("id"), "non-point")
+                    continue
+                point_id = feature.get("properties", {}).get(self.id_column) if self.id_column else feature.get("id")
+                x, y = geometry["coordinates"][:2]
+                rows.append([x, y, None if point_id is None else str(point_id)])
+            if rows:
+                yield self._rows_to_chunk(rows, any(row[2] is not None for row in rows))
+
+
+class ParquetReader(CoordinateReader):
+    """Parquet files, read one record batch at a time. Needs pyarrow."""
+    extensions = (".parquet", ".pq")
+
+    def _file(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet files requires pyarrow: pip install pyarrow") from e
+        return pq.ParquetFile(self.file_path)
+
+    def chunks(self):
+        import numpy as np
+
+        parquet_file = self._file()
+        names = parquet_file.schema_arrow.names
+        x_column = _pick_column(names, self.x_candidates, self.x_column)
+        y_column = _pick_column(names, self.y_candidates, self.y_column)
+        id_column = _pick_column(names, ID_COLUMNS, self.id_column)
+        if x_column is None or y_column is None:
+            raise ValueError(f"Could not find x and y columns in {self.file_path}, use the column options")
+        columns = [x_column, y_column] + ([id_column] if id_column else [])
+
+        for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+            xy = np.column_stack([
+                batch.column(0).to_numpy(zero_copy_only=False).astype(np.float64),
+                batch.column(1).to_numpy(zero_copy_only=False).astype(np.float64),
+            ])
+            ids = [None if v is None else str(v) for v in batch.column(2).to_pylist()] if id_column else None
+            valid = np.isfinite(xy).all(axis=1)
+            if not valid.all():
+                self.invalid += int((~valid).sum())
+                if not self._counting:
+                    detailed_logger.warning(f"Skipping {int((~valid).sum())} rows without coordinates in {self.file_path}")
+                xy = xy[valid]
+                if ids is not None:
+                    ids = [point_id for point_id, keep in zip(ids, valid) if keep]
+            yield xy, ids
+
+
+class NpyReader(CoordinateReader):
+    """Raw (n, 2) float64 arrays saved with numpy.save, memory-mapped so only the current chunk is read."""
+    extensions = (".npy",)
+
+    def _array(self):
+        import numpy as np
+
+        array = np.load(self.file_path, mmap_mode='r')
+        if array.ndim != 2 or array.shape[1] < 2:
+            raise ValueError(f"Expected an (n, 2) array in {self.file_path}, got shape {array.shape}")
+        return array
+
+    def chunks(self):
+        import numpy as np
+
+        array = self._array()
+        for start in range(0, array.shape[0], self.chunk_size):
+            xy = np.asarray(array[start:start + self.chunk_size, :2], dtype=np.float64)
+            valid = np.isfinite(xy).all(axis=1)
+            if not valid.all():
+                self.invalid += int((~valid).sum())
+                xy = xy[valid]
+            yield xy, None
+
+
+READERS = {}
+
+
+def register_reader(reader_class, *extensions):
+    """Registers a CoordinateReader subclass for file extensions (including the dot)."""
+    for extension in extensions or reader_class.extensions:
+        READERS[extension.lower()] = reader_class
+
+
+for _reader in (TextReader, CsvReader, GeoJSONReader, ParquetReader, NpyReader):
+    register_reader(_reader)
+
+
+def open_coordinates(file_path, file_format=None, **options):
+    """
+    Returns a reader for a coordinate file, chosen by file_format or the file extension.
+
+    :param file_path: Path to the file.
+    :param file_format: Extension to use instead of the file's own, e.g. "csv".
+    :param options: Passed to the reader, e.g. chunk_size or id_column.
+    :return: CoordinateReader.
+    """
+    extension = f".{file_format.lstrip('.')}" if file_format else os.path.splitext(file_path)[1]
+    reader_class = READERS.get(extension.lower(), TextReader)
+    return reader_class(file_path, **options)
+
+
+def _csv_field(value):
+    if value is None:
+        return None
+    value = str(value)
+    if any(character in value for character in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+class CoordinateWriter:
+    """
+    Writes chunks of points to a file in a format open_coordinates() reads back.
+
+    write() takes the (xy, ids) pairs yielded by CoordinateReader.chunks(). Writers are
+    context managers and count the points written.
+
+    :param precision: Decimals written by the text formats.
+    """
+    extensions = ()
+
+    def __init__(self, file_path, precision=3):
+        self.file_path = file_path
+        self.precision = precision
+        self.count = 0
+        self.file = self._open()
+
+    def _open(self):
+        return open(self.file_path, 'w', newline='')
+
+    def write(self, xy, ids=None):
+        raise NotImplementedError
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lines(self, xy, ids, separator):
+        # One format call per row; the ids are appended unquoted
+        row_format = separator.join([f"%.{self.precision}f"] * 2)
+        if ids is None:
+            return "".join(row_format % row + "\n" for row in map(tuple, xy.tolist()))
+        return "".join(f"{row_format % tuple(row)}{separator}{'' if point_id is None else point_id}\n"
+                       for row, point_id in zip(xy.tolist(), ids))
+
+
+class TextWriter(CoordinateWriter):
+    """One "x y" pair per line, followed by the point id when there is one."""
+    extensions = (".txt", ".xyz")
+
+    def write(self, xy, ids=None):
+        self.file.write(self._lines(xy, ids, " "))
+        self.count += len(xy)
+
+
+class CsvWriter(CoordinateWriter):
+    """CSV with an x,y header, and an id column when the first chunk has ids."""
+    extensions = (".csv",)
+    has_ids = None
+
+    def write(self, xy, ids=None):
+        if self.has_ids is None:
+            self.has_ids = ids is not None
+            self.file.write("x,y,id\n" if self.has_ids else "x,y\n")
+        if self.has_ids and ids is None:
+            ids = [None] * len(xy)
+        elif self.has_ids:
+            ids = [_csv_field(point_id) for point_id in ids]
+        self.file.write(self._lines(xy, ids if self.has_ids else None, ","))
+        self.count += len(xy)
+
+
+class NpyWriter(CoordinateWriter):
+    """
+    (n, 2) float64 .npy files. The header is rewritten with the final shape on close,
+    so the points are written as they come. Point ids can't be stored and are dropped.
+    """
+    extensions = (".npy",)
+
+    def _open(self):
+        self._dropped_ids = False
+        file = open(self.file_path, 'wb')
+        # Placeholder with the widest shape, so the final header has the same length
+        file.write(self._header(10 ** 15))
+        return file
+
+    @staticmethod
+    def _header(rows):
+        import io
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.lib.format.write_array_header_1_0(buffer, {'descr': '<f8', 'fortran_order': False, 'shape': (rows, 2)})
+        return buffer.getvalue()
+
+    def write(self, xy, ids=None):
+        import numpy as np
+
+        if ids is not None and not self._dropped_ids:
+            self._dropped_ids = True
+            logger.warning(f"Point ids are not written to {self.file_path}")
+        self.file.write(np.ascontiguousarray(xy, dtype='<f8').tobytes())
+        self.count += len(xy)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.seek(0)
+            self.file.write(self._header(self.count))
+        super().close()
+
+
+WRITERS = {}
+
+for _writer in (TextWriter, CsvWriter, NpyWriter):
+    for _extension in _writer.extensions:
+        WRITERS[_extension] = _writer
+
+
+def open_writer(file_path, file_format=None, **options):
+    """
+    Returns a writer for a coordinate file, chosen by file_format or the file extension.
+    Unknown extensions are written as text, the format download_from_coordinates reads by default.
+
+    :param options: Passed to the writer, e.g. precision.
+    :return: CoordinateWriter.
+    """
+    extension = f".{file_format.lstrip('.')}" if file_format else os.path.splitext(file_path)[1]
+    writer_class = WRITERS.get(extension.lower(), TextWriter)
+    return writer_class(file_path, **options)
+
+
+# Function to read coordinates from a file
+def read_coordinates_from_file(file_path):
+    reader = open_coordinates(file_path)
+    coordinates = [(x, y) for x, y, _ in reader.points()]
+    if reader.invalid:
+        logger.warning(f"Skipped {reader.invalid} invalid lines in {file_path}")
+    return coordinates
+
+
+def remove_failed_coords(source_file="failed_coordinates.txt", target_file="coordinates.txt"):
+    try:
+        # Read lines from source file
+        with open(source_file, 'r', encoding='utf-8') as sf:
+            lines_to_remove = set(sf.read().splitlines())
+
+        # Read and filter lines from target file
+        with open(target_file, 'r', encoding='utf-8') as tf:
+            target_lines = tf.read().splitlines()
+
+        # Filter and overwrite target file
+        with open(target_file, 'w', encoding='utf-8') as tf:
+            tf.writelines(line + '\n' for line in target_lines if line not in lines_to_remove)
+
+        print("Coordinates successsfully removed from file")
+
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
@@ -0,0 +1,66 @@
+import aiohttp
+
+from .log import logger, detailed_logger
+
+DHM_POINT_URL = "https://services.datafordeler.dk/DHMTerraen/DHMKoter/1.0.0/GEOREST/HentKoter"
+
+
+class ElevationData:
+    def __init__(self, api_dhm_tokena, api_dhm_tokenb, pipeline):
+        self.api_dhm_tokena = api_dhm_tokena
+        self.api_dhm_tokenb = api_dhm_tokenb
+        self.pipeline = pipeline
+
+    async def get_kote(self, point):
+        """
+        Terrain height at an EPSG:25832 coordinate, sampled from the local terrain tiles
+        when a terrain cache is configured, otherwise or when the tile is missing taken
+        from the DHM point API.
+        """
+        terrain = self.pipeline.terrain
+        if terrain is not None:
+            height = (await terrain.get_heights(self.pipeline.get_session(), [point]))[0]
+            if height == height:  # Not NaN
+                return float(height)
+        return await self.get_remote_kote(point)
+
+    async def get_remote_kote(self, point):
+        session = self.pipeline.get_session()
+        stats = self.pipeline.stats
+        point = f'POINT({point[0]}%20{point[1]})'
+        url = (f'{DHM_POINT_URL}'
+            f'?username={self.api_dhm_tokena}&password={self.api_dhm_tokenb}&geop={point}')
+
+        try:
+            with self.pipeline.breakers.for_url(url):
+                async with session.get(url) as response:
+                    # Raise an exception for non-2xx HTTP status codes
+                    response.raise_for_status()
+                    response_data = await response.json()
+        except aiohttp.ClientResponseError as e:
+            stats.status_codes.add(e.status)
+            detailed_logger.debug(f"Error querying elevation data: {e}")
+            stats.error_log.add(e.message)
+            raise Exception("Failed to query elevation data") from e
+        except aiohttp.ClientError as e:
+            detailed_logger.debug(f"Error querying elevation data: {e}")
+            stats.error_log.add(str(e))
+            raise Exception("Failed to query elevation data") from e
+        except ValueError as e:  # Handles JSON decoding issues
+            logger.error(f"Error parsing JSON response: {e}")
+            detailed_logger.error(f"Error parsing JSON response: {e}")
+            raise Exception("Invalid JSON response") from e
+
+        # Validate response data
+        try:
+            kote_data = response_data["HentKoterRespons"]["data"]
+            kote = kote_data[0]["kote"]
+        except (KeyError, IndexError) as e:
+            error_message = f"Missing or invalid elevation data in response: {response_data}"
+            logger.error(error_message)
+            detailed_logger.error(error_message)
+            raise Exception("No elevation data found") from e
+
+        if kote is None:
+            raise Exception("Elevation data is missing")
+        return kote
@@ -0,0 +1,238 @@
+import json
+import sqlite3
+import threading
+
+from .log import logger, detailed_logger
+
+CRS_25832 = "http://www.opengis.net/def/crs/EPSG/0/25832"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    collection TEXT NOT NULL,
+    direction TEXT,
+    updated TEXT,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_collection ON items (collection);
+CREATE VIRTUAL TABLE IF NOT EXISTS footprints USING rtree(rowid, minx, maxx, miny, maxy);
+"""
+
+
+def ring_contains(ring, x, y):
+    """Ray casting test for a point in a closed ring of [x, y] positions."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def geometry_contains(geometry, x, y):
+    """
+    Tests if a GeoJSON Polygon or MultiPolygon contains a point.
+
+    :return: True if the point is inside the exterior ring and outside every hole.
+    """
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return False
+    for rings in polygons:
+        if ring_contains(rings[0], x, y) and not any(ring_contains(hole, x, y) for hole in rings[1:]):
+            return True
+    return False
+
+
+def geometry_bounds(geometry):
+    xs = []
+    ys = []
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    for rings in polygons:
+        for x, y, *_ in rings[0]:
+            xs.append(x)
+            ys.append(y)
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def compact_item(feature):
+    """Keeps the parts of a STAC item the downloader uses: footprint, perspective metadata and data asset."""
+    return {
+        "type": "Feature",
+        "id": feature["id"],
+        "collection": feature.get("collection"),
+        "geometry": feature["geometry"],
+        "properties": feature.get("properties", {}),
+        "assets": {"data": feature.get("assets", {}).get("data", {})},
+    }
+
+
+class FootprintIndex:
+    """
+    Local spatial index of STAC item footprints, stored in SQLite with an R*Tree.
+
+    Resolving the image for a point is a bounding box lookup in the R*Tree followed by an
+    exact point-in-polygon test, so no request to the STAC API is needed. When several
+    footprints contain the point, the item whose footprint centre is closest to it is
+    returned, as the point is then furthest from the image edges.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def lookup(self, coord, direction, collection):
+        """
+        Finds the item covering a coordinate.
+
+        :param coord: Coordinate (x, y) in EPSG:25832.
+        :param direction: Direction of the image.
+        :param collection: Collection of the image.
+        :return: STAC item, or None if no indexed footprint contains the coordinate.
+        """
+        x, y = coord[0], coord[1]
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT i.item, f.minx, f.maxx, f.miny, f.maxy
+                FROM footprints f JOIN items i ON i.rowid = f.rowid
+                WHERE f.minx <= ? AND f.maxx >= ? AND f.miny <= ? AND f.maxy >= ?
+                  AND i.collection = ? AND i.direction = ?
+                """,
+                (x, x, y, y, collection, direction),
+            ).fetchall()
+
+        best = None
+        best_distance = None
+        for item_json, minx, maxx, miny, maxy in rows:
+            distance = (x - (minx + maxx) / 2) ** 2 + (y - (miny + maxy) / 2) ** 2
+            if best_distance is not None and distance >= best_distance:
+                continue
+            item = json.loads(item_json)
+            if geometry_contains(item["geometry"], x, y):
+                best, best_distance = item, distance
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def upsert(self, features, collection):
+        """
+        Adds new items and replaces changed ones. Items whose `updated` (or `datetime`)
+        property is unchanged are skipped.
+
+        :return: Tuple (added, updated, unchanged).
+        """
+        added = updated = unchanged = 0
+        with self._lock, self.connection as db:
+            for feature in features:
+                if not feature.get("geometry"):
+                    continue
+                properties = feature.get("properties", {})
+                version = properties.get("updated") or properties.get("datetime")
+                row = db.execute("SELECT rowid, updated FROM items WHERE id = ?", (feature["id"],)).fetchone()
+                if row is not None and row[1] == version:
+                    unchanged += 1
+                    continue
+
+                item = compact_item(feature)
+                minx, maxx, miny, maxy = geometry_bounds(item["geometry"])
+                if row is not None:
+                    db.execute("DELETE FROM footprints WHERE rowid = ?", (row[0],))
+                    db.execute("DELETE FROM items WHERE rowid = ?", (row[0],))
+                    updated += 1
+                else:
+                    added += 1
+                rowid = db.execute(
+                    "INSERT INTO items (id, collection, direction, updated, item) VALUES (?, ?, ?, ?, ?)",
+                    (feature["id"], collection, properties.get("direction"), version, json.dumps(item)),
+                ).lastrowid
+                db.execute("INSERT INTO footprints VALUES (?, ?, ?, ?, ?)", (rowid, minx, maxx, miny, maxy))
+        return added, updated, unchanged
+
+    def prune(self, collection, keep_ids):
+        """
+        Removes items of a collection that are not in keep_ids.
+
+        :return: Number of removed items.
+        """
+        with self._lock, self.connection as db:
+            rows = db.execute("SELECT rowid, id FROM items WHERE collection = ?", (collection,)).fetchall()
+            stale = [(rowid,) for rowid, item_id in rows if item_id not in keep_ids]
+            db.executemany("DELETE FROM footprints WHERE rowid = ?", stale)
+            db.executemany("DELETE FROM items WHERE rowid = ?", stale)
+        return len(stale)
+
+    def count(self, collection=None):
+        query = "SELECT direction, COUNT(*) FROM items"
+        params = ()
+        if collection:
+            query += " WHERE collection = ?"
+            params = (collection,)
+        with self._lock:
+            return dict(self.connection.execute(query + " GROUP BY direction", params).fetchall())
+
+
+async def harvest(pipeline, index, collection, page_size=1000, prune=False):
+    """
+    Pages through every item of a collection and stores the footprints in the index.
+    Running it again only writes new and changed items.
+
+    :param pipeline: Pipeline providing the session and STAC API settings.
+    :param index: FootprintIndex to fill.
+    :param collection: Collection to harvest.
+    :param page_size: Items per page.
+    :param prune: Remove indexed items that are no longer in the collection.
+    :return: Dictionary with counts of added, updated, unchanged and removed items.
+    """
+    session = pipeline.get_session()
+    config = pipeline.config
+    headers = {'token': config.api_token}
+    url = f"{config.api_baseurl}/collections/{collection}/items?limit={page_size}&crs={CRS_25832}"
+
+    totals = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    seen_ids = set()
+    while url:
+        async with session.get(url, headers=headers) as response:
+            if response.status != 200:
+                raise Exception(f"API request failed with status code {response.status}")
+            page = await response.json()
+
+        features = page.get("features", [])
+        seen_ids.update(feature["id"] for feature in features)
+        added, updated, unchanged = index.upsert(features, collection)
+        totals["added"] += added
+        totals["updated"] += updated
+        totals["unchanged"] += unchanged
+        detailed_logger.debug(f"Harvested {len(seen_ids)} items from {collection}")
+
+        url = next((link["href"] for link in page.get("links", []) if link.get("rel") == "next"), None)
+
+    if prune:
+        totals["removed"] = index.prune(collection, seen_ids)
+    logger.info(f"Harvested {collection}: {totals}")
+    return totals
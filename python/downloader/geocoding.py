@@ -0,0 +1,374 @@
+import os
+import re
+import csv
+import time
+import asyncio
+import sqlite3
+import threading
+import unicodedata
+import urllib.parse
+
+from .coordinates import _pick_column, ID_COLUMNS, X_COLUMNS, Y_COLUMNS, LON_COLUMNS, LAT_COLUMNS, open_writer
+from .projection import WGS84, ETRS89_UTM32N, get_transformer
+from .log import logger, detailed_logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    geocoder TEXT NOT NULL,
+    address TEXT NOT NULL,
+    x REAL,
+    y REAL,
+    created REAL NOT NULL,
+    PRIMARY KEY (geocoder, address)
+);
+"""
+
+# Caches written before results were kept per geocoder had one row per address
+MIGRATE_ADDRESSES = """
+INSERT OR IGNORE INTO geocodes (geocoder, address, x, y, created)
+SELECT geocoder, address, x, y, created FROM addresses;
+DROP TABLE addresses;
+"""
+
+# Column names tried, in order, for the address in CSV files
+ADDRESS_COLUMNS = ("address", "adresse", "betegnelse", "addresse")
+
+DAWA_URL = "https://api.dataforsyningen.dk/adresser"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+
+def normalise_address(address):
+    """
+    Key under which an address is geocoded and cached, so spelling variants that only
+    differ in case, whitespace or punctuation around commas are looked up once.
+    """
+    address = unicodedata.normalize("NFC", address).casefold()
+    address = re.sub(r"\s*,\s*", ", ", address)
+    address = re.sub(r"\s+", " ", address)
+    return address.strip(" ,.")
+
+
+class GeocodeCache:
+    """
+    Persistent SQLite cache of geocoded addresses, in EPSG:25832, keyed by geocoder and
+    normalised address, so switching geocoders doesn't reuse another one's results or
+    misses. Addresses that weren't found are cached as well, and looked up again once
+    they are older than miss_ttl seconds.
+    """
+
+    def __init__(self, path, miss_ttl=30 * 24 * 3600):
+        self.path = path
+        self.miss_ttl = miss_ttl
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection as db:
+            db.executescript(SCHEMA)
+            if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'addresses'").fetchone():
+                db.executescript(MIGRATE_ADDRESSES)
+        self._lock = threading.Lock()
+
+    def get_many(self, addresses, geocoder, batch_size=500):
+        """
+        :param geocoder: Geocoder.cache_key of the geocoder whose results are wanted.
+        :return: Dictionary of address -> (x, y), or None for cached misses. Unknown addresses are left out.
+        """
+        addresses = list(addresses)
+        expired = time.time() - self.miss_ttl
+        found = {}
+        with self._lock:
+            for start in range(0, len(addresses), batch_size):
+                batch = addresses[start:start + batch_size]
+                rows = self.connection.execute(
+                    f"SELECT address, x, y, created FROM geocodes "
+                    f"WHERE geocoder = ? AND address IN ({','.join('?' * len(batch))})", [geocoder, *batch])
+                for address, x, y, created in rows:
+                    if x is not None:
+                        found[address] = (x, y)
+                    elif created > expired:
+                        found[address] = None
+        return found
+
+    def put_many(self, results, geocoder):
+        """
+        :param results: Dictionary of address -> (x, y) in EPSG:25832, or None if it wasn't found.
+        :param geocoder: Geocoder.cache_key of the geocoder that found them.
+        """
+        now = time.time()
+        rows = [(geocoder, address, *(point or (None, None)), now) for address, point in results.items()]
+        with self._lock, self.connection as db:
+            db.executemany("INSERT OR REPLACE INTO geocodes (geocoder, address, x, y, created) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class RateLimiter:
+    """Spaces out calls to at most rate per second. A rate of None or 0 means no limit."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Geocoder:
+    """
+    Backend that turns one address into a coordinate.
+
+    geocode() returns (x, y) in the geocoder's crs, or None if the address wasn't found,
+    and raises on errors, which leaves the address out of the cache so it is tried again
+    on the next run. rate and concurrency are the defaults the service allows.
+    """
+    name = None
+    crs = ETRS89_UTM32N
+    rate = None
+    concurrency = 8
+
+    @property
+    def cache_key(self):
+        """Name the geocoder's results are cached under."""
+        return self.name
+
+    async def geocode(self, session, address):
+        raise NotImplementedError
+
+
+class DawaGeocoder(Geocoder):
+    """Danish addresses from the DAWA address search of Dataforsyningen, returned in EPSG:25832."""
+    name = "dawa"
+    rate = 20
+
+    def __init__(self, url=DAWA_URL):
+        self.url = url
+
+    async def geocode(self, session, address):
+        query = urllib.parse.urlencode({"q": address, "struktur": "mini", "srid": 25832, "per_side": 1})
+        async with session.get(f"{self.url}?{query}") as response:
+            response.raise_for_status()
+            results = await response.json(content_type=None)
+        if not results:
+            return None
+        return results[0]["x"], results[0]["y"]
+
+
+class NominatimGeocoder(Geocoder):
+    """OpenStreetMap's Nominatim, which allows one request per second."""
+    name = "nominatim"
+    crs = WGS84
+    rate = 1
+    concurrency = 1
+
+    def __init__(self, url=NOMINATIM_URL, user_agent="skraafoto"):
+        self.url = url
+        self.user_agent = user_agent
+
+    async def geocode(self, session, address):
+        query = urllib.parse.urlencode({"q": address, "format": "jsonv2", "limit": 1})
+        async with session.get(f"{self.url}?{query}", headers={"User-Agent": self.user_agent}) as response:
+            response.raise_for_status()
+            results = await response.json(content_type=None)
+        if not results:
+            return None
+        return float(results[0]["lon"]), float(results[0]["lat"])
+
+
+class LocalGeocoder(Geocoder):
+    """
+    Stand-in that looks addresses up in a CSV file, for offline runs and tests. The file
+    has an address column and x/y columns in EPSG:25832 or lon/lat columns in EPSG:4326.
+    """
+    name = "local"
+    concurrency = 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            address_column = _pick_column(header, ADDRESS_COLUMNS, None)
+            x_column = _pick_column(header, X_COLUMNS, None)
+            y_column = _pick_column(header, Y_COLUMNS, None)
+            if x_column is None or y_column is None:
+                x_column = _pick_column(header, LON_COLUMNS, None)
+                y_column = _pick_column(header, LAT_COLUMNS, None)
+                self.crs = WGS84
+            if address_column is None or x_column is None or y_column is None:
+                raise ValueError(f"{path} needs an address column and x/y or lon/lat columns")
+            indexes = [header.index(address_column), header.index(x_column), header.index(y_column)]
+            self.addresses = {}
+            for row in reader:
+                if len(row) > max(indexes):
+                    address, x, y = (row[i] for i in indexes)
+                    self.addresses[normalise_address(address)] = (float(x), float(y))
+
+    @property
+    def cache_key(self):
+        # Each lookup file is a geocoder of its own
+        return f"local:{os.path.abspath(self.path)}"
+
+    async def geocode(self, session, address):
+        return self.addresses.get(normalise_address(address))
+
+
+GEOCODERS = {}
+
+
+def register_geocoder(geocoder_class, name=None):
+    """Registers a Geocoder subclass under a name for the geocoder setting."""
+    GEOCODERS[name or geocoder_class.name] = geocoder_class
+
+
+for _geocoder in (DawaGeocoder, NominatimGeocoder, LocalGeocoder):
+    register_geocoder(_geocoder)
+
+
+def get_geocoder(name, **options):
+    """
+    :param name: Registered name, e.g. "dawa", "nominatim" or "local".
+    :param options: Passed to the geocoder, e.g. path for "local".
+    :return: Geocoder.
+    """
+    if name not in GEOCODERS:
+        raise ValueError(f"Unknown geocoder '{name}', use one of {', '.join(GEOCODERS)}")
+    return GEOCODERS[name](**options)
+
+
+def read_addresses(path, address_column=None, id_column=None):
+    """
+    Reads addresses from a text file with one address per line, or from a CSV file with
+    an address column and, optionally, an id column.
+
+    :return: Generator of (address, id). The id is None in text files.
+    """
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        if not path.lower().endswith(".csv"):
+            for line in f:
+                if line.strip():
+                    yield line.strip(), None
+            return
+
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        address_column = _pick_column(header, ADDRESS_COLUMNS, address_column)
+        id_column = _pick_column(header, ID_COLUMNS, id_column)
+        if address_column is None:
+            raise ValueError(f"Could not find an address column in {path}, use the column option")
+        address_index = header.index(address_column)
+        id_index = header.index(id_column) if id_column else None
+        for row in reader:
+            if len(row) > address_index and row[address_index].strip():
+                yield row[address_index].strip(), row[id_index] if id_index is not None and len(row) > id_index else None
+
+
+class BatchGeocoder:
+    """
+    Geocodes batches of addresses through a persistent cache.
+
+    Addresses are normalised and de-duplicated, looked up in the cache, and only the rest
+    are sent to the geocoder, with at most concurrency requests in flight and at most rate
+    requests per second. Results are reprojected to EPSG:25832 and cached, so a recurring
+    address list resolves almost entirely from the cache.
+
+    :param geocoder: Geocoder backend.
+    :param cache: GeocodeCache, or None to always ask the geocoder.
+    :param concurrency: Requests in flight, defaults to the geocoder's.
+    :param rate: Requests per second, defaults to the geocoder's.
+    """
+
+    def __init__(self, geocoder, cache=None, concurrency=None, rate=None, batch_size=1000):
+        self.geocoder = geocoder
+        self.cache = cache
+        self.concurrency = concurrency or geocoder.concurrency
+        self.limiter = RateLimiter(rate or geocoder.rate)
+        self.batch_size = batch_size
+        self.hits = 0
+        self.requests = 0
+        self.errors = 0
+
+    async def _geocode_one(self, session, semaphore, address):
+        async with semaphore:
+            await self.limiter.wait()
+            self.requests += 1
+            try:
+                return await self.geocoder.geocode(session, address)
+            except Exception as e:
+                self.errors += 1
+                detailed_logger.warning(f"Geocoding '{address}' with {self.geocoder.name} failed: {e}")
+                return e
+
+    async def geocode(self, session, addresses):
+        """
+        :param addresses: Iterable of normalised addresses.
+        :return: Dictionary of address -> (x, y) in EPSG:25832, or None if it wasn't found
+            or the geocoder failed.
+        """
+        import numpy as np
+
+        addresses = list(dict.fromkeys(addresses))
+        results = self.cache.get_many(addresses, self.geocoder.cache_key) if self.cache else {}
+        self.hits += len(results)
+        missing = [address for address in addresses if address not in results]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        transformer = None if self.geocoder.crs == ETRS89_UTM32N else get_transformer(self.geocoder.crs, ETRS89_UTM32N)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            points = await asyncio.gather(*(self._geocode_one(session, semaphore, address) for address in batch))
+            found = {address: point for address, point in zip(batch, points) if not isinstance(point, Exception)}
+            located = [address for address, point in found.items() if point is not None]
+            if transformer is not None and located:
+                xy = np.array([found[address] for address in located], dtype=np.float64)
+                x, y = transformer.transform(xy[:, 0], xy[:, 1])
+                found.update(zip(located, zip(x.tolist(), y.tolist())))
+            # Failed lookups aren't cached, so they are tried again on the next run
+            if self.cache and found:
+                self.cache.put_many(found, self.geocoder.cache_key)
+            results.update(found)
+            results.update((address, None) for address in batch if address not in found)
+            logger.info(f"Geocoded {min(start + self.batch_size, len(missing))} of {len(missing)} new addresses")
+        return results
+
+
+async def geocode_file(input_path, output_path, batch_geocoder, session, address_column=None, id_column=None,
+                       output_format=None, unresolved_path=None):
+    """
+    Geocodes an address file into an EPSG:25832 coordinate file for download_from_coordinates,
+    one point per distinct address. The point id is the id column, or the address itself.
+
+    :param unresolved_path: File to write the addresses that couldn't be geocoded to.
+    :return: Dictionary with the number of addresses read, distinct, written and unresolved.
+    """
+    import numpy as np
+
+    first = {}
+    rows = 0
+    for address, point_id in read_addresses(input_path, address_column, id_column):
+        rows += 1
+        first.setdefault(normalise_address(address), (address, point_id))
+
+    results = await batch_geocoder.geocode(session, first)
+    unresolved = [address for key, (address, _) in first.items() if results.get(key) is None]
+    resolved = [(results[key], point_id or address) for key, (address, point_id) in first.items() if results.get(key)]
+
+    with open_writer(output_path, output_format) as writer:
+        if resolved:
+            writer.write(np.array([point for point, _ in resolved], dtype=np.float64), [point_id for _, point_id in resolved])
+    if unresolved_path:
+        with open(unresolved_path, 'w', encoding='utf-8') as f:
+            f.writelines(address + "\n" for address in unresolved)
+    if unresolved:
+        logger.warning(f"{len(unresolved)} addresses in {input_path} could not be geocoded")
+
+    totals = {"addresses": rows, "distinct": len(first), "written": writer.count, "unresolved": len(unresolved),
+              "cached": batch_geocoder.hits, "requests": batch_geocoder.requests}
+    logger.info(f"Geocoded {input_path} into {output_path}: {totals}")
+    return totals
@@ -0,0 +1,38 @@
+import logging
+
+# Loggers are shared by name, but nothing is attached to them until configure_logging() is called
+logger = logging.getLogger("download_from_coordinates")
+detailed_logger = logging.getLogger('detailed')
+summary_logger = logging.getLogger('summary')
+
+# Disable propagation to avoid double logging to the root logger
+detailed_logger.propagate = False
+summary_logger.propagate = False
+
+
+def configure_logging(logging_level, detailed_path='detailed_log.log', summary_path='summary_log.log'):
+    """
+    Attaches the detailed and summary log files. Only the command line script calls this,
+    so importing the library never creates log files.
+
+    :param logging_level: Level for the detailed log, e.g. "DEBUG" or "INFO".
+    :param detailed_path: Path of the detailed log file.
+    :param summary_path: Path of the summary log file.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    # Create handlers
+    detailed_handler = logging.FileHandler(detailed_path, mode='w')  # 'w' mode truncates the file on each run
+    summary_handler = logging.FileHandler(summary_path, mode='w')  # 'w' mode truncates the file on each run
+
+    # Define formats
+    detailed_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    summary_handler.setFormatter(logging.Formatter('%(message)s'))  # Simple format for summary log
+
+    # Add handlers to loggers
+    detailed_logger.addHandler(detailed_handler)
+    summary_logger.addHandler(summary_handler)
+
+    # Set levels for each logger
+    detailed_logger.setLevel(logging_level)
+    summary_logger.setLevel(logging.INFO)
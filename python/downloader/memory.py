@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+def expected_crop_bytes(crop_size, bands=3):
+    """
+    Memory needed to read and encode one crop: the decoded window plus the contiguous
+    copy PIL makes of the transposed array.
+
+    :param crop_size: Side length of the crop in pixels.
+    :param bands: Number of 8-bit bands read.
+    :return: Bytes.
+    """
+    return 2 * bands * crop_size * crop_size
+
+
+class MemoryBudget:
+    """
+    Limits the bytes of decoded imagery held at once.
+
+    Window reads reserve their expected size before starting and release it once the
+    crop is encoded. When the budget is used up, further reads wait, so concurrency
+    shrinks with larger crop sizes instead of running out of memory. A single
+    reservation larger than the whole budget is let through once nothing else is
+    reserved, so it can never wait forever.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.reserved = 0
+        self.peak = 0
+        self.waits = 0
+        self._condition = None
+
+    def _fits(self, nbytes):
+        return self.reserved == 0 or self.reserved + nbytes <= self.limit
+
+    @asynccontextmanager
+    async def reserve(self, nbytes):
+        # The condition binds to the running loop, so create it on first use
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        async with self._condition:
+            if not self._fits(nbytes):
+                self.waits += 1
+                await self._condition.wait_for(lambda: self._fits(nbytes))
+            self.reserved += nbytes
+            self.peak = max(self.peak, self.reserved)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.reserved -= nbytes
+                self._condition.notify_all()
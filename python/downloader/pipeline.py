@@ -0,0 +1,386 @@
+import os
+import csv
+import sys
+import time
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .config import Config
+from .log import logger, detailed_logger, summary_logger
+
+
+class FailureThresholdExceeded(Exception):
+    """Raised when more coordinates than the threshold percentage have failed, to stop the run."""
+
+
+@dataclass
+class JobStats:
+    """Counters for the summary log. Every pipeline has its own."""
+    successful_jobs: int = 0
+    failed_jobs: int = 0
+    progress: int = 0
+    status_codes: set = field(default_factory=set)
+    error_log: set = field(default_factory=set)
+    failed_coordinates: list = field(default_factory=list)
+    collection_failures: Counter = field(default_factory=Counter)
+    start_time: float = field(default_factory=time.time)
+    stopped: bool = False
+
+
+class Pipeline:
+    """
+    Downloads cropped oblique images for a list of coordinates.
+
+    Nothing is read, created or connected when a Pipeline is constructed. The settings
+    file is read the first time the config is needed, and the HTTP session and API
+    processors are created the first time they are used, so several pipelines can run
+    side by side in one process, each with its own session and counters.
+
+    Usage:
+        async with Pipeline(Config.load()) as pipeline:
+            await pipeline.run(coordinates)
+    """
+
+    def __init__(self, config=None, settings_path="settings.yaml"):
+        self._config = config
+        self.settings_path = settings_path
+        self.session = None
+        self.stats = JobStats()
+        self._processor = None
+        self._elevation = None
+        self._memory = None
+        self._footprints = None
+        self._terrain = None
+        self._images = None
+        self._manifest = None
+        self._retry = None
+        self._breakers = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = Config.load(self.settings_path)
+        return self._config
+
+    @property
+    def memory(self):
+        if self._memory is None:
+            from .memory import MemoryBudget
+            self._memory = MemoryBudget(self.config.memory_budget_mb * 1024 * 1024)
+        return self._memory
+
+    @property
+    def footprints(self):
+        """The local footprint index, or None if none is configured or built yet."""
+        if self._footprints is None and self.config.footprint_index:
+            if os.path.exists(self.config.footprint_index):
+                from .footprints import FootprintIndex
+                self._footprints = FootprintIndex(self.config.footprint_index)
+            else:
+                logger.warning(f"Footprint index {self.config.footprint_index} not found, using live STAC search")
+                self._footprints = False
+        return self._footprints or None
+
+    @property
+    def terrain(self):
+        """The local terrain tile cache, or None if none is configured."""
+        if self._terrain is None and self.config.terrain_cache:
+            from .terrain import TerrainCache
+            self._terrain = TerrainCache(self.config.terrain_cache, resolution=self.config.terrain_resolution,
+                                         max_bytes=self.config.terrain_cache_mb * 1024 * 1024,
+                                         username=self.config.api_dhm_tokena, password=self.config.api_dhm_tokenb)
+        return self._terrain
+
+    @property
+    def images(self):
+        """Where images are read from: the local archive when one is indexed, otherwise the STAC hrefs."""
+        if self._images is None:
+            from .archive import LocalArchive, RemoteSource
+            archive = self.config.image_archive
+            if archive and os.path.exists(os.path.join(archive, "archive.sqlite")):
+                self._images = LocalArchive(archive)
+            else:
+                if archive:
+                    logger.warning(f"Image archive {archive} is not indexed, reading images from the STAC hrefs")
+                self._images = RemoteSource()
+        return self._images
+
+    @property
+    def retry(self):
+        """Retry policy for each stage of the work on a coordinate."""
+        if self._retry is None:
+            from .retry import RetryPolicy
+            self._retry = RetryPolicy(self.config.retry_limit, self.config.retry_delay,
+                                      max_delay=self.config.retry_max_delay, max_outage=self.config.circuit_max_wait)
+        return self._retry
+
+    @property
+    def breakers(self):
+        """Circuit breakers of the hosts requests are sent to."""
+        if self._breakers is None:
+            from .retry import CircuitBreakers
+            self._breakers = CircuitBreakers(self.config.circuit_failures, self.config.circuit_reset)
+        return self._breakers
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            from .stac import STACImageProcessor
+            self._processor = STACImageProcessor(self.config.api_baseurl, self.config.api_token, self)
+        return self._processor
+
+    @property
+    def elevation(self):
+        if self._elevation is None:
+            from .elevation import ElevationData
+            self._elevation = ElevationData(self.config.api_dhm_tokena, self.config.api_dhm_tokenb, self)
+        return self._elevation
+
+    # Used to reset counters between runs and in the test environment
+    def reset_counters(self):
+        self.stats = JobStats()
+        self._memory = None
+        self._retry = None
+        self._breakers = None
+
+    def get_session(self):
+        """
+        Returns the shared aiohttp session, creating it on first use. Must be called
+        from inside a running event loop.
+        """
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.config.limit_per_host)
+            )
+        return self.session
+
+    async def close_session(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        if self._footprints:
+            self._footprints.close()
+        self._footprints = None
+        if self._images is not None:
+            self._images.close()
+        self._images = None
+
+    async def __aenter__(self):
+        self.get_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close_session()
+
+    def write_manifest(self, point_id, center_coord, status, collection=None):
+        """
+        Appends a point to points.csv in the cache directory, which maps point ids to
+        their coordinate folders. Points without an id are not written. In runs of several
+        collections each collection gets a row, with the folder relative to cache_dir.
+        """
+        if point_id is None:
+            return
+        if self._manifest is None:
+            os.makedirs(self.config.cache_dir, exist_ok=True)
+            path = os.path.join(self.config.cache_dir, "points.csv")
+            is_new = not os.path.exists(path)
+            self._manifest = open(path, 'a', newline='')
+            self._manifest_writer = csv.writer(self._manifest)
+            if is_new:
+                self._manifest_writer.writerow(["id", "x", "y", "folder", "status"])
+        x, y = center_coord
+        folder = f"{x}_{y}"
+        if collection is not None and self.config.collection_dir(collection) != self.config.cache_dir:
+            folder = f"{collection}/{folder}"
+        self._manifest_writer.writerow([point_id, x, y, folder, status])
+
+    def close_manifest(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def write_progress(self, total_coords):
+        percentage = (self.stats.progress / total_coords) * 100
+        sys.stdout.write(f"\rProgress: {self.stats.progress} / {total_coords} ({percentage:.2f}%) ")
+        sys.stdout.flush()
+
+    def summary_log(self, total_coords, failed):
+        stats = self.stats
+        end_time = time.time()
+        total_runtime = end_time - stats.start_time
+
+        # Logging
+        processed_coordinates = stats.successful_jobs + stats.failed_jobs
+        summary_logger.info(f"Total coordinates processed: {processed_coordinates}/{total_coords}")
+        summary_logger.info(f"Successful jobs: {stats.successful_jobs}")
+        summary_logger.info(f"Failed jobs: {stats.failed_jobs}")
+        if self._memory is not None:
+            summary_logger.info(f"Peak reserved memory: {self._memory.peak / (1024 * 1024):.1f} MB "
+                                f"of {self.config.memory_budget_mb} MB ({self._memory.waits} reads waited for memory)")
+        if self._footprints:
+            summary_logger.info(f"Footprint index: {self._footprints.hits} hits, {self._footprints.misses} misses")
+        if self._images is not None and self._images.hits + self._images.misses:
+            summary_logger.info(f"Image archive: {self._images.hits} images read locally, {self._images.misses} from the STAC hrefs")
+        if stats.collection_failures:
+            summary_logger.info("Failed coordinates per collection: " + ", ".join(
+                f"{name}: {count}" for name, count in stats.collection_failures.items()))
+        if self._retry is not None and self._retry.retries:
+            summary_logger.info(f"Retried requests and image reads: {self._retry.retries}")
+        if self._breakers is not None and self._breakers.trips():
+            for host, trips in self._breakers.trips().items():
+                summary_logger.info(f"Requests to {host} were paused {trips} times after repeated failures")
+        if self._terrain is not None:
+            summary_logger.info(f"Terrain tiles: {self._terrain.hits} heights sampled locally, "
+                                f"{self._terrain.misses} from the point API, {self._terrain.fetches} tiles fetched")
+
+        #Write failed coordinates to log
+        with open(self.config.failed_coordinates_file, "w") as f:
+            for coord in stats.failed_coordinates:
+                f.write(" ".join(str(value) for value in coord) + "\n")
+
+        if failed == True:
+            detailed_logger.critical(f" Too many failed attempts, process stopped after {total_runtime:.2f} seconds")
+            logger.error(f"Too many failed attempts, process stopped after {total_runtime:.2f} seconds")
+            summary_logger.error(f"ERROR: Process was stopped, after reaching fail threshold")
+            summary_logger.info(f"Total runtime: {total_runtime:.2f}\n")
+
+        if not failed:
+            logger.info(f"Script finished. Total runtime: {total_runtime:.2f} seconds")
+            detailed_logger.info(f"Script finished. Total runtime: {total_runtime:.2f} seconds")
+            summary_logger.info(f"Total runtime: {total_runtime:.2f}\n")
+
+        if stats.status_codes:
+            summary_logger.error("Status-codes:")
+            for code in stats.status_codes:
+                summary_logger.error(f"{code}")
+        if stats.error_log:
+            unique_errors = {str(error).strip().lower() for error in stats.error_log}  # Normalize errors
+            summary_logger.error("Unique errors occured:")
+            for error in unique_errors:
+                summary_logger.error(f"{error}")
+
+    async def process_coordinate(self, processor, elevationProcessor, center_coord, collection, semaphore, total_coords, point_id=None):
+        """
+        Fetches the elevation of a coordinate and the crops of every direction. Each stage
+        is retried on its own by the retry policy, so a failed direction doesn't repeat the
+        work of the others.
+
+        With a list of collections, the elevation is fetched once and every collection is
+        queried and cropped at the same time, each into its Config.collection_dir(). The
+        coordinate fails if any collection fails.
+
+        :raises FailureThresholdExceeded: When this failure puts the run over the threshold.
+        """
+        config = self.config
+        stats = self.stats
+        collections = [collection] if isinstance(collection, str) else list(collection)
+
+        def write_manifest(statuses):
+            for name, status in statuses.items():
+                self.write_manifest(point_id, center_coord, status, name)
+
+        async def handle_failure(e, statuses=None):
+            stats.failed_coordinates.append(center_coord if point_id is None else (*center_coord, point_id))
+            write_manifest(statuses or {name: "failed" for name in collections})
+            stats.failed_jobs += 1
+            stats.progress += 1
+            stats.error_log.add(e)
+            self.write_progress(total_coords)
+
+            detailed_logger.error(f"Failed to process {center_coord} after {config.retry_limit} attempts: {e}")
+            logger.error(f"Failed to process {center_coord}")
+
+            if not stats.stopped and stats.failed_jobs >= total_coords * (config.threshold / 100):
+                stats.stopped = True
+                self.summary_log(total_coords, True)
+                raise FailureThresholdExceeded(f"{stats.failed_jobs} of {total_coords} coordinates failed") from e
+
+        async def download(name):
+            return await processor.query_images_for_center(center_coord, name, kote,
+                                                           cache_dir=config.collection_dir(name))
+
+        async with semaphore:  # Limit concurrent tasks
+            try:
+                kote = await self.retry.call(f"Elevation of {center_coord}", elevationProcessor.get_kote, center_coord)
+            except Exception as e:
+                await handle_failure(e)
+                return
+            if kote == None or kote == -9999.0 or kote == 0.0:
+                detailed_logger.debug(f"Bad kote, skipping download for {center_coord}, kote: {kote}")
+                raise Exception("Elevation data is missing or invalid")
+            detailed_logger.debug(f"Fetched kote sucessfully: {kote} for {center_coord}")
+
+            # The processor retries the query and crop of each direction itself
+            outcomes = await asyncio.gather(*(download(name) for name in collections), return_exceptions=True)
+            failed = {name: outcome for name, outcome in zip(collections, outcomes) if isinstance(outcome, Exception)}
+            if failed:
+                error = next(iter(failed.values()))
+                if len(collections) > 1:
+                    stats.collection_failures.update(failed.keys())
+                    cause, error = error, Exception(f"Failed collections for {center_coord}: {', '.join(failed)}")
+                    error.__cause__ = cause
+                await handle_failure(error, {name: "failed" if name in failed else "ok" for name in collections})
+                return
+            detailed_logger.debug(f"Fetched image for: {center_coord}")
+
+            stats.progress += 1
+            stats.successful_jobs += 1
+            write_manifest({name: "ok" for name in collections})
+            detailed_logger.info(f"Coordinate successfully processed: {center_coord}" + (f" ({point_id})" if point_id is not None else ""))
+            self.write_progress(total_coords)
+
+    def _collect(self, tasks):
+        # Failed coordinates are already counted and logged, so the exceptions are only retrieved
+        # here, except the one that stops the run
+        for task in tasks:
+            if not task.cancelled() and isinstance(task.exception(), FailureThresholdExceeded):
+                raise task.exception()
+
+    async def run(self, coordinates, collection=None, total_coords=None):
+        """
+        Processes coordinates concurrently and writes the summary log. The coordinates are
+        consumed lazily, so a CoordinateReader's points() can be streamed in without
+        loading the whole file.
+
+        :param coordinates: Iterable of (x, y) or (x, y, point_id) in EPSG:25832.
+        :param collection: Collection or list of collections to fetch images from, defaults
+            to the configured ones. Each point's elevation is only fetched once for all of them.
+        :param total_coords: Number of coordinates, needed when coordinates has no len().
+        :raises FailureThresholdExceeded: When more than threshold percent of the coordinates
+            fail. The remaining coordinates are cancelled.
+        """
+        collection = collection or self.config.collection
+        if total_coords is None:
+            total_coords = len(coordinates)
+
+        # Set up a semaphore to limit concurrency
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+        # Only create a bounded number of tasks ahead of the semaphore
+        max_pending = self.config.max_concurrent_requests * 2
+
+        pending = set()
+        try:
+            detailed_logger.info(f"Running tasks concurrently")
+            for coordinate in coordinates:
+                center_coord = (coordinate[0], coordinate[1])
+                point_id = coordinate[2] if len(coordinate) > 2 else None
+                pending.add(asyncio.create_task(self.process_coordinate(
+                    self.processor, self.elevation, center_coord, collection, semaphore, total_coords, point_id
+                )))
+                if len(pending) >= max_pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    self._collect(done)
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                self._collect(done)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            # A run stopped by the threshold has already written its summary
+            if not self.stats.stopped:
+                self.summary_log(total_coords, False)
+            self.close_manifest()
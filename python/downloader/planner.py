@@ -0,0 +1,324 @@
+import os
+import math
+import time
+import random
+import urllib.parse
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .log import logger, detailed_logger
+
+# Bytes GDAL reads when it opens a remote GeoTIFF (GDAL_INGESTED_BYTES_AT_OPEN)
+HEADER_BYTES = 16384
+
+# Files take whole filesystem blocks
+DISK_BLOCK = 4096
+
+# Side in metres of the cells points are grouped in, the terrain tile size
+CELL_SIZE = 1000
+
+
+def host_of(url):
+    """:return: Host of an http(s) URL, or None for local paths."""
+    if isinstance(url, str) and url.lower().startswith(("http://", "https://")):
+        return urllib.parse.urlsplit(url).netloc
+    return None
+
+
+def dedupe(points):
+    """
+    Drops repeated coordinates, which the pipeline would download into the same folder.
+
+    :param points: Iterable of (x, y, point_id).
+    :return: (list of the first (x, y, point_id) of each coordinate, number dropped).
+    """
+    unique = {}
+    total = 0
+    for x, y, point_id in points:
+        total += 1
+        unique.setdefault((x, y), point_id)
+    return [(x, y, point_id) for (x, y), point_id in unique.items()], total - len(unique)
+
+
+def group_points(points, cell_size=CELL_SIZE):
+    """:return: Dictionary of (column, row) of a grid cell -> list of the points in it."""
+    groups = {}
+    for point in points:
+        groups.setdefault((math.floor(point[0] / cell_size), math.floor(point[1] / cell_size)), []).append(point)
+    return groups
+
+
+def sample_groups(groups, size, rng):
+    """
+    Picks up to size points spread over the groups: one from each group in a random
+    order, then a second from each, and so on, so a sample covers as many areas as it can.
+    """
+    keys = list(groups)
+    rng.shuffle(keys)
+    queues = {key: rng.sample(groups[key], min(len(groups[key]), size)) for key in keys}
+    sample = []
+    for i in range(size):
+        for key in keys:
+            if i < len(queues[key]):
+                sample.append(queues[key][i])
+                if len(sample) == size:
+                    return sample
+    return sample
+
+
+def window_blocks(src, window):
+    """
+    The compressed blocks a window read fetches from a tiled GeoTIFF, from the block
+    offsets GDAL reports in the TIFF metadata domain.
+
+    :return: Set of (offset, size), or None if the offsets aren't available.
+    """
+    block_height, block_width = src.block_shapes[0]
+    columns = range(int(window.col_off // block_width), int((window.col_off + window.width - 1) // block_width) + 1)
+    rows = range(int(window.row_off // block_height), int((window.row_off + window.height - 1) // block_height) + 1)
+    blocks = set()
+    # Pixel interleaved files store every band in the same blocks
+    for band in src.indexes[:3]:
+        for row in rows:
+            for column in columns:
+                offset = src.get_tag_item(f"BLOCK_OFFSET_{column}_{row}", "TIFF", bidx=band)
+                size = src.get_tag_item(f"BLOCK_SIZE_{column}_{row}", "TIFF", bidx=band)
+                if offset is None or size is None:
+                    return None
+                blocks.add((int(offset), int(size)))
+    return blocks
+
+
+def range_requests(blocks):
+    """:return: Number of HTTP range requests for blocks, as GDAL merges adjacent blocks into one."""
+    ranges = 0
+    end = None
+    for offset, size in sorted(blocks):
+        if offset != end:
+            ranges += 1
+        end = offset + size
+    return ranges
+
+
+@dataclass
+class PointSample:
+    """What processing one sampled point took."""
+    seconds: float = 0.0
+    elevation_api: bool = False
+    requests: Counter = field(default_factory=Counter)
+    busy: Counter = field(default_factory=Counter)
+    read_bytes: int = 0
+    files: int = 0
+    disk_bytes: int = 0
+    errors: int = 0
+
+
+class CapacityPlanner:
+    """
+    Estimates what downloading a list of points will take, without writing any images.
+
+    The points are de-duplicated and grouped into 1 km cells, and a sample spread over
+    the cells is processed like the pipeline would: the elevation is looked up, every
+    direction queried and every crop size read and encoded, in memory. The requests,
+    compressed bytes read, encoded crop sizes and latencies of the sample are scaled to
+    all points, and the runtime is bounded by the configured concurrency and connections
+    per host. Elevation tiles are counted exactly from the cells.
+
+    :param pipeline: Pipeline whose config, session, caches and processors are used.
+    """
+
+    def __init__(self, pipeline, fraction=0.01, minimum=5, maximum=50, seed=None):
+        self.pipeline = pipeline
+        self.fraction = fraction
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rng = random.Random(seed)
+
+    async def _measure_elevation(self, point, sample):
+        from .elevation import DHM_POINT_URL
+
+        pipeline = self.pipeline
+        terrain = pipeline.terrain
+        misses = terrain.misses if terrain is not None else 0
+        started = time.perf_counter()
+        kote = await pipeline.elevation.get_kote(point)
+        elapsed = time.perf_counter() - started
+        sample.elevation_api = terrain is None or terrain.misses > misses
+        if sample.elevation_api:
+            sample.busy[host_of(DHM_POINT_URL)] += elapsed
+        return kote, elapsed
+
+    def _read_crops(self, source, item_id, image_url, image_coord, sample):
+        import rasterio
+        from .archive import open_image
+        from .stac import crop_window, read_crop, encode_jpeg
+
+        config = self.pipeline.config
+        with rasterio.Env(GDAL_CACHEMAX=config.gdal_cachemax_mb * 1024 * 1024, **source.env), \
+                open_image(source, item_id, image_url) as src:
+            host = host_of(src.name)
+            seen = set()
+            if host:
+                sample.requests[host] += 1
+                sample.read_bytes += HEADER_BYTES
+            for crop_size in config.crop_sizes:
+                window = crop_window(src, image_coord, crop_size)
+                blocks = window_blocks(src, window)
+                jpeg = encode_jpeg(read_crop(src, image_coord, crop_size), config.image_quality)
+                if host:
+                    # Blocks of a smaller crop are still in GDAL's cache for the next size
+                    new = (blocks or set()) - seen
+                    sample.requests[host] += range_requests(new) if blocks is not None else 1
+                    sample.read_bytes += sum(size for _, size in new) if blocks is not None else len(jpeg)
+                    seen |= new
+                sample.files += 1
+                sample.disk_bytes += math.ceil(len(jpeg) / DISK_BLOCK) * DISK_BLOCK
+        return host
+
+    async def _measure_direction(self, point, direction, collection, kote, sample):
+        import asyncio
+        from geotiff_utils import update_center
+
+        pipeline = self.pipeline
+        processor = pipeline.processor
+        footprints = pipeline.footprints
+        hits = footprints.hits if footprints else 0
+        started = time.perf_counter()
+        response = await processor.query_items(point, direction, collection)
+        if not (footprints and footprints.hits > hits):
+            host = host_of(processor.api_baseurl)
+            sample.requests[host] += 1
+            sample.busy[host] += time.perf_counter() - started
+
+        features = response.get('features') or []
+        item = features[0] if features else None
+        image_url = item.get('assets', {}).get('data', {}).get('href') if item else None
+        update_result = update_center(point, item, kote) if image_url else None
+        if update_result:
+            crop_started = time.perf_counter()
+            image_coord = update_result['imageCoord']
+            host = await asyncio.to_thread(self._read_crops, pipeline.images, item.get('id'), image_url,
+                                           (image_coord[0], image_coord[1]), sample)
+            if host:
+                sample.busy[host] += time.perf_counter() - crop_started
+        return time.perf_counter() - started
+
+    async def measure(self, point, collections):
+        """Processes one point in memory, for every collection. :return: PointSample."""
+        sample = PointSample()
+        try:
+            kote, elevation_seconds = await self._measure_elevation(point, sample)
+        except Exception as e:
+            detailed_logger.warning(f"Plan: elevation of {point} failed: {e}")
+            sample.errors += 1
+            return sample
+
+        slowest = 0.0
+        for collection in collections:
+            for direction in self.pipeline.processor.DIRECTIONS:
+                try:
+                    slowest = max(slowest, await self._measure_direction(point, direction, collection, kote, sample))
+                except Exception as e:
+                    detailed_logger.warning(f"Plan: {collection} {direction} of {point} failed: {e}")
+                    sample.errors += 1
+        # The pipeline processes the directions and collections of a point concurrently
+        sample.seconds = elevation_seconds + slowest
+        return sample
+
+    def _tile_fetches(self, cells):
+        terrain = self.pipeline.terrain
+        if terrain is None:
+            return 0
+        return sum(1 for cell in cells if not os.path.exists(terrain.path(cell)))
+
+    async def plan(self, points, collection=None):
+        """
+        :param points: Iterable of (x, y, point_id) in EPSG:25832.
+        :param collection: Collection or list of collections, defaults to the configured ones.
+        :return: Dictionary of the estimates, see format_plan().
+        """
+        from .terrain import TILE_SIZE, DEFAULT_WCS_URL
+        from .elevation import DHM_POINT_URL
+
+        pipeline = self.pipeline
+        config = pipeline.config
+        collection = collection or config.collection
+        collections = [collection] if isinstance(collection, str) else list(collection)
+        points, duplicates = dedupe(points)
+        groups = group_points(points, TILE_SIZE)
+        # Counted before sampling, which fetches the tiles of its own points
+        tile_fetches = self._tile_fetches(groups)
+        size = min(len(points), max(self.minimum, min(self.maximum, math.ceil(len(points) * self.fraction))))
+        chosen = sample_groups(groups, size, self.rng)
+        logger.info(f"Planning {len(points)} points in {len(groups)} cells from a sample of {len(chosen)}")
+
+        samples = []
+        for i, point in enumerate(chosen, start=1):
+            samples.append(await self.measure((point[0], point[1]), collections))
+            detailed_logger.debug(f"Plan: sampled {i} of {len(chosen)} points")
+
+        measured = [sample for sample in samples if not sample.errors] or samples
+        count = len(points)
+        scale = count / len(measured) if measured else 0
+
+        requests = Counter()
+        busy = Counter()
+        for sample in measured:
+            requests.update(sample.requests)
+            busy.update(sample.busy)
+        requests = Counter({host: round(value * scale) for host, value in requests.items()})
+        busy = Counter({host: value * scale for host, value in busy.items()})
+
+        api_share = sum(sample.elevation_api for sample in measured) / len(measured) if measured else 1
+        if pipeline.terrain is not None:
+            requests[host_of(DEFAULT_WCS_URL)] += tile_fetches
+        requests[host_of(DHM_POINT_URL)] += round(count * api_share)
+
+        mean_seconds = sum(sample.seconds for sample in measured) / len(measured) if measured else 0
+        bounds = {"concurrency": count * mean_seconds / config.max_concurrent_requests}
+        bounds.update({host: seconds / config.limit_per_host for host, seconds in busy.items()})
+        bottleneck = max(bounds, key=bounds.get)
+
+        quotas = config.api_quotas or {}
+        return {
+            "points": count,
+            "duplicates": duplicates,
+            "cells": len(groups),
+            "sampled": len(samples),
+            "sample_errors": sum(sample.errors for sample in samples),
+            "requests": {host: value for host, value in requests.most_common() if value},
+            "terrain_tiles": tile_fetches,
+            "read_bytes": round(scale * sum(sample.read_bytes for sample in measured)),
+            "files": round(scale * sum(sample.files for sample in measured)),
+            "disk_bytes": round(scale * sum(sample.disk_bytes for sample in measured)),
+            "seconds_per_point": mean_seconds,
+            "runtime": bounds[bottleneck],
+            "bottleneck": bottleneck,
+            "quota_days": {host: requests.get(host, 0) / quota for host, quota in quotas.items() if quota},
+        }
+
+
+def format_bytes(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def format_plan(plan):
+    """Human readable report of CapacityPlanner.plan()."""
+    hours, rest = divmod(plan["runtime"], 3600)
+    lines = [
+        f"Points: {plan['points']} ({plan['duplicates']} duplicates dropped) in {plan['cells']} 1 km cells",
+        f"Sampled: {plan['sampled']} points, {plan['sample_errors']} failed requests or reads",
+        "Requests per host:",
+        *(f"  {host}: {count}" for host, count in plan["requests"].items()),
+        f"Terrain tiles to fetch: {plan['terrain_tiles']}",
+        f"Image data read: {format_bytes(plan['read_bytes'])}",
+        f"Disk: {format_bytes(plan['disk_bytes'])} in {plan['files']} crops",
+        f"Runtime: {int(hours)} h {rest / 60:.0f} min, {plan['seconds_per_point']:.2f} s per point, limited by {plan['bottleneck']}",
+    ]
+    for host, days in plan["quota_days"].items():
+        lines.append(f"Quota of {host}: {days:.2f} days of requests" + (" (over the daily quota)" if days > 1 else ""))
+    return "\n".join(lines)
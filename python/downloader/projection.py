@@ -0,0 +1,91 @@
+from functools import lru_cache
+
+from .coordinates import DEFAULT_CHUNK_SIZE, X_COLUMNS, Y_COLUMNS, LON_COLUMNS, LAT_COLUMNS, open_coordinates, open_writer
+from .log import logger, detailed_logger
+
+WGS84 = "EPSG:4326"
+ETRS89_UTM32N = "EPSG:25832"
+
+
+@lru_cache(maxsize=None)
+def get_transformer(source=WGS84, target=ETRS89_UTM32N):
+    """
+    Cached transformer between two CRSs. Coordinates are always x/longitude first,
+    whatever the axis order of the CRS definitions.
+    """
+    from pyproj import Transformer
+
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+@lru_cache(maxsize=None)
+def is_geographic(crs):
+    from pyproj import CRS
+
+    return CRS(crs).is_geographic
+
+
+def transform_chunks(chunks, source=WGS84, target=ETRS89_UTM32N, swap_axes=False):
+    """
+    Reprojects chunks of points, each in one vectorised call.
+
+    :param chunks: Iterable of (xy, ids) as yielded by CoordinateReader.chunks().
+    :param swap_axes: The input has latitude/y first.
+    :return: Generator of (xy, ids) in the target CRS. Points that can't be reprojected
+        are dropped and counted in the generator's return value.
+    """
+    import numpy as np
+
+    transformer = get_transformer(source, target)
+    failed = 0
+    for xy, ids in chunks:
+        if not len(xy):
+            continue
+        if swap_axes:
+            xy = xy[:, ::-1]
+        x, y = transformer.transform(xy[:, 0], xy[:, 1])
+        transformed = np.column_stack([x, y])
+        # pyproj returns inf for points outside the projection's domain
+        valid = np.isfinite(transformed).all(axis=1)
+        if not valid.all():
+            failed += int((~valid).sum())
+            detailed_logger.warning(f"Dropping {int((~valid).sum())} points that can't be reprojected to {target}")
+            transformed = transformed[valid]
+            if ids is not None:
+                ids = [point_id for point_id, keep in zip(ids, valid) if keep]
+        yield transformed, ids
+    return failed
+
+
+def convert_file(input_path, output_path, source=WGS84, target=ETRS89_UTM32N, input_format=None, output_format=None,
+                 swap_axes=False, precision=None, chunk_size=DEFAULT_CHUNK_SIZE, **options):
+    """
+    Streams a coordinate file into another CRS, chunk by chunk, so files of any size are
+    converted in constant memory. The output is written in a format download_from_coordinates
+    reads, plain "x y" lines unless output_path or output_format says otherwise.
+
+    :param precision: Decimals in text output, defaults to millimetres or about the same in degrees.
+    :param options: Passed to the reader, e.g. x_column or id_column.
+    :return: Dictionary with the number of points converted, invalid in the input and failed to reproject.
+    """
+    if is_geographic(source):
+        # Look for lon/lat columns in CSV and Parquet files as well
+        options.setdefault('x_candidates', X_COLUMNS + LON_COLUMNS)
+        options.setdefault('y_candidates', Y_COLUMNS + LAT_COLUMNS)
+    if precision is None:
+        precision = 8 if is_geographic(target) else 3
+
+    reader = open_coordinates(input_path, input_format, chunk_size=chunk_size, **options)
+    chunks = transform_chunks(reader.chunks(), source, target, swap_axes)
+    failed = 0
+    with open_writer(output_path, output_format, precision=precision) as writer:
+        while True:
+            try:
+                writer.write(*next(chunks))
+            except StopIteration as stop:
+                failed = stop.value
+                break
+
+    totals = {"converted": writer.count, "invalid": reader.invalid, "failed": failed}
+    logger.info(f"Converted {input_path} from {source} to {target} in {output_path}: {totals}")
+    return totals
@@ -0,0 +1,240 @@
+import re
+import time
+import random
+import asyncio
+import urllib.parse
+from email.utils import parsedate_to_datetime
+
+from .log import logger, detailed_logger
+
+# Client errors that are worth retrying, every 5xx is as well
+RETRY_STATUSES = {408, 425, 429}
+
+# GDAL reports the status of failed HTTP reads in the message only
+GDAL_STATUS = re.compile(r"HTTP response code:\s*(\d{3})")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host whose circuit breaker is open."""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"Circuit breaker for {host} is open, retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def _chain(error):
+    # The error and the errors it was raised from, as the processors wrap the aiohttp errors
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def http_status(error):
+    """:return: HTTP status of a failed request in the error's chain, or None."""
+    for e in _chain(error):
+        status = getattr(e, "status", None)
+        if isinstance(status, int):
+            return status
+        match = GDAL_STATUS.search(str(e))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def retry_after(error):
+    """:return: Seconds asked for by the Retry-After header of a failed response, or None."""
+    for e in _chain(error):
+        headers = getattr(e, "headers", None)
+        value = headers.get("Retry-After") if headers else None
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def is_transient(error):
+    """
+    True for errors that say more about the host than the request: 5xx and throttling
+    responses, timeouts and failed connections. These count against a circuit breaker.
+    """
+    import aiohttp
+
+    if any(isinstance(e, CircuitOpenError) for e in _chain(error)):
+        return False
+    status = http_status(error)
+    if status is not None:
+        return status >= 500 or status in RETRY_STATUSES
+    for e in _chain(error):
+        if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        # rasterio's errors for failed remote reads, without importing rasterio here
+        if type(e).__name__ in ("RasterioIOError", "CPLE_HttpResponseError", "CPLE_OpenFailedError"):
+            return True
+    return False
+
+
+def is_retryable(error):
+    """False for responses that will fail again, like a 404. Other errors are retried."""
+    status = http_status(error)
+    return status is None or status >= 500 or status in RETRY_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after failure_threshold transient failures in a row.
+
+    Used as a context manager around each request: entering raises CircuitOpenError while
+    the breaker is open, and leaving records the outcome. After reset_timeout seconds one
+    request is let through as a probe, which closes the breaker if it succeeds and opens
+    it for another reset_timeout if it fails. Errors that aren't transient, like a 404,
+    show that the host is up and count as successes.
+    """
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def __enter__(self):
+        if self.opened_at is not None:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.probing:
+                raise CircuitOpenError(self.host, max(remaining, 1.0))
+            self.probing = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and is_transient(exc):
+            self.record_failure()
+        elif not isinstance(exc, CircuitOpenError):
+            self.record_success()
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.host} is responding again, closing its circuit breaker")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                self.trips += 1
+                logger.warning(f"{self.host} failed {self.failures} times in a row, "
+                               f"pausing requests to it for {self.reset_timeout}s")
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class _NoBreaker:
+    """Stands in for a breaker around local reads."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_BREAKER = _NoBreaker()
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per host, created on first use."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+
+    def for_url(self, url):
+        """:return: The breaker of the URL's host, or one that does nothing for local paths."""
+        host = urllib.parse.urlsplit(url).netloc if isinstance(url, str) else ""
+        if not host or not url.lower().startswith(("http://", "https://")):
+            return NO_BREAKER
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def trips(self):
+        """:return: Dictionary of host -> times its breaker opened, for hosts whose breaker did."""
+        return {host: breaker.trips for host, breaker in self.breakers.items() if breaker.trips}
+
+
+class RetryPolicy:
+    """
+    Retries one stage of the work, such as a STAC query or a COG read, on its own.
+
+    Failed attempts wait a random time between 0 and retry_delay * 2^(attempt - 1),
+    capped at max_delay (full jitter), so retries from many tasks don't arrive together,
+    but never less than a Retry-After header asks for. Waiting for an open circuit breaker
+    doesn't use up attempts, since no request was sent, until max_outage seconds have
+    been spent waiting.
+    """
+
+    def __init__(self, retry_limit=3, retry_delay=1, max_delay=30, max_outage=300):
+        self.retry_limit = max(1, retry_limit)
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.max_outage = max_outage
+        self.retries = 0
+
+    def backoff(self, attempt, error=None):
+        delay = random.uniform(0, min(self.max_delay, self.retry_delay * 2 ** (attempt - 1)))
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_outage))
+        return delay
+
+    async def call(self, stage, func, *args, **kwargs):
+        """
+        Awaits func(*args, **kwargs) until it succeeds, fails with an error that isn't
+        worth retrying, or has failed retry_limit times.
+
+        :param stage: Description of the stage for the log.
+        :return: The result of func.
+        """
+        attempt = 0
+        outage = 0.0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                circuit_open = next((c for c in _chain(e) if isinstance(c, CircuitOpenError)), None)
+                if circuit_open is not None:
+                    if outage >= self.max_outage:
+                        raise
+                    delay = circuit_open.retry_after + random.uniform(0, self.retry_delay)
+                    outage += delay
+                    detailed_logger.debug(f"{stage} waits {delay:.1f}s for {circuit_open.host} to recover")
+                    await asyncio.sleep(delay)
+                    continue
+
+                attempt += 1
+                if attempt >= self.retry_limit or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                self.retries += 1
+                detailed_logger.debug(f"{stage} failed on attempt {attempt}: {e}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,136 @@
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+
+from .pipeline import Pipeline
+from .stac import STACImageProcessor, crop_filename
+from .log import detailed_logger
+
+Crop = namedtuple("Crop", ["data", "etag"])
+
+
+def crop_path(config, center_coord, direction, crop_size, collection=None):
+    """
+    Path of a crop in the image cache. Sizes from crop_sizes share the files written by
+    the batch script, so anything it has already downloaded is served directly.
+
+    :param collection: Defaults to the first configured collection.
+    :return: Path to the cached JPEG.
+    """
+    collection = collection or config.collections[0]
+    coord_dir = os.path.join(config.collection_dir(collection), f"{center_coord[0]}_{center_coord[1]}")
+    if crop_size in config.crop_sizes:
+        return os.path.join(coord_dir, crop_filename(direction, config.crop_sizes.index(crop_size) + 1))
+    return os.path.join(coord_dir, f"cropped_{direction}_{crop_size}px.png")
+
+
+class CropService:
+    """
+    Serves single crops on demand for synchronous callers such as the Flask app.
+
+    Lookups go through an in-memory LRU, then the on-disk image cache, and only then to
+    the STAC, elevation and COG APIs. Concurrent requests for the same crop share one
+    download. The downloads run on a private event loop in a background thread, which is
+    started on the first request.
+    """
+
+    def __init__(self, config=None, settings_path="settings.yaml", max_entries=256, max_crop_size=2000):
+        self.pipeline = Pipeline(config, settings_path)
+        self.max_entries = max_entries
+        self.max_crop_size = max_crop_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="crop-service", daemon=True).start()
+            return self._loop
+
+    def _remember(self, key, crop):
+        with self._lock:
+            self._memory[key] = crop
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    async def _download(self, center_coord, direction, crop_size, collection):
+        pipeline = self.pipeline
+        kote = await pipeline.elevation.get_kote(center_coord)
+        if kote == None or kote == -9999.0 or kote == 0.0:
+            raise Exception("Elevation data is missing or invalid")
+        return await pipeline.processor.crop_image(center_coord, collection, kote, direction, crop_size)
+
+    def _load(self, center_coord, direction, crop_size, collection):
+        path = crop_path(self.pipeline.config, center_coord, direction, crop_size, collection)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        future = asyncio.run_coroutine_threadsafe(self._download(center_coord, direction, crop_size, collection),
+                                                  self._get_loop())
+        data = future.result()
+        if data is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return data
+
+    def get_crop(self, center_coord, direction, crop_size, collection=None):
+        """
+        Returns the crop for a coordinate and direction, downloading it if it isn't cached.
+
+        :param center_coord: Coordinate (x, y) in EPSG:25832.
+        :param direction: One of STACImageProcessor.DIRECTIONS.
+        :param crop_size: Side length of the crop in pixels.
+        :param collection: One of the configured collections, defaults to the first.
+        :return: Crop with JPEG data and ETag, or None if no image covers the coordinate.
+        """
+        collections = self.pipeline.config.collections
+        collection = collection or collections[0]
+        if direction not in STACImageProcessor.DIRECTIONS:
+            raise ValueError(f"Unknown direction: {direction}")
+        if not 0 < crop_size <= self.max_crop_size:
+            raise ValueError(f"Crop size must be between 1 and {self.max_crop_size}")
+        if collection not in collections:
+            raise ValueError(f"Unknown collection: {collection}")
+
+        key = (center_coord[0], center_coord[1], direction, crop_size, collection)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            # Someone else is already loading this crop
+            return future.result()
+
+        try:
+            data = self._load(center_coord, direction, crop_size, collection)
+            crop = Crop(data, hashlib.sha1(data).hexdigest()) if data is not None else None
+            if crop is not None:
+                self._remember(key, crop)
+            future.set_result(crop)
+        except Exception as e:
+            detailed_logger.error(f"Failed to load crop {key}: {e}")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return future.result()
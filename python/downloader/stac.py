@@ -0,0 +1,380 @@
+import io
+import os
+import json
+import asyncio
+import urllib.parse
+
+import aiohttp
+
+from geotiff_utils import update_center  # Import the function from geotiff_utils.py
+from .log import logger, detailed_logger
+from .memory import expected_crop_bytes
+from .archive import open_image
+
+
+def load_image_module():
+    """
+    Imports PIL on first use, so importing the library stays cheap.
+
+    :return: The PIL.Image module.
+    """
+    from PIL import Image
+
+    # Set the max image pixels to None to avoid decompression bomb warnings
+    Image.MAX_IMAGE_PIXELS = None
+    return Image
+
+
+def crop_filename(direction, box):
+    """
+    File name of a cropped image in a coordinate folder of the image cache.
+
+    :param direction: Direction of the image.
+    :param box: 1-based index of the crop size in crop_sizes.
+    :return: File name.
+    """
+    return f"cropped_{direction}_box_{box}.png"
+
+
+def crop_window(src, image_coord, crop_size):
+    """
+    Square window centered on an image coordinate, clipped at the right and bottom edges.
+
+    :param src: Open rasterio dataset.
+    :param image_coord: (x, y) pixel coordinate with origin in the bottom-left corner.
+    :param crop_size: Side length of the window in pixels.
+    :return: rasterio Window.
+    """
+    from rasterio.windows import Window
+
+    image_x, image_y = image_coord
+    half_crop = crop_size // 2
+
+    # Adjust y-coordinate for top-left origin (invert y-coordinate)
+    adjusted_y = src.height - image_y
+
+    # Define the window of interest for partial read
+    return Window(
+        col_off=max(0, image_x - half_crop),
+        row_off=max(0, adjusted_y - half_crop),
+        width=min(crop_size, src.width - (image_x - half_crop)),
+        height=min(crop_size, src.height - (adjusted_y - half_crop))
+    )
+
+
+def read_crop(src, image_coord, crop_size):
+    """
+    Reads a square window centered on an image coordinate from an open raster.
+
+    :param src: Open rasterio dataset.
+    :param image_coord: (x, y) pixel coordinate with origin in the bottom-left corner.
+    :param crop_size: Side length of the window in pixels.
+    :return: Array with shape (height, width, 3).
+    """
+    window = crop_window(src, image_coord, crop_size)
+
+    # Read the window from the COG
+    return src.read(
+        out_shape=(3, int(window.height), int(window.width)),  # Reading RGB bands
+        window=window
+    ).transpose(1, 2, 0)  # Transform to (height, width, bands)
+
+
+def encode_jpeg(array, quality):
+    """
+    Encodes an (height, width, 3) array as JPEG.
+
+    :return: JPEG bytes.
+    """
+    Image = load_image_module()
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class STACImageProcessor:
+    DIRECTIONS = ['north', 'south', 'east', 'west', 'nadir']  # Define DIRECTIONS here
+
+    def __init__(self, api_baseurl, api_token, pipeline):
+        self.api_baseurl = api_baseurl
+        self.api_token = api_token
+        self.pipeline = pipeline
+
+    async def query_items(self, coord, direction, collection, limit=1):
+        """
+        Queries the STAC API for items based on a coordinate and other parameters asynchronously.
+        Single items are resolved from the local footprint index when one is configured.
+
+        :param coord: Coordinate [x, y].
+        :param direction: Direction of the item images.
+        :param collection: Collection to fetch items from.
+        :param limit: Number of results to return.
+        :return: Response data as JSON.
+        """
+        index = self.pipeline.footprints
+        if index is not None and limit == 1:
+            item = index.lookup(coord, direction, collection)
+            if item is not None:
+                return {"type": "FeatureCollection", "features": [item]}
+
+        session = self.pipeline.get_session()
+        stats = self.pipeline.stats
+
+        search_query = {
+            "and": [
+                {"intersects": [{"property": "geometry"}, {"type": "Point", "coordinates": coord}]}
+            ]
+        }
+
+        if direction:
+            search_query["and"].append({"eq": [{"property": "direction"}, direction]})
+
+        if collection:
+            search_query["and"].append({"eq": [{"property": "collection"}, collection]})
+
+        query_string = json.dumps(search_query)
+        query_encoded = urllib.parse.quote(query_string)
+
+        url = (f"{self.api_baseurl}/search?limit={limit}&filter={query_encoded}"
+               "&filter-lang=cql-json&filter-crs=http://www.opengis.net/def/crs/EPSG/0/25832"
+               "&crs=http://www.opengis.net/def/crs/EPSG/0/25832")
+
+        headers = {
+            'token': self.api_token  # Using token as a header
+        }
+        try:
+            with self.pipeline.breakers.for_url(url):
+                async with session.get(url, headers=headers) as response:
+                    if response.status != 200:
+                        stats.status_codes.add(response.status)
+                        # Keeps the status and the Retry-After header for the retry policy
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status,
+                            message=f"API request failed with status code {response.status}", headers=response.headers)
+                    response_data = await response.json()
+                    return response_data
+        except aiohttp.ClientError as e:
+            stats.error_log.add(str(e))
+            logger.error(f"Error querying items: {e}")
+            detailed_logger.error(f"Error querying items: {e}")
+            raise
+
+    async def query_images_for_center(self, center_coord, collection, kote=0, cache_dir=None):
+        """
+        Queries the STAC API for multiple directions around a coordinate and crops the images covering the area.
+        The directions are processed concurrently, and each retries its own query and crop.
+
+        :param center_coord: Coordinate.
+        :param cache_dir: Folder to write the coordinate's folder to, defaults to the configured cache_dir.
+        :return: Dictionary with the crops of each direction, None for directions without an image.
+        :raises Exception: If a direction still failed after its retries, once the others are done.
+        """
+        results = {}
+
+        # Format the folder name based on coordinates
+        coord_folder_name = f"{center_coord[0]}_{center_coord[1]}"
+        coord_dir = os.path.join(cache_dir or self.pipeline.config.cache_dir, coord_folder_name)
+        os.makedirs(coord_dir, exist_ok=True)
+
+        outcomes = await asyncio.gather(
+            *(self.img_from_direction(center_coord, collection, kote, results, coord_dir, direction)
+              for direction in self.DIRECTIONS),
+            return_exceptions=True)
+        failed = {direction: outcome for direction, outcome in zip(self.DIRECTIONS, outcomes) if isinstance(outcome, BaseException)}
+        for direction, e in failed.items():
+            logger.error(f"Error in img_from_direction for '{center_coord}' {direction}: {e}")
+            detailed_logger.error(f"Error in img_from_direction for '{center_coord}' {direction}: {e}")
+
+        await self.create_summary_image(coord_dir)
+        if failed:
+            raise Exception(f"Failed directions for {center_coord}: {', '.join(failed)}") from next(iter(failed.values()))
+        return results
+
+    async def create_summary_image(self, coord_dir):
+        """
+        Creates a summary image from cached cropped images in the given directory and saves it as a summary image.
+
+        :param coord_dir: Directory where cropped images are cached.
+        """
+        config = self.pipeline.config
+        try:
+            # Check if summary image creation is enabled in settings
+            if not config.image_summary:
+                return
+
+            Image = load_image_module()
+
+            # Search for all PNG images in the coord_dir
+            image_files = [os.path.join(coord_dir, f) for f in os.listdir(coord_dir) if f.endswith('.png')]
+            if not image_files:
+                logger.warning(f"No images found in cache directory {coord_dir}")
+                return
+
+            # Sort files alphabetically to ensure consistent layout
+            image_files.sort()
+
+            # Check if summary image already exists
+            summary_image_path = os.path.join(coord_dir, 'summary_image.png')
+            if os.path.exists(summary_image_path):
+                # Open the existing summary image to update it
+                summary_image = Image.open(summary_image_path)
+                detailed_logger.debug(f"Found existing summary image, updating it.")
+            else:
+                # Create a new summary image if it doesn't exist
+                total_width = 0
+                max_height = 0
+                images = []
+
+            # Open images and resize for layout
+            for file in image_files:
+                img = Image.open(file).resize((config.image_resize, config.image_resize))
+                images.append(img)
+                total_width += img.width
+                max_height = max(max_height, img.height)
+
+            # Create a new blank image to hold the summary
+            summary_image = Image.new("RGB", (total_width, max_height))
+
+            # Paste images side by side
+            x_offset = 0
+            for img in images:
+                summary_image.paste(img, (x_offset, 0))
+                x_offset += img.width
+
+            # Save the summary image
+            summary_image.save(summary_image_path, format='PNG')
+            detailed_logger.debug(f"Summary image created/updated and saved at: {summary_image_path}")
+
+        except Exception as e:
+            detailed_logger.error(f"Failed to create summary image: {e}")
+
+    async def fetch_and_crop_cog(self, image_url, direction, image_coord, coord_dir, item_id=None):
+        """
+        Fetches and crops an image from a Cloud Optimized GeoTIFF (COG). The image is read
+        from the pipeline's image source, a local archive when one is indexed, and from
+        image_url otherwise.
+
+        Args:
+            image_url (str): URL to the COG file.
+            item_id (str): Id of the STAC item, to find the image in a local archive.
+            image_coord (tuple): (x, y) pixel coordinates in the COG where the point of interest is located.
+            coord_dir (str): Directory to save cropped images.
+
+        Returns:
+            dict: Dictionary with paths to cropped images.
+        """
+        config = self.pipeline.config
+        results = {}
+
+        # Define crop sizes (in pixels) and their corresponding output file names
+        crop_outputs = {f"{direction}_box_{i+1}": os.path.join(coord_dir, crop_filename(direction, i+1))
+                                for i in range(len(config.crop_sizes))}
+
+        source = self.pipeline.images
+
+        def read_and_save():
+            import rasterio
+            Image = load_image_module()
+
+            # Open the local file, or the COG directly using rasterio with remote access
+            with rasterio.Env(GDAL_CACHEMAX=config.gdal_cachemax_mb * 1024 * 1024, **source.env), \
+                    open_image(source, item_id, image_url) as src:
+                for i, crop_size in enumerate(config.crop_sizes, start=1):
+                    cropped_img = read_crop(src, image_coord, crop_size)
+
+                    # Save the cropped image as JPEG
+                    cropped_image_path = crop_outputs[f"{direction}_box_{i}"]  # Access the correct path in the dictionary
+
+                    Image.fromarray(cropped_img).save(cropped_image_path, format='JPEG', quality=config.image_quality)
+                    results[f'box_{i}'] = cropped_image_path
+
+        try:
+            # Reserve the decoded size of every crop before reading, and read off the event loop
+            expected_bytes = sum(expected_crop_bytes(crop_size) for crop_size in config.crop_sizes)
+            async with self.pipeline.memory.reserve(expected_bytes):
+                with self.pipeline.breakers.for_url(image_url):
+                    await asyncio.to_thread(read_and_save)
+
+        except Exception as e:
+            logger.error(f"Error fetching and cropping COG: {e}")
+            raise
+        detailed_logger.debug(f"Cropped image: {results}")
+        return results
+
+
+    async def crop_image(self, center_coord, collection, kote, direction, crop_size):
+        """
+        Finds the image covering a coordinate from one direction and crops it, without
+        touching the image cache.
+
+        :param center_coord: Coordinate (x, y) in EPSG:25832.
+        :param collection: Collection to fetch the image from.
+        :param kote: Elevation of the coordinate.
+        :param direction: One of DIRECTIONS.
+        :param crop_size: Side length of the crop in pixels.
+        :return: JPEG bytes, or None if no image covers the coordinate.
+        """
+        response = await self.query_items(center_coord, direction, collection)
+        features = response.get('features') or []
+        if not features:
+            return None
+
+        item = features[0]
+        image_url = item.get('assets', {}).get('data', {}).get('href')
+        update_result = update_center(center_coord, item, kote)
+        if not image_url or not update_result:
+            return None
+        image_coord = update_result['imageCoord']
+
+        config = self.pipeline.config
+        source = self.pipeline.images
+
+        def read_and_encode():
+            import rasterio
+            with rasterio.Env(GDAL_CACHEMAX=config.gdal_cachemax_mb * 1024 * 1024, **source.env), \
+                    open_image(source, item.get('id'), image_url) as src:
+                return encode_jpeg(read_crop(src, image_coord, crop_size), config.image_quality)
+
+        # The window read blocks, so keep it off the event loop
+        async with self.pipeline.memory.reserve(expected_crop_bytes(crop_size)):
+            return await asyncio.to_thread(read_and_encode)
+
+    async def img_from_direction(self, center_coord, collection, kote, results, coord_dir, direction):
+        """
+        Queries the item of one direction and crops its image into coord_dir. The query and
+        the crop are retried separately, so a failed crop doesn't repeat the query.
+
+        :raises Exception: If the query or the crop failed after its retries.
+        """
+        retry = self.pipeline.retry
+
+        # Query the STAC API to get image metadata
+        response = await retry.call(f"STAC query {direction} {center_coord}",
+                                    self.query_items, center_coord, direction, collection)
+
+        # Check if there are any features in the response
+        if not response.get('features'):
+            detailed_logger.error(f"No features found in STAC response for direction '{direction}'")
+            results[direction] = None
+            return
+
+        item = response['features'][0]
+        image_url = item.get('assets', {}).get('data', {}).get('href')
+        if not image_url:
+            error_message = f"No image URL found for direction '{direction}' at coordinate {center_coord}"
+            logger.error(error_message)
+            detailed_logger.error(error_message)
+            results[direction] = None
+            return
+
+        # Update the image coordinate based on the provided center coordinate and elevation (kote)
+        update_result = update_center(center_coord, item, kote)
+        if not update_result:
+            results[direction] = None
+            return
+        image_coord = update_result['imageCoord']
+
+        # Fetch and crop images at the specified sizes
+        results[direction] = await retry.call(
+            f"Crop {direction} {center_coord}", self.fetch_and_crop_cog,
+            image_url, direction, (image_coord[0], image_coord[1]), coord_dir, item.get('id'))
@@ -0,0 +1,307 @@
+import os
+import math
+import asyncio
+import threading
+from collections import OrderedDict
+
+from .log import logger, detailed_logger
+
+# Side of a terrain tile in metres. Tiles are aligned to multiples of this in EPSG:25832,
+# like the 1 km tiles of the Danish elevation model
+TILE_SIZE = 1000
+
+DEFAULT_WCS_URL = "https://services.datafordeler.dk/DHMNedboer/dhm_wcs/1.0.0/WCS"
+COVERAGE = "dhm_terraen"
+
+
+def tile_of(x, y):
+    """:return: (column, row) of the tile containing an EPSG:25832 coordinate."""
+    return math.floor(x / TILE_SIZE), math.floor(y / TILE_SIZE)
+
+
+def tile_bounds(tile):
+    column, row = tile
+    return column * TILE_SIZE, row * TILE_SIZE, (column + 1) * TILE_SIZE, (row + 1) * TILE_SIZE
+
+
+def bilinear(grid, tile, xs, ys):
+    """
+    Samples a tile at EPSG:25832 coordinates by bilinear interpolation between the four
+    nearest pixel centres. Points within half a pixel of the tile edge use the edge pixels.
+
+    :param grid: (n, n) array of heights, first row at the top of the tile.
+    :param xs: Array of x coordinates inside the tile.
+    :param ys: Array of y coordinates inside the tile.
+    :return: Array of heights, NaN where a neighbouring pixel has no data.
+    """
+    import numpy as np
+
+    minx, _, _, maxy = tile_bounds(tile)
+    rows, columns = grid.shape
+    resolution = TILE_SIZE / columns
+    fx = np.clip((xs - minx) / resolution - 0.5, 0, columns - 1)
+    fy = np.clip((maxy - ys) / resolution - 0.5, 0, rows - 1)
+    x0 = np.minimum(np.floor(fx).astype(np.intp), columns - 2)
+    y0 = np.minimum(np.floor(fy).astype(np.intp), rows - 2)
+    wx = fx - x0
+    wy = fy - y0
+    top = grid[y0, x0] * (1 - wx) + grid[y0, x0 + 1] * wx
+    bottom = grid[y0 + 1, x0] * (1 - wx) + grid[y0 + 1, x0 + 1] * wx
+    return top * (1 - wy) + bottom * wy
+
+
+def raster_bounds(src):
+    """:return: (left, bottom, right, top) of a north-up raster."""
+    transform = src.transform
+    return (transform.c, transform.f + transform.e * src.height,
+            transform.c + transform.a * src.width, transform.f)
+
+
+def read_tile(src, tile, size):
+    """
+    Resamples the part of an open north-up raster covering a tile onto the tile grid.
+
+    :param src: Open rasterio dataset in EPSG:25832.
+    :param size: Pixels per tile side.
+    :return: (size, size) float32 array, NaN where the raster has no data.
+    """
+    import numpy as np
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+
+    grid = np.full((size, size), np.nan, dtype=np.float32)
+    minx, _, _, maxy = tile_bounds(tile)
+    left, bottom, right, top = raster_bounds(src)
+    resolution = TILE_SIZE / size
+    # Tile pixels that lie wholly inside the raster
+    first_column = max(0, math.ceil((left - minx) / resolution - 1e-9))
+    last_column = min(size, math.floor((right - minx) / resolution + 1e-9))
+    first_row = max(0, math.ceil((maxy - top) / resolution - 1e-9))
+    last_row = min(size, math.floor((maxy - bottom) / resolution + 1e-9))
+    if first_column >= last_column or first_row >= last_row:
+        return grid
+
+    transform = src.transform
+    window = Window((minx + first_column * resolution - transform.c) / transform.a,
+                    (maxy - first_row * resolution - transform.f) / transform.e,
+                    (last_column - first_column) * resolution / transform.a,
+                    (last_row - first_row) * resolution / -transform.e)
+    data = src.read(1, window=window, out_shape=(last_row - first_row, last_column - first_column),
+                    masked=True, resampling=Resampling.bilinear)
+    grid[first_row:last_row, first_column:last_column] = np.ma.filled(data.astype(np.float32), np.nan)
+    return grid
+
+
+class TerrainCache:
+    """
+    Local cache of terrain model tiles for elevation lookups.
+
+    Tiles of TILE_SIZE metres are fetched from the elevation WCS, or imported from DTM
+    GeoTIFFs with import_geotiff(), and stored as .npy files that are memory-mapped when
+    read, so only the pages around sampled points are loaded. Open tiles are kept in an
+    LRU, and the oldest files are deleted when the cache outgrows max_bytes. A tile that
+    can't be fetched is remembered as missing for the rest of the run, and its points are
+    left to the remote point API. The first failed fetch of a run is logged as a warning,
+    as it usually means the WCS or its credentials are wrong.
+
+    :param cache_dir: Folder of the tile files.
+    :param resolution: Pixel size in metres of fetched tiles.
+    :param max_bytes: Disk space for tiles.
+    """
+
+    def __init__(self, cache_dir, resolution=1.0, max_bytes=2 << 30, max_open=64,
+                 wcs_url=DEFAULT_WCS_URL, username=None, password=None):
+        self.cache_dir = cache_dir
+        self.size = int(round(TILE_SIZE / resolution))
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self.wcs_url = wcs_url
+        self.username = username
+        self.password = password
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._open = OrderedDict()
+        self._files = None
+        self._missing = set()
+        self._fetch_failed = False
+        self._fetching = {}
+        self._lock = threading.Lock()
+
+    def path(self, tile):
+        return os.path.join(self.cache_dir, f"dtm_{TILE_SIZE}_{tile[0]}_{tile[1]}.npy")
+
+    def _scan(self):
+        # Sizes and ages of the stored tiles, read on first use
+        if self._files is None:
+            files = []
+            if os.path.isdir(self.cache_dir):
+                for entry in os.scandir(self.cache_dir):
+                    if entry.name.endswith(".npy"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+            self._files = OrderedDict((path, size) for _, path, size in sorted(files))
+        return self._files
+
+    def load(self, tile):
+        """:return: Memory-mapped (n, n) array of a stored tile, or None."""
+        import numpy as np
+
+        path = self.path(tile)
+        with self._lock:
+            grid = self._open.get(path)
+            if grid is not None:
+                self._open.move_to_end(path)
+                return grid
+        try:
+            grid = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._scan().move_to_end(path)
+            self._open[path] = grid
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return grid
+
+    def store(self, tile, grid):
+        """Writes a tile and evicts the least recently used tiles over max_bytes."""
+        import numpy as np
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(tile)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(grid, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._open.pop(path, None)
+            self._missing.discard(tile)
+            files = self._scan()
+            files[path] = os.path.getsize(path)
+            files.move_to_end(path)
+            total = sum(files.values())
+            while total > self.max_bytes and len(files) > 1:
+                old_path, old_size = files.popitem(last=False)
+                total -= old_size
+                self._open.pop(old_path, None)
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+
+    def sample(self, xs, ys):
+        """
+        Heights of points from the stored tiles, grouped so each tile is read once.
+
+        :return: Array of heights, NaN for points in tiles that aren't stored or have no data.
+        """
+        import numpy as np
+
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        heights = np.full(xs.shape, np.nan)
+        columns = np.floor(xs / TILE_SIZE).astype(np.int64)
+        rows = np.floor(ys / TILE_SIZE).astype(np.int64)
+        for column, row in set(zip(columns.tolist(), rows.tolist())):
+            grid = self.load((column, row))
+            if grid is None:
+                continue
+            selected = (columns == column) & (rows == row)
+            heights[selected] = bilinear(grid, (column, row), xs[selected], ys[selected])
+        return heights
+
+    def wcs_request(self, tile):
+        minx, miny, maxx, maxy = tile_bounds(tile)
+        return (f"{self.wcs_url}?service=WCS&version=1.0.0&request=GetCoverage&coverage={COVERAGE}"
+                f"&crs=EPSG:25832&bbox={minx},{miny},{maxx},{maxy}&width={self.size}&height={self.size}"
+                f"&format=GTiff&username={self.username}&password={self.password}")
+
+    def _decode(self, tile, data):
+        from rasterio.io import MemoryFile
+
+        with MemoryFile(data) as memory_file, memory_file.open() as src:
+            grid = read_tile(src, tile, self.size)
+        self.store(tile, grid)
+
+    async def _fetch(self, session, tile):
+        self.fetches += 1
+        try:
+            async with session.get(self.wcs_request(tile)) as response:
+                response.raise_for_status()
+                data = await response.read()
+            # Decoding and writing the tile happen off the event loop
+            await asyncio.to_thread(self._decode, tile, data)
+            detailed_logger.debug(f"Fetched terrain tile {tile}")
+            return True
+        except Exception as e:
+            # WCS errors are XML documents, which fail to decode as a raster
+            if not self._fetch_failed:
+                self._fetch_failed = True
+                logger.warning(f"Could not fetch terrain tile {tile} from {self.wcs_url}, using the point API "
+                               f"for points in tiles that fail: {e}")
+            detailed_logger.debug(f"Terrain tile {tile} not available: {e}")
+            with self._lock:
+                self._missing.add(tile)
+            return False
+
+    async def ensure(self, session, tiles):
+        """Fetches the tiles that aren't stored yet. Concurrent callers share each fetch."""
+        waits = []
+        for tile in set(tiles):
+            if tile in self._missing or self.load(tile) is not None:
+                continue
+            task = self._fetching.get(tile)
+            if task is None:
+                task = self._fetching[tile] = asyncio.ensure_future(self._fetch(session, tile))
+                task.add_done_callback(lambda _, tile=tile: self._fetching.pop(tile, None))
+            waits.append(task)
+        if waits:
+            await asyncio.gather(*waits)
+
+    async def get_heights(self, session, points):
+        """
+        :param points: Sequence of (x, y) in EPSG:25832.
+        :return: Array of heights, NaN for points without terrain data.
+        """
+        import numpy as np
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        await self.ensure(session, [tile_of(x, y) for x, y in points.tolist()])
+        heights = self.sample(points[:, 0], points[:, 1])
+        found = int(np.count_nonzero(~np.isnan(heights)))
+        self.hits += found
+        self.misses += len(heights) - found
+        return heights
+
+    def import_geotiff(self, path):
+        """
+        Cuts a DTM GeoTIFF in EPSG:25832 into tiles. Cells the file doesn't cover keep the
+        values of a tile that is already stored, so adjacent files can be imported in turn.
+
+        :return: Number of tiles written.
+        """
+        import numpy as np
+        import rasterio
+
+        written = 0
+        with rasterio.open(path) as src:
+            left, bottom, right, top = raster_bounds(src)
+            # Exclusive upper edges, so a file ending on a tile edge doesn't touch the next tile
+            first_column, first_row = tile_of(left, bottom)
+            last_column, last_row = tile_of(math.nextafter(right, -math.inf), math.nextafter(top, -math.inf))
+            for column in range(first_column, last_column + 1):
+                for row in range(first_row, last_row + 1):
+                    tile = (column, row)
+                    grid = read_tile(src, tile, self.size)
+                    if np.isnan(grid).all():
+                        continue
+                    existing = self.load(tile)
+                    if existing is not None and existing.shape == grid.shape:
+                        grid = np.where(np.isnan(grid), existing, grid)
+                    self.store(tile, grid)
+                    written += 1
+        logger.info(f"Imported {written} terrain tiles from {path}")
+        return written
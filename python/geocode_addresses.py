@@ -0,0 +1,45 @@
+import asyncio
+import argparse
+
+from downloader import Config, configure_logging
+from downloader.geocoding import BatchGeocoder, GeocodeCache, get_geocoder, geocode_file
+
+parser = argparse.ArgumentParser(prog='geocode_addresses',
+                                 description="Geocodes an address list into EPSG:25832 coordinates for download_from_coordinates")
+parser.add_argument("input", help="Text file with one address per line, or CSV file with an address column")
+parser.add_argument("output", help="Coordinate file, .txt for 'x y id' lines or .csv")
+parser.add_argument("--geocoder", type=str, help="Geocoder to use, defaults to geocoder in the settings file")
+parser.add_argument("--geocoder-file", type=str, help="CSV file of addresses and coordinates for the local geocoder")
+parser.add_argument("--address-column", type=str, help="Name of the address column in CSV files")
+parser.add_argument("--id-column", type=str, help="Name of the id column in CSV files, written as the point id")
+parser.add_argument("--unresolved", type=str, default="unresolved_addresses.txt", help="File for addresses that couldn't be geocoded")
+parser.add_argument("--no-cache", action="store_true", help="Don't read or write the geocode cache")
+parser.add_argument("-s", "--settings", type=str, default="settings.yaml", help="Path to the settings file")
+
+
+async def main():
+    import aiohttp
+
+    args = parser.parse_args()
+    config = Config.load(args.settings)
+    configure_logging(config.logging_level)
+
+    name = args.geocoder or config.geocoder
+    options = {"path": args.geocoder_file or config.geocoder_file} if name == "local" else {}
+    cache = None if args.no_cache else GeocodeCache(config.geocode_cache)
+    batch_geocoder = BatchGeocoder(get_geocoder(name, **options), cache,
+                                   concurrency=config.geocode_concurrency, rate=config.geocode_rate)
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            totals = await geocode_file(args.input, args.output, batch_geocoder, session, args.address_column,
+                                        args.id_column, unresolved_path=args.unresolved)
+    finally:
+        if cache:
+            cache.close()
+    print(f"Wrote {totals['written']} of {totals['distinct']} distinct addresses to {args.output}, "
+          f"{totals['cached']} from the cache and {totals['requests']} looked up with {name}")
+    if totals['unresolved']:
+        print(f"{totals['unresolved']} addresses could not be geocoded, see {args.unresolved}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,6 @@
 import math
 import logging
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+
 logger = logging.getLogger(__name__)
 
 # These functions are imported from node_modules/@dataforsyningen/saul/modules/saul-core.js or '@dataforsyningen/saul' 
@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+
+from downloader import Config, Pipeline, configure_logging
+from downloader.footprints import FootprintIndex, harvest
+
+parser = argparse.ArgumentParser(prog='harvest_footprints',
+                                 description="Builds or refreshes the local footprint index for a collection")
+parser.add_argument("-c", "--collection", type=str, action="append",
+                    help="Collection to harvest, can be repeated. Defaults to the collections in the settings file")
+parser.add_argument("-o", "--output", type=str, help="Path to the index, defaults to footprint_index in the settings file")
+parser.add_argument("-s", "--settings", type=str, default="settings.yaml", help="Path to the settings file")
+parser.add_argument("--prune", action="store_true", help="Remove items that are no longer in the collection")
+
+
+async def main():
+    args = parser.parse_args()
+    config = Config.load(args.settings)
+    configure_logging(config.logging_level)
+
+    index = FootprintIndex(args.output or config.footprint_index or "footprints.sqlite")
+    try:
+        async with Pipeline(config) as pipeline:
+            for collection in args.collection or config.collections:
+                totals = await harvest(pipeline, index, collection, prune=args.prune)
+                print(f"{collection}: {totals}, items per direction: {index.count(collection)}")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
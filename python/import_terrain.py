@@ -0,0 +1,28 @@
+import glob
+import argparse
+
+from downloader import Config, configure_logging
+from downloader.terrain import TerrainCache
+
+parser = argparse.ArgumentParser(prog='import_terrain',
+                                 description="Imports DTM GeoTIFFs in EPSG:25832 into the local terrain tile cache")
+parser.add_argument("files", nargs="+", help="GeoTIFF files or glob patterns, e.g. DTM_1km_*.tif")
+parser.add_argument("-o", "--output", type=str, help="Terrain cache folder, defaults to terrain_cache in the settings file")
+parser.add_argument("-s", "--settings", type=str, default="settings.yaml", help="Path to the settings file")
+
+
+def main():
+    args = parser.parse_args()
+    config = Config.load(args.settings)
+    configure_logging(config.logging_level)
+
+    cache = TerrainCache(args.output or config.terrain_cache or "terrain_cache",
+                         resolution=config.terrain_resolution, max_bytes=config.terrain_cache_mb * 1024 * 1024)
+    paths = sorted({path for pattern in args.files for path in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit("No files matched")
+    tiles = sum(cache.import_geotiff(path) for path in paths)
+    print(f"Imported {tiles} tiles from {len(paths)} files into {cache.cache_dir}")
+
+if __name__ == "__main__":
+    main()
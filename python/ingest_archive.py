@@ -0,0 +1,28 @@
+import argparse
+
+from downloader import Config, configure_logging
+from downloader.archive import LocalArchive
+
+parser = argparse.ArgumentParser(prog='ingest_archive',
+                                 description="Indexes a local archive of oblique images, so crops are read from disk instead of the STAC hrefs")
+parser.add_argument("archive", nargs="?", help="Archive directory, defaults to image_archive in the settings file")
+parser.add_argument("-s", "--settings", type=str, default="settings.yaml", help="Path to the settings file")
+
+
+def main():
+    args = parser.parse_args()
+    config = Config.load(args.settings)
+    configure_logging(config.logging_level)
+
+    root = args.archive or config.image_archive
+    if not root:
+        raise SystemExit("No archive directory given and image_archive is not set in the settings file")
+    archive = LocalArchive(root)
+    try:
+        totals = archive.ingest()
+        print(f"{root}: {totals}, {archive.count()} images indexed")
+    finally:
+        archive.close()
+
+if __name__ == "__main__":
+    main()
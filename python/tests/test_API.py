@@ -12,7 +12,9 @@ from aioresponses import aioresponses
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from download_from_coordinates import *
+from downloader import *
+from downloader.log import detailed_logger
+import logging
 detailed_logger.info(f"RUNNING TEST ENVIRONMENT \n")
 
 # Initial setup variables
@@ -36,6 +38,12 @@ threshold = 50
 collection = "skraafotos2021"
 total_coords = len(coordinates)
 
+# Every test runs against its own pipeline, so no module globals have to be reset
+config = Config.load(os.path.join(os.path.dirname(__file__), '..', 'settings.yaml'), threshold=threshold, collection=collection)
+retry_limit = config.retry_limit
+limit_per_host = config.limit_per_host
+pipeline = Pipeline(config)
+
  # Set up a semaphore to limit concurrency
 semaphore = asyncio.Semaphore(10)
 
@@ -48,8 +56,8 @@ test_folders = [
 @pytest.fixture(autouse=True)
 async def before_each():
     #Resets variable counters
-    reset_counters()
-    await create_shared_session()
+    pipeline.reset_counters()
+    pipeline.get_session()
     
     #Removes all cached images
     for folder in test_folders: 
@@ -57,7 +65,7 @@ async def before_each():
         if os.path.exists(folder_path) and os.path.isdir(folder_path):
             shutil.rmtree(folder_path)
     yield
-    await close_shared_session()
+    await pipeline.close_session()
 
 #Unit testing of process_coordinates
 @pytest.mark.asyncio
@@ -69,12 +77,13 @@ async def test_process_coordinate():
 
     semaphore = asyncio.Semaphore(10)
     for coordinate in coordinates:
-        await process_coordinate(
-            processor_mock, elevation_mock, coordinate, "skraafoto2021", semaphore, total_coords
+        await pipeline.process_coordinate(
+            processor_mock, elevation_mock, coordinate, collection, semaphore, total_coords
         ) 
 
-    # Assert the mocked methods were called as expected
-    processor_mock.query_images_for_center.assert_called_with(coordinates[total_coords-1], "skraafoto2021", mock_kote)
+    # Assert the mocked methods were called as expected. The configured collection is written to cache_dir itself
+    processor_mock.query_images_for_center.assert_called_with(coordinates[total_coords-1], collection, mock_kote,
+                                                              cache_dir=config.cache_dir)
     elevation_mock.get_kote.assert_called_with(coordinates[total_coords-1])
 
 
@@ -110,13 +119,11 @@ async def test_process_coordinate_failure():
     semaphore = asyncio.Semaphore(10)
     for coordinate in coordinates:
         try:
-            await process_coordinate(
+            await pipeline.process_coordinate(
                 processor_mock, elevation_mock, coordinate, "skraafoto2021", semaphore, total_coords
             )
-        except SystemExit as e:
-            #Assert that system exit code = 1
-            assert e.code == 1
-            detailed_logger.info("System correctly exited with code 1")
+        except FailureThresholdExceeded:
+            detailed_logger.info("Run correctly stopped at the threshold")
             break
     
     with open("failed_coordinates.txt", 'r') as file:
@@ -173,7 +180,7 @@ async def test_get_kote():
             mock.get(expected_url, payload=mocked_response)
 
             # Call the function being tested
-            elevation_instance = ElevationData(api_dhm_tokena, api_dhm_tokenb)  
+            elevation_instance = ElevationData(api_dhm_tokena, api_dhm_tokenb, pipeline)  
             result = await elevation_instance.get_kote(point)
 
     # Assert the result matches the mocked kote value
@@ -197,7 +204,7 @@ async def test_get_kote_failure():
     async with session:
         with aioresponses() as mock:
             mock.get(expected_url, status=500)
-            elevation_instance = ElevationData(api_dhm_tokena, api_dhm_tokenb)
+            elevation_instance = ElevationData(api_dhm_tokena, api_dhm_tokenb, pipeline)
             with pytest.raises(Exception, match="Failed to query elevation data"):
                 await elevation_instance.get_kote(point)
     detailed_logger.info("Exception correctly thrown on error")
@@ -217,10 +224,12 @@ async def test_API_calls():
         processor = STACImageProcessor(
             api_baseurl=os.getenv("api_baseurl"),
             api_token=os.getenv("api_token"),
+            pipeline=pipeline,
         )
         elevationProcessor = ElevationData(
             api_dhm_tokena=os.getenv("api_dhm_tokena"),
             api_dhm_tokenb=os.getenv("api_dhm_tokenb"),
+            pipeline=pipeline,
         )
     except Exception as e: 
         detailed_logger.error(f"Error while initializing: {e}")
@@ -232,7 +241,7 @@ async def test_API_calls():
         detailed_logger.info("Kote sucessfully fetched")
 
         #Testing process_coordinates on doesnt throw exception
-        await process_coordinate(processor, elevationProcessor, test_coord, collection, semaphore, total_coords)
+        await pipeline.process_coordinate(processor, elevationProcessor, test_coord, collection, semaphore, total_coords)
 
         #Asserting that an image for the coordinate is stored
         parent_path = "image_cache"
@@ -256,7 +265,7 @@ async def test_API_calls():
     
     try:
         #Testing process_coordinates on fail
-        await process_coordinate(processor, elevationProcessor, bad_coord, collection, semaphore, total_coords)
+        await pipeline.process_coordinate(processor, elevationProcessor, bad_coord, collection, semaphore, total_coords)
     except Exception as e: 
         assert e.args[0] == 'Elevation data is missing or invalid'
         detailed_logger.info(f"Exception correctly thrown for process_coordinate")
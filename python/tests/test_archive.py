@@ -0,0 +1,59 @@
+import sys
+import os
+import pytest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+from downloader.archive import LocalArchive
+
+
+def write_image(path, size=256, value=100):
+    import rasterio
+
+    with rasterio.open(path, 'w', driver='GTiff', width=size, height=size, count=3, dtype='uint8',
+                       tiled=True, blockxsize=64, blockysize=64) as dst:
+        dst.write(np.full((3, size, size), value, dtype=np.uint8))
+
+
+def test_ingest_is_incremental(tmp_path):
+    os.makedirs(tmp_path / "2021" / "north")
+    write_image(str(tmp_path / "2021" / "north" / "2021_84_40_2_0031_00070238.tif"))
+    write_image(str(tmp_path / "2021_84_40_4_0032_00070239.tif"))
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    archive = LocalArchive(str(tmp_path))
+    assert archive.ingest() == {"added": 2, "updated": 0, "unchanged": 0, "removed": 0}
+    os.remove(tmp_path / "2021_84_40_4_0032_00070239.tif")
+    assert archive.ingest() == {"added": 0, "updated": 0, "unchanged": 1, "removed": 1}
+
+    path = str(tmp_path / "2021" / "north" / "2021_84_40_2_0031_00070238.tif")
+    assert archive.locations("2021_84_40_2_0031_00070238", "https://example.com/a.tif") == [path, "https://example.com/a.tif"]
+    assert archive.locations("2021_84_40_4_0032_00070239", "https://example.com/b.tif") == ["https://example.com/b.tif"]
+    assert (archive.hits, archive.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_crops_are_read_from_the_archive(tmp_path):
+    archive_dir = tmp_path / "archive"
+    os.makedirs(archive_dir)
+    write_image(str(archive_dir / "item_a.tif"), value=200)
+    write_image(str(archive_dir / "item_b.tif"))
+    write_image(str(tmp_path / "remote_b.tif"), value=50)
+    LocalArchive(str(archive_dir)).ingest()
+    # An archive file broken after indexing falls back to the href, here another local file
+    (archive_dir / "item_b.tif").write_bytes(b"not a tiff")
+
+    pipeline = Pipeline(Config(image_archive=str(archive_dir), crop_sizes=[32, 64], cache_dir=str(tmp_path)))
+    processor = pipeline.processor
+
+    results = await processor.fetch_and_crop_cog("https://invalid.example/a.tif", "north", (128, 128), str(tmp_path), "item_a")
+    assert sorted(results) == ["box_1", "box_2"]
+    assert os.path.getsize(results["box_1"]) > 0
+
+    results = await processor.fetch_and_crop_cog(str(tmp_path / "remote_b.tif"), "south", (128, 128), str(tmp_path), "item_b")
+    assert pipeline.images.hits == 2
+
+    from PIL import Image
+    with Image.open(results["box_1"]) as image:
+        assert abs(np.asarray(image).mean() - 50) < 2
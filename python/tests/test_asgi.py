@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.asgi import AsgiApp
+from backend.metrics import Metrics
+
+
+def slow_wsgi_app(environ, start_response):
+    time.sleep(0.5)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"done"]
+
+
+async def request(app, path):
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": [],
+             "http_version": "1.1"}
+    received = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if received.is_set():
+            # Waits for a disconnect that doesn't come
+            await asyncio.sleep(3600)
+        received.set()
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_flask_routes_are_served_concurrently():
+    app = AsgiApp(slow_wsgi_app, db=None, wsgi_threads=4)
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(request(app, "/toggle/layer") for _ in range(4)))
+    elapsed = time.perf_counter() - started
+    app.fallback.close()
+
+    assert all(sent[0]["status"] == 200 and sent[1]["body"] == b"done" for sent in responses)
+    # One shared thread would take 2 s
+    assert elapsed < 1.5
+
+
+@pytest.mark.asyncio
+async def test_native_routes_are_recorded_in_the_metrics():
+    metrics = Metrics()
+    app = AsgiApp(slow_wsgi_app, db=None, metrics=metrics)
+
+    @app.route(r"/get_plandata/(?P<address>[^/]+)", name="/get_plandata/<address>")
+    async def get_plandata(address):
+        return 200, '{"address": "%s"}' % address, 'application/json'
+
+    sent = await request(app, "/get_plandata/Kovangen%20520")
+    app.fallback.close()
+
+    assert sent[0]["status"] == 200
+    assert 'route="/get_plandata/<address>",method="GET",status="200"' in metrics.render()
@@ -0,0 +1,96 @@
+import sys
+import os
+import json
+import pytest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import open_coordinates, read_coordinates_from_file
+from downloader.coordinates import TextReader, CsvReader, GeoJSONReader, NpyReader
+
+
+def test_text_reader_skips_invalid_lines(tmp_path):
+    path = tmp_path / "coordinates.txt"
+    path.write_text("728368.05 6174304.56\nnot a coordinate\n700169.47 6211841.32\n\n\n\n")
+
+    assert read_coordinates_from_file(str(path)) == [(728368.05, 6174304.56), (700169.47, 6211841.32)]
+
+    reader = open_coordinates(str(path), chunk_size=1)
+    assert isinstance(reader, TextReader)
+    # Only the rows that parse are counted, so the progress and failure threshold are right
+    assert reader.count() == 2 and reader.invalid == 0
+    assert list(reader.points()) == [(728368.05, 6174304.56, None), (700169.47, 6211841.32, None)]
+    assert reader.invalid == 1
+
+    path.write_text("not a coordinate\n\n")
+    assert open_coordinates(str(path)).count() == 0
+
+
+def test_csv_reader_finds_columns_and_ids(tmp_path):
+    path = tmp_path / "addresses.csv"
+    path.write_text("adresseid,Easting,Northing\na-1,1.5,2.5\na-2,x,3\na-3,4,5\n")
+
+    reader = open_coordinates(str(path))
+    assert isinstance(reader, CsvReader)
+    assert reader.count() == 2
+    assert list(reader.points()) == [(1.5, 2.5, "a-1"), (4.0, 5.0, "a-3")]
+    assert reader.invalid == 1
+
+
+def test_geojson_reader_handles_collections_and_sequences(tmp_path):
+    features = [{"type": "Feature", "id": i, "geometry": {"type": "Point", "coordinates": [i, i + 1]}, "properties": {"nr": f"p{i}"}}
+                for i in range(3)]
+    collection = tmp_path / "points.geojson"
+    collection.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    sequence = tmp_path / "points.geojsonl"
+    sequence.write_text("\n".join(json.dumps(feature) for feature in features))
+
+    assert list(open_coordinates(str(collection)).points())[1] == (1.0, 2.0, "1")
+    reader = open_coordinates(str(sequence), id_column="nr", chunk_size=2)
+    assert isinstance(reader, GeoJSONReader)
+    assert [point[2] for point in reader.points()] == ["p0", "p1", "p2"]
+
+
+def test_feature_collections_are_decoded_incrementally(tmp_path):
+    import io
+    from downloader.coordinates import iter_feature_collection
+
+    features = [{"type": "Feature", "id": f"\"{i}\"", "geometry": {"type": "Point", "coordinates": [i, i]}}
+                for i in range(50)]
+    text = json.dumps({"type": "FeatureCollection", "name": "features", "crs": {"features": []},
+                       "features": features, "bbox": [0, 0, 49, 49]}, indent=1)
+    # Blocks much smaller than a feature, so features and keys span several reads
+    assert list(iter_feature_collection(io.StringIO(text), block_size=7)) == features
+    assert list(iter_feature_collection(io.StringIO(json.dumps(features[0])))) == [features[0]]
+    with pytest.raises(ValueError):
+        list(iter_feature_collection(io.StringIO('{"features": [{"id": 1} {"id": 2}]}')))
+
+
+def test_npy_reader_is_memory_mapped(tmp_path):
+    path = tmp_path / "points.npy"
+    np.save(path, np.arange(20, dtype=np.float64).reshape(10, 2))
+
+    reader = open_coordinates(str(path), chunk_size=4)
+    assert isinstance(reader, NpyReader)
+    assert reader.count() == 10
+    assert [len(xy) for xy, _ in reader.chunks()] == [4, 4, 2]
+    assert list(reader.points())[-1] == (18.0, 19.0, None)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_streams_points_with_ids(tmp_path):
+    from unittest.mock import AsyncMock
+    from downloader import Config, Pipeline
+
+    pipeline = Pipeline(Config(cache_dir=str(tmp_path), failed_coordinates_file=str(tmp_path / "failed.txt")))
+    pipeline._processor = AsyncMock()
+    pipeline._elevation = AsyncMock()
+    pipeline._elevation.get_kote.return_value = 10
+
+    points = ((float(i), float(i), f"id-{i}") for i in range(5))
+    await pipeline.run(points, total_coords=5)
+
+    assert pipeline.stats.successful_jobs == 5
+    lines = (tmp_path / "points.csv").read_text().splitlines()
+    assert lines[0] == "id,x,y,folder,status"
+    assert "id-3,3.0,3.0,3.0_3.0,ok" in lines
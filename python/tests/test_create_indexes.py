@@ -0,0 +1,76 @@
+import sys
+import os
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from create_indexes import parse_parts
+from backend.migrations import Index, create_indexes
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.conn.statements.append((" ".join(query.split()), self.conn.autocommit))
+
+    def fetchall(self):
+        return list(self.conn.status.items())
+
+
+class FakeConnection:
+    def __init__(self, status):
+        self.status = status
+        self.statements = []
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeDatabase:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+def test_parts_default_to_all():
+    assert parse_parts([]) == ["plandata", "polygons"]
+    assert parse_parts(["all"]) == ["plandata", "polygons"]
+    assert parse_parts(["polygons", "polygons"]) == ["polygons"]
+
+
+def test_unknown_parts_are_rejected():
+    with pytest.raises(SystemExit):
+        parse_parts(["addresses"])
+
+
+def test_invalid_indexes_are_dropped_and_created_in_autocommit():
+    indexes = [Index("plandata", "valid_idx", "plandata.t (a)"),
+               Index("plandata", "invalid_idx", "plandata.t USING GIN (b gin_trgm_ops)", extension="pg_trgm"),
+               Index("plandata", "missing_idx", "plandata.t (c)")]
+    conn = FakeConnection({"valid_idx": True, "invalid_idx": False})
+
+    created = create_indexes(FakeDatabase(conn), indexes)
+
+    assert created == ["invalid_idx", "missing_idx"]
+    assert all(autocommit for _, autocommit in conn.statements)
+    assert not conn.autocommit
+    statements = [statement for statement, _ in conn.statements]
+    assert statements[0] == "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+    assert statements[2:] == [
+        "DROP INDEX CONCURRENTLY IF EXISTS plandata.invalid_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS invalid_idx ON plandata.t USING GIN (b gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS missing_idx ON plandata.t (c)",
+    ]
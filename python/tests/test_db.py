@@ -0,0 +1,92 @@
+import sys
+import os
+
+import pytest
+import psycopg2
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend import db as db_module
+from backend.db import Database, DatabaseUnavailable
+
+
+class FakeConnection:
+    def __init__(self, broken=False):
+        self.closed = False
+        self.broken = broken
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None, cursor_factory=None):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, query, params=None):
+                if conn.broken:
+                    raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return Cursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self, connections):
+        self.idle = list(connections)
+        self.discarded = []
+
+    def getconn(self):
+        return self.idle.pop(0)
+
+    def putconn(self, conn, close=False):
+        (self.discarded if close else self.idle).append(conn)
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    created = []
+
+    def make_pool(minconn, maxconn, **params):
+        created.append(FakePool([FakeConnection(broken=True), FakeConnection()]))
+        return created[0]
+
+    monkeypatch.setattr(db_module.pool, "ThreadedConnectionPool", make_pool)
+    return created
+
+
+def test_connections_are_committed_or_rolled_back(fake_pool):
+    db = Database({}, health_check_interval=0)
+
+    with db.connection() as conn:
+        pass
+    assert conn.commits == 1
+
+    with pytest.raises(ValueError):
+        with db.connection() as conn:
+            raise ValueError("bad request")
+    assert conn.rollbacks >= 1 and conn.commits == 1
+
+
+def test_broken_connections_are_replaced(fake_pool):
+    db = Database({}, health_check_interval=0)
+
+    with db.connection() as conn:
+        assert not conn.broken
+    assert [conn.broken for conn in fake_pool[0].discarded] == [True]
+
+
+def test_waiting_for_a_connection_times_out(fake_pool):
+    db = Database({}, max_connections=1, checkout_timeout=0.1)
+
+    with db.connection():
+        with pytest.raises(DatabaseUnavailable):
+            with db.connection():
+                pass
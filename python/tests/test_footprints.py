@@ -0,0 +1,54 @@
+import sys
+import os
+import pytest
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+from downloader.footprints import FootprintIndex
+
+
+def make_item(item_id, direction, minx, miny, size=1000, updated="2021-05-01"):
+    ring = [[minx, miny], [minx + size, miny], [minx + size, miny + size], [minx, miny + size], [minx, miny]]
+    return {
+        "type": "Feature",
+        "id": item_id,
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+        "properties": {"direction": direction, "updated": updated, "pers:omega": 0},
+        "assets": {"data": {"href": f"https://example.com/{item_id}.tif"}, "thumbnail": {"href": "x"}},
+        "links": [{"rel": "self", "href": "x"}],
+    }
+
+
+def test_lookup_and_incremental_upsert(tmp_path):
+    index = FootprintIndex(str(tmp_path / "index.sqlite"))
+    items = [make_item("a", "north", 0, 0), make_item("b", "north", 500, 0), make_item("c", "south", 0, 0)]
+
+    assert index.upsert(items, "skraafotos2021") == (3, 0, 0)
+    assert index.upsert(items, "skraafotos2021") == (0, 0, 3)
+    assert index.upsert([make_item("a", "north", 0, 0, updated="2022-01-01")], "skraafotos2021") == (0, 1, 0)
+
+    # Both north footprints contain the point, "b" is the more central one
+    assert index.lookup((900, 500), "north", "skraafotos2021")["id"] == "b"
+    assert index.lookup((100, 500), "south", "skraafotos2021")["assets"] == {"data": {"href": "https://example.com/c.tif"}}
+    assert index.lookup((5000, 5000), "north", "skraafotos2021") is None
+    assert index.lookup((100, 500), "north", "skraafotos2023") is None
+    assert index.count("skraafotos2021") == {"north": 2, "south": 1}
+
+    assert index.prune("skraafotos2021", {"a", "c"}) == 1
+    assert index.lookup((1400, 500), "north", "skraafotos2021") is None
+
+
+@pytest.mark.asyncio
+async def test_query_items_uses_index_before_api(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    index = FootprintIndex(path)
+    index.upsert([make_item("a", "east", 0, 0)], "skraafotos2021")
+    index.close()
+
+    pipeline = Pipeline(Config(footprint_index=path))
+    pipeline.get_session = Mock(side_effect=AssertionError("STAC API should not be called"))
+
+    response = await pipeline.processor.query_items((10, 10), "east", "skraafotos2021")
+    assert response["features"][0]["id"] == "a"
+    assert pipeline.footprints.hits == 1
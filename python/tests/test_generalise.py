@@ -0,0 +1,77 @@
+import sys
+import os
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.generalise import ZoomBands, ZOOM_BANDS, IS_POPULATED, REFRESHED_VERSION, band_view, band_for_resolution
+from backend.layers import TABLE_VERSION
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.row = None
+
+    def execute(self, query, params=None):
+        self.db.statements.append(" ".join(query.split()))
+        if query == TABLE_VERSION:
+            self.row = self.db.version
+        elif query == IS_POPULATED:
+            self.row = (self.db.populated,)
+        elif query == REFRESHED_VERSION:
+            self.row = self.db.refreshed
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.statements = []
+        self.version = (1, 0, 0)
+        self.populated = False
+        self.refreshed = None
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+def test_bands_are_refreshed_concurrently_once_populated():
+    db = FakeDatabase()
+    bands = ZoomBands(db)
+
+    bands.refresh("lokalplan")
+    refreshes = [statement for statement in db.statements if statement.startswith("REFRESH")]
+    assert refreshes == [f"REFRESH MATERIALIZED VIEW {band_view('lokalplan', band)}" for band in range(len(ZOOM_BANDS))]
+
+    db.statements.clear()
+    db.populated = True
+    bands.refresh("lokalplan")
+    assert all("CONCURRENTLY" in statement for statement in db.statements if statement.startswith("REFRESH"))
+
+
+def test_bands_are_used_while_the_table_is_unchanged():
+    db = FakeDatabase()
+    bands = ZoomBands(db, check_interval=0)
+    band = band_for_resolution(10)
+
+    # Never refreshed: simplified on the fly
+    assert band_view("lokalplan", band) not in bands.query("lokalplan", resolution=10)
+
+    db.refreshed = (repr(db.version), 5.0)
+    assert f"FROM {band_view('lokalplan', band)}" in bands.query("lokalplan", resolution=10)
+
+    db.version = (1, 1, 0)
+    assert not bands.is_current("lokalplan")
+
+
+def test_bands_of_views_expire():
+    db = FakeDatabase()
+    db.version = None
+    bands = ZoomBands(db, check_interval=0, max_age=60)
+
+    db.refreshed = (None, 30.0)
+    assert bands.is_current("lokalplan_v")
+    db.refreshed = (None, 90.0)
+    assert not bands.is_current("lokalplan_v")
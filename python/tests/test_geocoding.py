@@ -0,0 +1,47 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import open_coordinates
+from downloader.geocoding import BatchGeocoder, GeocodeCache, LocalGeocoder, geocode_file, normalise_address
+
+
+def test_normalise_address():
+    assert normalise_address("  Kovangen 520 ,3480  Fredensborg. ") == "kovangen 520, 3480 fredensborg"
+    assert normalise_address("KOVANGEN 520, 3480 Fredensborg") == "kovangen 520, 3480 fredensborg"
+
+
+@pytest.mark.asyncio
+async def test_recurring_addresses_resolve_from_the_cache(tmp_path):
+    (tmp_path / "known.csv").write_text("address,lon,lat\n"
+                                        "\"Kovangen 520, 3480 Fredensborg\",12.397136,55.992079\n"
+                                        "\"Rådhuspladsen 1, 1550 København\",12.568337,55.676098\n")
+    (tmp_path / "addresses.csv").write_text("id,adresse\n"
+                                            "1,\"Kovangen 520, 3480 Fredensborg\"\n"
+                                            "2,\"kovangen 520 ,3480 fredensborg\"\n"
+                                            "3,Ukendt Vej 1\n"
+                                            "4,\"Rådhuspladsen 1, 1550 København\"\n")
+    geocoder = LocalGeocoder(str(tmp_path / "known.csv"))
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"))
+
+    batch = BatchGeocoder(geocoder, cache)
+    totals = await geocode_file(str(tmp_path / "addresses.csv"), str(tmp_path / "coordinates.txt"), batch, None,
+                                unresolved_path=str(tmp_path / "unresolved.txt"))
+    assert totals == {"addresses": 4, "distinct": 3, "written": 2, "unresolved": 1, "cached": 0, "requests": 3}
+    assert (tmp_path / "unresolved.txt").read_text() == "Ukendt Vej 1\n"
+
+    points = list(open_coordinates(str(tmp_path / "coordinates.txt")).points())
+    assert [point[2] for point in points] == ["1", "4"]
+    assert 6200000 < points[0][1] < 6220000
+
+    batch = BatchGeocoder(geocoder, cache)
+    totals = await geocode_file(str(tmp_path / "addresses.csv"), str(tmp_path / "again.txt"), batch, None)
+    assert (totals["cached"], totals["requests"]) == (3, 0)
+    assert (tmp_path / "again.txt").read_text() == (tmp_path / "coordinates.txt").read_text()
+
+    # Another geocoder doesn't get the first one's results, nor its cached miss
+    (tmp_path / "other.csv").write_text("address,x,y\nUkendt Vej 1,700000,6200000\n")
+    batch = BatchGeocoder(LocalGeocoder(str(tmp_path / "other.csv")), cache)
+    totals = await geocode_file(str(tmp_path / "addresses.csv"), str(tmp_path / "other.txt"), batch, None)
+    assert (totals["cached"], totals["requests"], totals["written"]) == (0, 3, 1)
@@ -0,0 +1,71 @@
+import sys
+import os
+import gzip
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.layers import LayerCache
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.query = None
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchone(self):
+        return self.db.version
+
+    def fetchall(self):
+        return [(name,) for name in self.db.layers]
+
+
+class FakeDatabase:
+    def __init__(self, layers):
+        self.layers = layers
+        self.version = (1, 0, 0)
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+def fake_chunks(db, feature):
+    yield b'{"type": "FeatureCollection", "features": ['
+    yield b'{"type": "Feature"}'
+    yield b"]}"
+
+
+def test_layer_is_cached_after_a_response_that_was_never_iterated():
+    cache = LayerCache(FakeDatabase(["lokalplan"]), build_wait=2, chunks=fake_chunks)
+
+    # A HEAD request: the server closes the stream without reading it
+    _, stream, _ = cache.open("lokalplan")
+    stream.close()
+
+    started = time.monotonic()
+    _, stream, encoding = cache.open("lokalplan", "gzip")
+    body = b"".join(stream)
+    stream.close()
+
+    assert time.monotonic() - started < 1
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == b'{"type": "FeatureCollection", "features": [{"type": "Feature"}]}'
+    entry, stream, _ = cache.open("lokalplan")
+    assert stream is None and entry.size == len(gzip.decompress(body))
+
+
+def test_layer_is_rebuilt_only_when_the_table_is_written():
+    db = FakeDatabase(["lokalplan"])
+    cache = LayerCache(db, check_interval=0, chunks=fake_chunks)
+    cache.get("lokalplan")
+
+    cache.get("lokalplan")
+    assert cache.misses == 1 and cache.hits == 1
+
+    db.version = (1, 1, 0)
+    cache.get("lokalplan")
+    assert cache.misses == 2
@@ -0,0 +1,55 @@
+import sys
+import os
+import random
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.loadtest import seed_database, add_polygon_requests, StageResult, Scale
+from backend.polygons import rings_to_wkb
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params=None):
+        self.db.statements.append(" ".join(query.split()))
+
+    def fetchone(self):
+        # A new database: no plandata schema and no marker
+        return False, False
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.statements = []
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+def test_polygons_are_seeded_like_production():
+    db = FakeDatabase()
+    seed_database(db, plans=4)
+
+    create = next(statement for statement in db.statements if "TABLE IF NOT EXISTS skraafoto.polygons" in statement)
+    # insert_polygons stores WKB without an SRID, which a typed column would reject
+    assert create.endswith("multi_polygon geometry)")
+    assert "ALTER TABLE skraafoto.polygons ALTER COLUMN multi_polygon TYPE geometry" in db.statements
+
+
+def test_polygon_collection_requests_can_be_encoded():
+    request = add_polygon_requests(random.Random(0), Scale(4, 10), rings=3)
+
+    assert request.method == "PUT" and request.path.startswith("/add_polygon_collection/loadtest-")
+    assert len(rings_to_wkb(request.body)) == 3
+
+
+def test_percentiles_use_the_nearest_rank():
+    result = StageResult("toggle", 4)
+    result.latencies = [i / 100 for i in range(1, 101)]
+
+    assert result.percentile(50) == 0.5
+    assert result.percentile(99) == 0.99
+    assert result.as_dict()['p90_ms'] == 900.0
@@ -0,0 +1,37 @@
+import sys
+import os
+import asyncio
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader.memory import MemoryBudget, expected_crop_bytes
+
+
+@pytest.mark.asyncio
+async def test_reservations_stay_under_budget():
+    budget = MemoryBudget(limit_bytes=100)
+    in_flight = []
+
+    async def read(nbytes):
+        async with budget.reserve(nbytes):
+            in_flight.append(budget.reserved)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(read(40) for _ in range(6)))
+
+    assert max(in_flight) <= 100
+    assert budget.peak == 80
+    assert budget.reserved == 0
+    assert budget.waits > 0
+
+
+@pytest.mark.asyncio
+async def test_oversized_reservation_runs_alone():
+    budget = MemoryBudget(limit_bytes=10)
+    async with budget.reserve(50):
+        assert budget.reserved == 50
+    assert budget.peak == 50
+
+
+def test_expected_crop_bytes():
+    assert expected_crop_bytes(800) == 2 * 3 * 800 * 800
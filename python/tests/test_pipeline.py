@@ -0,0 +1,82 @@
+import sys
+import os
+import asyncio
+import subprocess
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # Importing from an empty directory must not need settings.yaml or create any files
+    code = "import sys, downloader; assert 'rasterio' not in sys.modules and 'PIL' not in sys.modules"
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_pipelines_have_isolated_counters(tmp_path):
+    first = Pipeline(Config(failed_coordinates_file=str(tmp_path / "first.txt")))
+    second = Pipeline(Config(failed_coordinates_file=str(tmp_path / "second.txt")))
+
+    elevation = AsyncMock()
+    elevation.get_kote.return_value = 10
+    semaphore = asyncio.Semaphore(2)
+
+    await first.process_coordinate(AsyncMock(), elevation, (1.0, 2.0), "skraafotos2021", semaphore, 1)
+
+    assert first.stats.successful_jobs == 1
+    assert second.stats.successful_jobs == 0
+    assert first.session is None and second.session is None
+
+
+@pytest.mark.asyncio
+async def test_collections_share_one_elevation_lookup(tmp_path):
+    pipeline = Pipeline(Config(cache_dir=str(tmp_path), collection=["skraafotos2019", "skraafotos2023"], threshold=100,
+                               failed_coordinates_file=str(tmp_path / "failed.txt")))
+    pipeline._elevation = AsyncMock()
+    pipeline._elevation.get_kote.return_value = 10
+    processor = pipeline._processor = AsyncMock()
+
+    async def query_images_for_center(center_coord, collection, kote, cache_dir=None):
+        if collection == "skraafotos2023" and center_coord == (2.0, 2.0):
+            raise Exception("COG read failed")
+        return {}
+
+    processor.query_images_for_center.side_effect = query_images_for_center
+    await pipeline.run([(1.0, 1.0, "a"), (2.0, 2.0, "b")])
+
+    assert pipeline._elevation.get_kote.call_count == 2
+    processor.query_images_for_center.assert_any_call((1.0, 1.0), "skraafotos2019", 10,
+                                                      cache_dir=os.path.join(str(tmp_path), "skraafotos2019"))
+    assert (pipeline.stats.successful_jobs, pipeline.stats.failed_jobs) == (1, 1)
+    assert pipeline.stats.collection_failures == {"skraafotos2023": 1}
+    lines = (tmp_path / "points.csv").read_text().splitlines()
+    assert "b,2.0,2.0,skraafotos2019/2.0_2.0,ok" in lines
+    assert "b,2.0,2.0,skraafotos2023/2.0_2.0,failed" in lines
+
+
+@pytest.mark.asyncio
+async def test_collections_of_a_run_go_where_the_service_reads_them(tmp_path):
+    from downloader.service import crop_path
+
+    config = Config(cache_dir=str(tmp_path), collection="skraafotos2021", failed_coordinates_file=str(tmp_path / "failed.txt"))
+    pipeline = Pipeline(config)
+    pipeline._elevation = AsyncMock()
+    pipeline._elevation.get_kote.return_value = 10
+    processor = pipeline._processor = AsyncMock()
+    processor.query_images_for_center.return_value = {}
+
+    # A run asked for more collections than the settings name
+    await pipeline.run([(1.0, 1.0, "a")], collection=["skraafotos2021", "skraafotos2023"])
+
+    processor.query_images_for_center.assert_any_call((1.0, 1.0), "skraafotos2021", 10, cache_dir=str(tmp_path))
+    processor.query_images_for_center.assert_any_call((1.0, 1.0), "skraafotos2023", 10,
+                                                      cache_dir=os.path.join(str(tmp_path), "skraafotos2023"))
+    lines = (tmp_path / "points.csv").read_text().splitlines()
+    assert lines[1:] == ["a,1.0,1.0,1.0_1.0,ok", "a,1.0,1.0,skraafotos2023/1.0_1.0,ok"]
+    assert crop_path(config, (1.0, 1.0), "north", 400, "skraafotos2023").startswith(
+        os.path.join(str(tmp_path), "skraafotos2023", "1.0_1.0"))
@@ -0,0 +1,48 @@
+import sys
+import os
+import re
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.plandata import PlandataLookup, PLANDATA_QUERY, plan_query
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params=None):
+        self.db.queries.append((query, params))
+
+    def fetchone(self):
+        return ('{"komuneplan": {}, "lokalplan": {}}',)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queries = []
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+def test_lookups_are_cached_by_normalised_address():
+    db = FakeDatabase()
+    lookup = PlandataLookup(db)
+
+    lookup.get("Vej_1 ,  8000 Aarhus")
+    lookup.get("vej_1, 8000  aarhus ")
+
+    assert len(db.queries) == 1 and lookup.hits == 1
+    query, params = db.queries[0]
+    assert query == PLANDATA_QUERY
+    assert params == {'prefix': "vej\\_1, 8000 aarhus%", 'pattern': "%Vej\\_1 ,  8000 Aarhus%"}
+
+
+def test_plans_are_picked_in_a_fixed_order():
+    for query in (PLANDATA_QUERY, plan_query("lokalplan")):
+        # Every LIMIT 1 is ordered, so the same address always gives the same plan
+        assert re.findall(r"LIMIT 1", query)
+        assert len(re.findall(r"ORDER BY [\w, ]+\s+LIMIT 1", query)) == len(re.findall(r"LIMIT 1", query))
+        assert "ORDER BY preference, id" in query
@@ -0,0 +1,65 @@
+import sys
+import os
+import random
+import pytest
+import numpy as np
+from unittest import mock
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+from downloader.planner import CapacityPlanner, dedupe, group_points, sample_groups, window_blocks, range_requests
+
+
+def write_image(path, size=512):
+    import rasterio
+
+    with rasterio.open(path, 'w', driver='GTiff', width=size, height=size, count=3, dtype='uint8',
+                       tiled=True, blockxsize=128, blockysize=128, compress='deflate') as dst:
+        dst.write(np.random.default_rng(0).integers(0, 255, (3, size, size), dtype=np.uint8))
+
+
+def test_sample_is_spread_over_cells():
+    points, duplicates = dedupe([(100.0, 100.0, "a"), (100.0, 100.0, "b"), (200.0, 100.0, None),
+                                 (1500.0, 100.0, None), (2500.0, 100.0, None)])
+    assert duplicates == 1 and points[0] == (100.0, 100.0, "a")
+
+    groups = group_points(points)
+    assert sorted(groups) == [(0, 0), (1, 0), (2, 0)]
+    sample = sample_groups(groups, 3, random.Random(1))
+    assert sorted(group_points(sample)) == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_window_blocks(tmp_path):
+    import rasterio
+    from rasterio.windows import Window
+
+    write_image(str(tmp_path / "image.tif"))
+    with rasterio.open(str(tmp_path / "image.tif")) as src:
+        blocks = window_blocks(src, Window(100, 100, 100, 100))
+    # Pixel interleaved, so the window touches four blocks of every band
+    assert len(blocks) == 4
+    assert range_requests({(0, 10), (10, 5), (100, 10)}) == 2
+
+
+@pytest.mark.asyncio
+async def test_plan_reads_crops_in_memory(tmp_path):
+    write_image(str(tmp_path / "image.tif"))
+    cache_dir = tmp_path / "cache"
+    pipeline = Pipeline(Config(cache_dir=str(cache_dir), crop_sizes=[64, 128], api_baseurl="https://stac.example/v1",
+                               max_concurrent_requests=10, api_quotas={"stac.example": 20}))
+    pipeline._elevation = AsyncMock()
+    pipeline._elevation.get_kote.return_value = 10
+    pipeline.processor.query_items = AsyncMock(return_value={"features": [
+        {"id": "image", "assets": {"data": {"href": str(tmp_path / "image.tif")}}}]})
+
+    points = [(float(x), 100.0, None) for x in range(0, 10000, 500)] + [(0.0, 100.0, None)]
+    with mock.patch("geotiff_utils.update_center", return_value={"imageCoord": (256, 256)}):
+        plan = await CapacityPlanner(pipeline, fraction=0.2, seed=1).plan(points)
+
+    assert (plan["points"], plan["duplicates"], plan["cells"], plan["sampled"]) == (20, 1, 10, 5)
+    assert plan["requests"]["stac.example"] == 20 * 5
+    assert plan["requests"]["services.datafordeler.dk"] == 20
+    assert plan["files"] == 20 * 5 * 2 and plan["disk_bytes"] > 0
+    assert plan["quota_days"] == {"stac.example": 5.0}
+    assert not cache_dir.exists()
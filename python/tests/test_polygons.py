@@ -0,0 +1,66 @@
+import sys
+import os
+import io
+import struct
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.polygons import insert_polygons, iter_json_array, COPY_POLYGONS
+
+SQUARE = [[575000, 6215000], [575100, 6215000], [575100, 6215100], [575000, 6215100]]
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def copy_expert(self, sql, file, size=8192):
+        self.db.sql = sql
+        while data := file.read(size):
+            self.db.copied += data
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.sql = None
+        self.copied = b""
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+def test_polygons_are_copied_as_wkb():
+    db = FakeDatabase()
+
+    assert insert_polygons(db, "tab\there", iter([SQUARE, SQUARE[::-1]]), batch_size=1) == 2
+
+    assert db.sql == COPY_POLYGONS
+    rows = db.copied.decode('ascii').splitlines()
+    assert len(rows) == 2
+    name, wkb = rows[0].split("\t")
+    assert name == "tab\\there"
+    wkb = bytes.fromhex(wkb)
+    # MultiPolygon of one polygon with one closed ring of five points
+    assert struct.unpack('<BIIBIII', wkb[:22]) == (1, 6, 1, 1, 3, 1, 5)
+    first = struct.unpack('<2d', wkb[22:38])
+    assert first == struct.unpack('<2d', wkb[-16:])
+    # Latitude first, as insert_polygon has always stored them
+    assert 56 < first[0] < 57 and 10 < first[1] < 11
+
+
+def test_empty_and_invalid_collections_are_rejected():
+    with pytest.raises(ValueError, match="no polygons"):
+        insert_polygons(FakeDatabase(), "empty", iter([]))
+    with pytest.raises(ValueError, match="at least three"):
+        insert_polygons(FakeDatabase(), "line", iter([SQUARE[:2]]))
+
+
+def test_json_arrays_are_streamed():
+    assert list(iter_json_array(io.BytesIO(b' [[1, 2], {"a": "]"}, 3] '), chunk_size=3)) == [[1, 2], {"a": "]"}, 3]
+    assert list(iter_json_array(io.BytesIO(b"[]"))) == []
+    for body in (b"[1,,2]", b"[1 2]", b"[1,]", b"[1]xyz", b"{}", b"[1"):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.BytesIO(body), chunk_size=2))
@@ -0,0 +1,35 @@
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import open_coordinates
+from downloader.projection import convert_file, get_transformer
+
+
+def test_csv_in_wgs84_converts_to_the_text_format(tmp_path):
+    path = tmp_path / "addresses.csv"
+    path.write_text("id,lat,lon\na-1,55.992079,12.397136\na-2,x,12\na-3,55.676098,12.568337\n")
+    output = tmp_path / "coordinates.txt"
+
+    totals = convert_file(str(path), str(output), chunk_size=2)
+    assert totals == {"converted": 2, "invalid": 1, "failed": 0}
+
+    points = list(open_coordinates(str(output)).points())
+    expected = get_transformer().transform([12.397136, 12.568337], [55.992079, 55.676098])
+    assert [point[2] for point in points] == ["a-1", "a-3"]
+    assert np.allclose([point[:2] for point in points], np.column_stack(expected), atol=1e-3)
+    assert 6200000 < points[0][1] < 6220000
+
+
+def test_round_trip_through_npy(tmp_path):
+    lonlat = np.column_stack([np.linspace(8.1, 15.1, 1000), np.linspace(54.6, 57.7, 1000)])
+    # Latitude first, as the addresses come from the geocoder
+    path = tmp_path / "points.txt"
+    np.savetxt(path, lonlat[:, ::-1], fmt="%.8f")
+
+    assert convert_file(str(path), str(tmp_path / "utm.npy"), swap_axes=True, chunk_size=300)["converted"] == 1000
+    assert np.load(tmp_path / "utm.npy").shape == (1000, 2)
+    convert_file(str(tmp_path / "utm.npy"), str(tmp_path / "back.txt"), source="EPSG:25832", target="EPSG:4326")
+
+    assert np.allclose(np.loadtxt(tmp_path / "back.txt"), lonlat, atol=1e-7)
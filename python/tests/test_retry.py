@@ -0,0 +1,68 @@
+import sys
+import os
+import pytest
+from unittest import mock
+from unittest.mock import AsyncMock
+from aiohttp import ClientResponseError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+from downloader.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def response_error(status, retry_after=None):
+    return ClientResponseError(request_info=mock.Mock(), history=(), status=status, message="error",
+                               headers={"Retry-After": retry_after} if retry_after else None)
+
+
+def test_breaker_sheds_requests_until_a_probe_succeeds():
+    breaker = CircuitBreaker("api.example", failure_threshold=2, reset_timeout=30)
+    for _ in range(2):
+        with pytest.raises(ClientResponseError), breaker:
+            raise response_error(503)
+    with pytest.raises(CircuitOpenError), breaker:
+        pass
+
+    # A 404 shows the host is up, it doesn't count against the breaker
+    breaker.opened_at -= 30
+    with pytest.raises(ClientResponseError), breaker:
+        raise response_error(404)
+    assert not breaker.is_open and breaker.trips == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_honour_retry_after_and_skip_client_errors():
+    policy = RetryPolicy(retry_limit=3, retry_delay=0.01)
+    func = AsyncMock(side_effect=[response_error(429, "7"), "ok"])
+    with mock.patch("asyncio.sleep", new=AsyncMock()) as sleep:
+        assert await policy.call("stage", func) == "ok"
+        sleep.assert_awaited_once_with(7.0)
+
+        func = AsyncMock(side_effect=response_error(404))
+        with pytest.raises(ClientResponseError):
+            await policy.call("stage", func)
+        assert func.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_only_the_failing_direction_is_retried(tmp_path):
+    pipeline = Pipeline(Config(cache_dir=str(tmp_path), retry_delay=0))
+    processor = pipeline.processor
+    item = {"id": "item", "assets": {"data": {"href": "https://cdn.example/item.tif"}}}
+    processor.query_items = AsyncMock(return_value={"features": [item]})
+    crops = {direction: 0 for direction in processor.DIRECTIONS}
+
+    async def fetch_and_crop_cog(image_url, direction, image_coord, coord_dir, item_id):
+        crops[direction] += 1
+        if direction == "east" and crops[direction] < 3:
+            raise response_error(502)
+        return {"box_1": direction}
+
+    processor.fetch_and_crop_cog = fetch_and_crop_cog
+    with mock.patch("downloader.stac.update_center", return_value={"imageCoord": (10, 10)}):
+        results = await processor.query_images_for_center((1.0, 2.0), "skraafotos2021", 10)
+
+    assert results["east"] == {"box_1": "east"}
+    assert crops == {"north": 1, "south": 1, "east": 3, "west": 1, "nadir": 1}
+    # The STAC query of the east direction isn't repeated for the crop retries
+    assert processor.query_items.call_count == 5
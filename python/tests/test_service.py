@@ -0,0 +1,45 @@
+import sys
+import os
+import asyncio
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, CropService
+
+
+def make_service(tmp_path, **kwargs):
+    service = CropService(Config(cache_dir=str(tmp_path)), **kwargs)
+    service.downloads = 0
+
+    async def fake_download(center_coord, direction, crop_size, collection):
+        service.downloads += 1
+        await asyncio.sleep(0.1)
+        return f"{direction}-{crop_size}".encode()
+
+    service._download = fake_download
+    return service
+
+
+def test_concurrent_requests_share_one_download(tmp_path):
+    service = make_service(tmp_path)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_crop((1.5, 2.5), "north", 400)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert service.downloads == 1
+    assert {crop.data for crop in results} == {b"north-400"}
+    # Size 400 is in crop_sizes, so it is stored where the batch script would put it
+    assert os.path.exists(tmp_path / "1.5_2.5" / "cropped_north_box_1.png")
+
+
+def test_disk_cache_survives_memory_eviction(tmp_path):
+    service = make_service(tmp_path, max_entries=1)
+    first = service.get_crop((1.0, 2.0), "east", 123)
+    service.get_crop((1.0, 2.0), "west", 123)
+
+    assert service.get_crop((1.0, 2.0), "east", 123) == first
+    assert service.downloads == 2
@@ -0,0 +1,75 @@
+import sys
+import os
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from downloader import Config, Pipeline
+from downloader.terrain import TerrainCache
+
+
+def write_dtm(path, minx, maxy, width, height, resolution, heights):
+    import rasterio
+    from affine import Affine
+
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32',
+                       crs='EPSG:25832', transform=Affine(resolution, 0, minx, 0, -resolution, maxy), nodata=-9999) as dst:
+        dst.write(heights.astype('float32'), 1)
+
+
+def plane(xs, ys):
+    return 10 + 0.01 * (xs - 720000) - 0.02 * (ys - 6174000)
+
+
+def test_import_and_bilinear_sampling(tmp_path):
+    # A 2 x 1 km DTM at 2 m, of a plane, which bilinear interpolation reproduces exactly
+    columns, rows = np.meshgrid(np.arange(1000), np.arange(500))
+    heights = plane(720000 + (columns + 0.5) * 2, 6175000 - (rows + 0.5) * 2)
+    write_dtm(str(tmp_path / "dtm.tif"), 720000, 6175000, 1000, 500, 2, heights)
+
+    cache = TerrainCache(str(tmp_path / "terrain"), resolution=2)
+    assert cache.import_geotiff(str(tmp_path / "dtm.tif")) == 2
+
+    xs = np.array([720001.0, 720500.3, 721733.7, 721998.0])
+    ys = np.array([6174001.0, 6174250.9, 6174999.0, 6174500.0])
+    assert np.allclose(cache.sample(xs, ys), plane(xs, ys), atol=1e-3)
+    # Outside the imported tiles
+    assert np.isnan(cache.sample([725000.0], [6174500.0])[0])
+
+
+def test_disk_limit_evicts_least_recently_used(tmp_path):
+    cache = TerrainCache(str(tmp_path), resolution=100, max_bytes=3 * 528)  # Three 10 x 10 tiles
+    for column in range(3):
+        cache.store((column, 0), np.full((10, 10), column))
+    cache.load((0, 0))
+    cache.store((3, 0), np.full((10, 10), 3))
+
+    assert cache.load((1, 0)) is None
+    assert cache.sample([50.0, 2050.0, 3050.0], [50.0, 50.0, 50.0]).tolist() == [0, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_get_kote_uses_tiles_and_falls_back_for_missing_ones(tmp_path):
+    pipeline = Pipeline(Config(terrain_cache=str(tmp_path), terrain_resolution=100))
+    pipeline.get_session = Mock()
+    pipeline.terrain.store((720, 6174), np.full((10, 10), 12.5))
+
+    async def fetch_fails(session, tile):
+        # Like a failed WCS request, which remembers the tile as missing
+        pipeline.terrain._missing.add(tile)
+        return False
+
+    pipeline.terrain._fetch = AsyncMock(side_effect=fetch_fails)
+    elevation = pipeline.elevation
+    elevation.get_remote_kote = AsyncMock(return_value=7.0)
+
+    assert await elevation.get_kote((720500.0, 6174500.0)) == 12.5
+    elevation.get_remote_kote.assert_not_called()
+    pipeline.terrain._fetch.assert_not_called()
+
+    assert [await elevation.get_kote(point) for point in [(720100.0, 6174100.0), (730500.0, 6174500.0),
+                                                          (730600.0, 6174600.0)]] == [12.5, 7.0, 7.0]
+    # One fetch for the missing tile, then the point API for its two points
+    pipeline.terrain._fetch.assert_called_once()
+    assert elevation.get_remote_kote.call_count == 2
@@ -0,0 +1,65 @@
+import sys
+import os
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from backend.tiles import TileCache, TILE_GRIDS, tile_bounds, tile_range
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return self.db.version
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.version = (1, 0, 0)
+
+    @contextmanager
+    def cursor(self, name=None):
+        yield FakeCursor(self)
+
+
+class FakeLayers:
+    def layer_names(self, refresh=False):
+        return {"lokalplan"}
+
+
+def test_tiles_cover_their_bounds():
+    grid = TILE_GRIDS["25832"]
+    minx, miny, maxx, maxy = tile_bounds(grid, 3, 2, 5)
+
+    assert maxx - minx == pytest.approx(grid.size / 8)
+    assert tile_range(grid, 3, (minx + 1, miny + 1, maxx - 1, maxy - 1)) == (2, 5, 2, 5)
+
+
+def test_tiles_are_cached_until_the_table_is_written(tmp_path):
+    db = FakeDatabase()
+    built = []
+
+    def builder(db, feature, grid, z, x, y):
+        built.append((feature, z, x, y))
+        return b"tile %d" % len(built)
+
+    cache = TileCache(db, FakeLayers(), cache_dir=str(tmp_path), check_interval=0, builder=builder)
+    tile = cache.get("lokalplan", 3, 2, 5)
+    assert cache.get("lokalplan", 3, 2, 5) == tile
+    assert cache.misses == 1 and cache.hits == 1
+
+    # A new cache on the same folder reads the tile from disk
+    disk_cache = TileCache(db, FakeLayers(), cache_dir=str(tmp_path), check_interval=0, builder=builder)
+    assert disk_cache.get("lokalplan", 3, 2, 5) == tile and disk_cache.disk_hits == 1
+
+    db.version = (2, 0, 0)
+    assert cache.get("lokalplan", 3, 2, 5).data == b"tile 2"
+    assert cache.get("unknown", 3, 2, 5) is None
+    with pytest.raises(ValueError):
+        cache.get("lokalplan", 3, 8, 0)
@@ -0,0 +1,43 @@
+import os
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from backend.db import Database
+from backend.layers import LayerCache
+from backend.generalise import ZoomBands
+
+# Same environment files as postgress_connector.py
+if os.path.exists("/var/www/skraafoto/.env"):
+    load_dotenv(dotenv_path="/var/www/skraafoto/.env")
+elif os.path.exists(".env.flask"):
+    load_dotenv(dotenv_path=".env.flask")
+else:
+    load_dotenv()
+
+parser = argparse.ArgumentParser(prog='refresh_zoom_bands',
+                                 description="Rebuilds the simplified zoom band views of plandata layers. "
+                                             "Run after loading plandata, and from cron for layers that are views")
+parser.add_argument("features", nargs="*", default=["all"], help="Layers to refresh, defaults to all")
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # One connection without the API's statement timeout, as refreshing a large layer takes a while
+    db = Database.from_env(min_connections=1, max_connections=1, statement_timeout_ms=0)
+    layers = LayerCache(db)
+    bands = ZoomBands(db)
+    features = sorted(layers.layer_names()) if "all" in args.features else args.features
+    try:
+        for feature in features:
+            if feature not in layers.layer_names():
+                raise SystemExit(f"Unknown layer {feature}")
+            bands.refresh(feature)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
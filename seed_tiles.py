@@ -0,0 +1,53 @@
+import os
+import time
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from backend.db import Database
+from backend.layers import LayerCache
+from backend.tiles import TileCache, TILE_GRIDS, DENMARK_BOUNDS
+
+# Same environment files as postgress_connector.py
+if os.path.exists("/var/www/skraafoto/.env"):
+    load_dotenv(dotenv_path="/var/www/skraafoto/.env")
+elif os.path.exists(".env.flask"):
+    load_dotenv(dotenv_path=".env.flask")
+else:
+    load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(prog='seed_tiles',
+                                 description="Renders vector tiles of plandata layers into the tile cache ahead of use")
+parser.add_argument("features", nargs="+", help="Layers to seed, or all")
+parser.add_argument("--min-zoom", type=int, default=0, help="First zoom level")
+parser.add_argument("--max-zoom", type=int, default=10, help="Last zoom level")
+parser.add_argument("--grid", choices=sorted(TILE_GRIDS), default="3857", help="Tile grid")
+parser.add_argument("--bbox", type=float, nargs=4, metavar=("MINX", "MINY", "MAXX", "MAXY"), default=DENMARK_BOUNDS,
+                    help="Area to seed in EPSG:25832, defaults to Denmark")
+parser.add_argument("--cache-dir", type=str, default=os.getenv("TILE_CACHE_DIR", os.path.join(BASE_DIR, "tile_cache")),
+                    help="Tile cache directory, defaults to TILE_CACHE_DIR")
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = Database.from_env()
+    layers = LayerCache(db)
+    tiles = TileCache(db, layers, cache_dir=args.cache_dir,
+                      disk_bytes=int(os.getenv("TILE_CACHE_DISK_MB", 1024)) << 20,
+                      ttl=int(os.getenv("TILE_TTL", 86400)))
+    features = sorted(layers.layer_names()) if "all" in args.features else args.features
+
+    start = time.time()
+    try:
+        count = tiles.seed(features, args.min_zoom, args.max_zoom, bounds=args.bbox, grid_name=args.grid)
+    finally:
+        db.close()
+    print(f"Seeded {count} tiles in {time.time() - start:.1f}s ({tiles.misses} rendered, {tiles.disk_hits} already cached)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import sys
+import os
+
+# Ensure your project directory is on sys.path
+sys.path.insert(0, '/var/www/skraafoto')
+
+from postgress_connector import app, metrics
+from backend.asgi import create_app
+from backend.async_db import AsyncDatabase
+from backend.plandata import AsyncPlandataLookup
+
+# Async serving mode, e.g. `uvicorn skraafoto_asgi:application --workers 2`.
+# Address lookups run on the event loop, every other route is served by the Flask app on
+# ASGI_WSGI_THREADS threads per worker
+async_db = AsyncDatabase.from_env()
+application = create_app(app, async_db,
+                         AsyncPlandataLookup(async_db, max_entries=int(os.getenv("PLANDATA_CACHE_SIZE", 1024)),
+                                             ttl=int(os.getenv("LAYER_TTL", 3600))),
+                         metrics=metrics, wsgi_threads=int(os.getenv("ASGI_WSGI_THREADS", 32)))
@@ -6,6 +6,10 @@ import OSM from "ol/source/OSM";
 import Overlay from "ol/Overlay";
 import VectorLayer from "ol/layer/Vector";
 import VectorSource from "ol/source/Vector";
+import VectorTileLayer from "ol/layer/VectorTile";
+import VectorTileSource from "ol/source/VectorTile";
+import MVT from "ol/format/MVT";
+import TileGrid from "ol/tilegrid/TileGrid";
 import { Circle as CircleStyle, Fill, Stroke, Style } from "ol/style";
 import GeoJSON from "ol/format/GeoJSON";
 import AddressSearch from "../components/AddressSearch.jsx";
@@ -15,12 +19,26 @@ import { configuration } from "../util/configuration.js";
 import loadingGif2 from "../assets/loading-loader-ezgif.com-effects.gif";
 import { set } from "ol/transform.js";
 
+// Danish tile grid served by /tiles/<feature>/<z>/<x>/<y>.mvt?grid=25832
+const tileGrid25832 = new TileGrid({
+  origin: [120000, 6500000],
+  extent: [120000, 6500000 - 6553.6 * 256, 120000 + 6553.6 * 256, 6500000],
+  resolutions: Array.from({ length: 19 }, (_, z) => 6553.6 / 2 ** z),
+  tileSize: 256,
+});
+
+const overlayStyle = new Style({
+  fill: new Fill({ color: "rgba(255, 255, 255, 0.5)" }),
+  stroke: new Stroke({ color: "#545C5D", width: 3 }),
+});
+
 function ZonePage() {
   const mapRef = useRef(null);
   const popupRef = useRef(null);
   const popupCloserRef = useRef(null);
   const [map, setMap] = useState(null);
   const [vectorLayer, setVectorLayer] = useState(null);
+  const [overlayLayer, setOverlayLayer] = useState(null);
   const [address, setAddress] = useState(null);
   const [selectedFeature, setSelectedFeature] = useState("");
   const [loading, setLoading] = useState(false);
@@ -30,16 +48,17 @@ function ZonePage() {
     const vectorSource = new VectorSource();
     const vectorLayer = new VectorLayer({
       source: vectorSource,
-      style: new Style({
-        fill: new Fill({ color: "rgba(255, 255, 255, 0.5)" }),
-        stroke: new Stroke({ color: "#545C5D", width: 3 }),
-      }),
+      style: overlayStyle,
     });
 
+    // The selected overlay is loaded as vector tiles, so only the visible part is fetched
+    const overlayLayer = new VectorTileLayer({ style: overlayStyle });
+
     const map = new Map({
       target: mapRef.current,
       layers: [
         new TileLayer({ source: new OSM() }),
+        overlayLayer,
         vectorLayer,
       ],
       view: new View({
@@ -57,6 +76,7 @@ function ZonePage() {
     map.addOverlay(popupOverlay);
     setMap(map);
     setVectorLayer(vectorLayer);
+    setOverlayLayer(overlayLayer);
 
     const handleMapClick = (evt) => {
       const clickedCoordinate = evt.coordinate;
@@ -194,50 +214,27 @@ function ZonePage() {
     }
   };
 
-  const toggleFeature = async () => {
+  const toggleFeature = () => {
+    if (!overlayLayer) {
+      return;
+    }
     if (!selectedFeature) {
       // If no feature is selected, clear the map
-      if (vectorLayer && vectorLayer.getSource()) {
-        vectorLayer.getSource().clear(); // Clear all features from the vector source
-        console.log("Map cleared because no feature was selected.");
-      }
-      return; // Exit early, no need to fetch any new features
+      overlayLayer.setSource(null);
+      return;
     }
 
-    try {
-      setLoading(true);
-      const response = await fetch(`${configuration.api_base_url}/api/toggle/${selectedFeature}`);
-      
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      
-      const geojson = await response.json();
-      
-      // Check if the response is valid GeoJSON
-      if (!geojson || !geojson.type) {
-        console.error("Invalid GeoJSON response:", geojson);
-        return;
-      }
-
-      const vectorSource = new VectorSource({
-        features: new GeoJSON().readFeatures(geojson, {
-          dataProjection: "EPSG:25832",
-          featureProjection: map.getView().getProjection(),
-        }),
-      });
-
-      vectorLayer.setSource(vectorSource);
-    } catch (error) {
-      console.error("Error toggling feature:", error);
-    } finally {
-      setLoading(false);
-    } 
+    overlayLayer.setSource(new VectorTileSource({
+      format: new MVT(),
+      projection: "EPSG:25832",
+      tileGrid: tileGrid25832,
+      url: `${configuration.api_base_url}/api/tiles/${selectedFeature}/{z}/{x}/{y}.mvt?grid=25832`,
+    }));
   };
 
   useEffect(() => {
     toggleFeature();
-  }, [selectedFeature]);
+  }, [selectedFeature, overlayLayer]);
 
   return (
     <div className="mapcenterpage">